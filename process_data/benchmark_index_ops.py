@@ -0,0 +1,119 @@
+if __name__ == '__main__' and __package__ is None:
+    from os import sys
+    sys.path.append('../')
+import argparse
+import time
+
+import torch
+from torch_geometric.nn.conv import MessagePassing
+
+from src.model.model_utils.network_util import Aggre_Index, Gen_Index
+from src.utils.op_utils import Gen_edge_descriptor
+
+
+def Parser():
+    parser = argparse.ArgumentParser(description='Time Gen_Index / Aggre_Index / Gen_edge_descriptor against the MessagePassing versions they replace.')
+    parser.add_argument('--scenes', type=int, default=8, help='scenes per batch')
+    parser.add_argument('--nodes', type=int, default=9, help='objects per scene, fully connected')
+    parser.add_argument('--dim', type=int, default=512, help='node / edge feature size')
+    parser.add_argument('--iters', type=int, default=200, help='timed calls per op')
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+    return parser
+
+
+# the previous implementations, through the MessagePassing internals
+class MPGen_Index(MessagePassing):
+    def __init__(self, flow="target_to_source"):
+        super().__init__(flow=flow)
+
+    def forward(self, x, edges_indices):
+        size = self._check_input(edges_indices, None)
+        coll_dict = self._collect(self._user_args, edges_indices, size, {"x": x})
+        msg_kwargs = self.inspector.collect_param_data('message', coll_dict)
+        return self.message(**msg_kwargs)
+
+    def message(self, x_i, x_j):
+        return x_i, x_j
+
+
+class MPAggre_Index(MessagePassing):
+    def __init__(self, aggr='add', node_dim=-2, flow="source_to_target"):
+        super().__init__(aggr=aggr, node_dim=node_dim, flow=flow)
+
+    def forward(self, x, edge_index, dim_size):
+        size = self._check_input(edge_index, None)
+        coll_dict = self._collect(self._user_args, edge_index, size, {})
+        coll_dict['dim_size'] = dim_size
+        aggr_kwargs = self.inspector.collect_param_data('aggregate', coll_dict)
+        return self.aggregate(x, **aggr_kwargs)
+
+
+class MPGen_edge_descriptor(MessagePassing):
+    def __init__(self, flow="source_to_target"):
+        super().__init__(flow=flow)
+
+    def forward(self, descriptor, edges_indices):
+        size = self._check_input(edges_indices, None)
+        coll_dict = self._collect(self._user_args, edges_indices, size, {"x": descriptor})
+        msg_kwargs = self.inspector.collect_param_data('message', coll_dict)
+        return self.message(**msg_kwargs)
+
+    def message(self, x_i, x_j):
+        return Gen_edge_descriptor.message(self, x_i, x_j)
+
+
+def fully_connected(scenes, nodes, device):
+    edges, offset = [], 0
+    for _ in range(scenes):
+        idx = torch.arange(nodes) + offset
+        edges.append(torch.cartesian_prod(idx, idx))
+        offset += nodes
+    edges = torch.cat(edges)
+    return edges[edges[:, 0] != edges[:, 1]].t().contiguous().to(device)
+
+
+def timeit(fn, iters, device):
+    for _ in range(10):
+        fn()
+    if device.startswith('cuda'):
+        torch.cuda.synchronize()
+    t0 = time.time()
+    for _ in range(iters):
+        fn()
+    if device.startswith('cuda'):
+        torch.cuda.synchronize()
+    return 1e6 * (time.time() - t0) / iters
+
+
+def main():
+    args = Parser().parse_args()
+    num_nodes = args.scenes * args.nodes
+    edge_index = fully_connected(args.scenes, args.nodes, args.device)
+    x = torch.rand(num_nodes, args.dim, device=args.device)
+    edge = torch.rand(edge_index.shape[1], args.dim, device=args.device)
+    descriptor = torch.rand(num_nodes, 11, device=args.device) + 0.1
+
+    gen, mp_gen = Gen_Index(flow='target_to_source'), MPGen_Index(flow='target_to_source')
+    aggr, mp_aggr = Aggre_Index(aggr='max', flow='target_to_source'), MPAggre_Index(aggr='max', flow='target_to_source')
+    script_gen, script_aggr = torch.jit.script(gen), torch.jit.script(aggr)
+    ops = [
+        ('Gen_Index', lambda: mp_gen(x, edge_index), lambda: gen(x, edge_index), lambda: script_gen(x, edge_index)),
+        ('Aggre_Index', lambda: mp_aggr(edge, edge_index, dim_size=num_nodes), lambda: aggr(edge, edge_index, dim_size=num_nodes),
+         lambda: script_aggr(edge, edge_index, dim_size=num_nodes)),
+        # built on every forward by the models
+        ('Gen_edge_descriptor', lambda: MPGen_edge_descriptor()(descriptor, edge_index),
+         lambda: Gen_edge_descriptor()(descriptor, edge_index), None),
+    ]
+    print('{} scenes x {} objects, {} edges, dim {}, {}'.format(args.scenes, args.nodes, edge_index.shape[1], args.dim, args.device))
+    print('{:<20}{:>18}{:>12}{:>12}'.format('op (us/call)', 'MessagePassing', 'direct', 'scripted'))
+    with torch.no_grad():
+        for name, mp_fn, fn, script_fn in ops:
+            ref, out = mp_fn(), fn()
+            ref, out = (ref, out) if isinstance(ref, tuple) else ((ref,), (out,))
+            assert all(torch.allclose(a, b) for a, b in zip(ref, out)), name
+            t_script = '{:12.1f}'.format(timeit(script_fn, args.iters, args.device)) if script_fn is not None else '{:>12}'.format('-')
+            print('{:<20}{:18.1f}{:12.1f}{}'.format(name, timeit(mp_fn, args.iters, args.device), timeit(fn, args.iters, args.device), t_script))
+
+
+if __name__ == '__main__':
+    main()
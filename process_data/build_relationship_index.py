@@ -0,0 +1,46 @@
+if __name__ == '__main__' and __package__ is None:
+    from os import sys
+    sys.path.append('../')
+import argparse
+import json
+import os
+
+from src.dataset.relationship_index import RelationshipIndex, get_index_file
+from src.dataset.scan_cache import get_cache_path
+from src.utils.config import Config
+
+RELATIONSHIP_FILES = ['relationships_train.json', 'relationships_validation.json',
+                      'relationships_rio27_train.json', 'relationships_rio27_validation.json']
+
+
+def Parser():
+    parser = argparse.ArgumentParser(description='Convert the relationships_*.json files into the compact index read by SSGDatasetWS when dataset.use_rel_index is true.')
+    parser.add_argument('--config', type=str, default='mmgnet.json', help='configuration file name')
+    return parser
+
+
+def build(config):
+    mconfig = config.dataset
+    cache_path = get_cache_path(mconfig)
+    os.makedirs(cache_path, exist_ok=True)
+    for name in RELATIONSHIP_FILES:
+        pth_json = os.path.join(mconfig.root, name)
+        if not os.path.exists(pth_json):
+            continue
+        with open(pth_json, "r") as read_file:
+            data = json.load(read_file)
+        index = RelationshipIndex.from_json(data)
+        pth_index = os.path.join(cache_path, get_index_file(pth_json))
+        index.save(pth_index)
+        print('{}: {} scans, {} objects, {} relationships -> {}'.format(
+            name, len(index), len(index.objects_all), len(index.relationships_all), pth_index))
+
+
+def main():
+    args = Parser().parse_args()
+    config = Config(os.path.abspath(args.config))
+    build(config)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+if __name__ == '__main__' and __package__ is None:
+    from os import sys
+    sys.path.append('../')
+import argparse
+import json
+import os
+
+import numpy as np
+from tqdm import tqdm
+
+from src.dataset.dataset_ws import load_mesh
+from src.dataset.scan_cache import (INDEX_FILE, INSTANCES_FILE, POINTS_FILE,
+                                    get_cache_path)
+from src.utils.config import Config
+from utils import define, util
+
+
+def Parser():
+    parser = argparse.ArgumentParser(description='Write the points, rgb, normals and instance ids of every scan into a memory-mapped cache read by SSGDatasetWS when dataset.load_cache is true.')
+    parser.add_argument('--config', type=str, default='mmgnet.json', help='configuration file name')
+    parser.add_argument('--overwrite', action='store_true', help='rebuild the cache even if it exists')
+    return parser
+
+
+def get_scan_list(mconfig):
+    pth_selection = mconfig.selection if mconfig.selection != "" else mconfig.root
+    if mconfig.use_rio27_dataset:
+        txt_files = ['train_rio27_scans.txt', 'validation_rio27_scans.txt']
+    else:
+        txt_files = ['train_scans.txt', 'validation_scans.txt']
+    scans = set()
+    for txt in txt_files:
+        scans = scans.union(util.read_txt_to_list(os.path.join(pth_selection, txt)))
+    return sorted(scans)
+
+
+def build(config, overwrite=False):
+    mconfig = config.dataset
+    use_rgb, use_normal = config.MODEL.USE_RGB, config.MODEL.USE_NORMAL
+    cache_path = get_cache_path(mconfig)
+    pth_index = os.path.join(cache_path, INDEX_FILE)
+    if os.path.exists(pth_index) and not overwrite:
+        print('scan cache already exists:', pth_index)
+        return
+    os.makedirs(cache_path, exist_ok=True)
+
+    dim_pts = 3 + 3 * int(use_rgb) + 3 * int(use_normal)
+    index = {'label_file': mconfig.label_file, 'use_rgb': use_rgb, 'use_normal': use_normal,
+             'dim_pts': dim_pts, 'num_points': 0, 'scans': dict()}
+
+    offset = 0
+    with open(os.path.join(cache_path, POINTS_FILE), 'wb') as f_points, \
+            open(os.path.join(cache_path, INSTANCES_FILE), 'wb') as f_instances:
+        for scan_id in tqdm(get_scan_list(mconfig)):
+            path = os.path.join(define.DATA_PATH, scan_id)
+            if not os.path.exists(os.path.join(path, mconfig.label_file)):
+                print('skip', scan_id, ': no', mconfig.label_file)
+                continue
+            data = load_mesh(path, mconfig.label_file, use_rgb, use_normal)
+            points = np.ascontiguousarray(data['points'], dtype=np.float32)
+            instances = np.ascontiguousarray(data['instances'], dtype=np.int16)
+            assert points.shape == (len(instances), dim_pts)
+            f_points.write(points.tobytes())
+            f_instances.write(instances.tobytes())
+            index['scans'][scan_id] = [offset, len(instances)]
+            offset += len(instances)
+    index['num_points'] = offset
+
+    # the index is written last, a broken run never leaves a usable but incomplete cache behind
+    with open(pth_index, 'w') as f:
+        json.dump(index, f)
+    print('cached {} scans ({} points) in {}'.format(len(index['scans']), offset, cache_path))
+
+
+def main():
+    args = Parser().parse_args()
+    config = Config(os.path.abspath(args.config))
+    build(config, args.overwrite)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+if __name__ == '__main__' and __package__ is None:
+    from os import sys
+    sys.path.append('../')
+import argparse
+import json
+import os
+
+import numpy as np
+from tqdm import tqdm
+
+from src.dataset.dataset_ws import dataset_loading_3RScan, dataset_loading_rio27
+from src.dataset.feature_store import FEATS_FILE, FEATS_INDEX_FILE
+from src.dataset.scan_cache import get_cache_path
+from src.utils.config import Config
+
+MULTI_VIEW_FILE = 'data/3RScan/{}/multi_view_no_fea_match_top5/instance_{}_croped_view_mean.npy'
+
+
+def Parser():
+    parser = argparse.ArgumentParser(description='Pack the per-instance multi-view CLIP features of a split into one fp16 array read by SSGDatasetWS when dataset.use_feats_store is true.')
+    parser.add_argument('--config', type=str, default='mmgnet.json', help='configuration file name')
+    parser.add_argument('--split', type=str, default='all', choices=['all', 'train_scans', 'validation_scans'])
+    return parser
+
+
+def get_instances(mconfig, split):
+    '''scan_id -> sorted instance ids of all the objects annotated in the selected scans'''
+    pth_selection = mconfig.selection if mconfig.selection != "" else mconfig.root
+    if mconfig.use_rio27_dataset:
+        _, _, data, selected_scans = dataset_loading_rio27(mconfig.root, pth_selection, split)
+    else:
+        _, _, data, selected_scans = dataset_loading_3RScan(mconfig.root, pth_selection, split)
+    data = data.select(np.isin(data.scans['scan'], list(selected_scans)))
+    instances = dict()
+    for i, scan_id in enumerate(data.scans['scan'].tolist()):
+        instances.setdefault(scan_id, set()).update(data.objects(i)['id'].tolist())
+    return {scan_id: sorted(ids) for scan_id, ids in instances.items()}
+
+
+def pack(config, split):
+    cache_path = get_cache_path(config.dataset)
+    os.makedirs(cache_path, exist_ok=True)
+
+    files, rows, missing = [], dict(), 0
+    for scan_id, instance_ids in get_instances(config.dataset, split).items():
+        for instance_id in instance_ids:
+            pth = os.path.join(config.multi_view_root, MULTI_VIEW_FILE.format(scan_id, instance_id))
+            if not os.path.exists(pth):
+                missing += 1
+                continue
+            rows.setdefault(scan_id, dict())[instance_id] = len(files)
+            files.append(pth)
+    if len(files) == 0:
+        raise RuntimeError('no multi-view feature found under', config.multi_view_root)
+
+    dim = np.load(files[0]).reshape(-1).shape[0]
+    feats = np.lib.format.open_memmap(os.path.join(cache_path, FEATS_FILE.format(split)), mode='w+',
+                                      dtype=np.float16, shape=(len(files), dim))
+    for i, pth in enumerate(tqdm(files)):
+        feats[i] = np.load(pth).reshape(-1)
+    feats.flush()
+    del feats
+
+    with open(os.path.join(cache_path, FEATS_INDEX_FILE.format(split)), 'w') as f:
+        json.dump({'dim': dim, 'rows': rows}, f)
+    print('{}: packed {} features ({} missing) into {}'.format(split, len(files), missing, cache_path))
+
+
+def main():
+    args = Parser().parse_args()
+    config = Config(os.path.abspath(args.config))
+    splits = ['train_scans', 'validation_scans'] if args.split == 'all' else [args.split]
+    for split in splits:
+        pack(config, split)
+
+
+if __name__ == '__main__':
+    main()
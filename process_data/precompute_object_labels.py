@@ -0,0 +1,78 @@
+if __name__ == '__main__' and __package__ is None:
+    from os import sys
+    sys.path.append('../')
+import argparse
+import os
+
+import torch
+from torch.utils.data import DataLoader
+from tqdm import tqdm
+
+from src.dataset.dataset_builder import build_dataset
+from src.dataset.object_label_store import ObjectLabelStore, get_object_label_mode, scene_hash
+from src.dataset.scan_cache import get_cache_path
+from src.model.model_utils.clip_text import ClipText
+from src.model.model_utils.object_label import MODES, match_object_labels
+from src.model.model_utils.text_embeddings import TextEmbeddings
+from src.utils.config import Config
+
+
+def Parser():
+    parser = argparse.ArgumentParser(description='Match the objects of every training scan split to its classes with CLIP, read by SSGDatasetWS when dataset.use_object_label_store is true.')
+    parser.add_argument('--config', type=str, default='mmgnet.json', help='configuration file name')
+    parser.add_argument('--mode', type=str, default='config', choices=['config', 'all'] + list(MODES),
+                        help='matching mode, "config" for the one selected by MODEL.use_hungarian / use_object_num')
+    return parser
+
+
+def first(batch):
+    return batch[0]
+
+
+@torch.no_grad()
+def precompute(config, modes):
+    config.dataset.use_object_label_store = False
+    dataset = build_dataset(config, split_type='train_scans', shuffle_objs=True,
+                            multi_rel_outputs=config.MODEL.multi_rel_outputs,
+                            use_rgb=config.MODEL.USE_RGB, use_normal=config.MODEL.USE_NORMAL, Type=config.dataset.type)
+    clip_model = ClipText("ViT-B/32", device=config.DEVICE)
+    text_embeddings = TextEmbeddings(clip_model, dataset.classNames, dataset.relationNames,
+                                     get_cache_path(config.dataset) if config.MODEL.use_text_embedding_file else None)
+    obj_text_clip_fea = text_embeddings.obj / text_embeddings.obj.norm(dim=1, keepdim=True)
+    logit_scale = text_embeddings.logit_scale.exp()
+
+    scans, hashes, labels = [], [], {mode: [] for mode in modes}
+    loader = DataLoader(dataset, batch_size=1, num_workers=config.WORKERS, collate_fn=first)
+    for item in tqdm(loader):
+        obj_2d_feats, index, obj_texts = item[1], item[6], item[9]
+        scans.append(str(dataset.scans[index]))
+        hashes.append(scene_hash(obj_2d_feats, obj_texts))
+
+        obj_2d_fea = obj_2d_feats.to(config.DEVICE).to(obj_text_clip_fea.dtype)  # fp16 on gpu, as the model matches them
+        obj_2d_fea = obj_2d_fea / obj_2d_fea.norm(dim=1, keepdim=True)
+        batch_ids = torch.zeros(len(obj_2d_fea), dtype=torch.long)
+        for mode in modes:
+            label = match_object_labels(mode, obj_2d_fea, batch_ids, [obj_texts], obj_text_clip_fea, logit_scale,
+                                        sinkhorn_iters=config.MODEL.sinkhorn_iters)
+            labels[mode].append(label.cpu().numpy())
+
+    cache_path = get_cache_path(config.dataset)
+    for mode in modes:
+        ObjectLabelStore.save(cache_path, 'train_scans', mode, dataset.classNames, scans, hashes, labels[mode])
+        print('{}: object pseudo labels of {} scan splits saved in {}'.format(mode, len(scans), cache_path))
+
+
+def main():
+    args = Parser().parse_args()
+    config = Config(os.path.abspath(args.config))
+    if args.mode == 'config':
+        modes = [get_object_label_mode(config.MODEL)]
+    elif args.mode == 'all':
+        modes = MODES
+    else:
+        modes = [args.mode]
+    precompute(config, modes)
+
+
+if __name__ == '__main__':
+    main()
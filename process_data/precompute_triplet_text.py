@@ -0,0 +1,56 @@
+if __name__ == '__main__' and __package__ is None:
+    from os import sys
+    sys.path.append('../')
+import argparse
+import os
+
+import numpy as np
+
+from src.dataset.dataset_ws import dataset_loading_3RScan, dataset_loading_rio27
+from src.dataset.scan_cache import get_cache_path
+from src.model.model_utils.clip_text import ClipText
+from src.model.model_utils.text_cache import TRIPLET_TEXT_FILE, TripletTextCache
+from src.utils.config import Config
+from src.utils import op_utils
+
+
+def Parser():
+    parser = argparse.ArgumentParser(description='Encode the triplet prompts of the training relationships with CLIP, read by Mmgnet when MODEL.use_triplet_text_cache is true.')
+    parser.add_argument('--config', type=str, default='mmgnet.json', help='configuration file name')
+    parser.add_argument('--device', type=str, default='cuda')
+    return parser
+
+
+def get_triplet_prompts(mconfig):
+    '''prompts of all (subject, relation, object) names annotated in the selected training scans'''
+    pth_selection = mconfig.selection if mconfig.selection != "" else mconfig.root
+    index_path = get_cache_path(mconfig) if mconfig.use_rel_index else None
+    if mconfig.use_rio27_dataset:
+        _, _, data, selected_scans = dataset_loading_rio27(mconfig.root, pth_selection, 'train_scans', index_path=index_path)
+    else:
+        _, _, data, selected_scans = dataset_loading_3RScan(mconfig.root, pth_selection, 'train_scans', index_path=index_path)
+    data = data.select(np.isin(data.scans['scan'], list(selected_scans)))
+
+    triplets = set()
+    for i in range(len(data)):
+        objects, relationships = data.objects(i), data.relationships(i)
+        instance2labelName = dict(zip(objects['id'].tolist(), data.obj_names[objects['cls']].tolist()))
+        for sub, obj, rel in zip(relationships['sub'].tolist(), relationships['obj'].tolist(), data.rel_names[relationships['rel']].tolist()):
+            if sub in instance2labelName and obj in instance2labelName:
+                triplets.add((instance2labelName[sub], rel, instance2labelName[obj]))
+    return [op_utils.tri_prompt(tri) for tri in sorted(triplets)]
+
+
+def main():
+    args = Parser().parse_args()
+    config = Config(os.path.abspath(args.config))
+    prompts = get_triplet_prompts(config.dataset)
+    clip_model = ClipText("ViT-B/32", device=args.device)
+    cache = TripletTextCache(os.path.join(get_cache_path(config.dataset), TRIPLET_TEXT_FILE), None, None, args.device)
+    num_cached = len(cache.prompts)
+    cache.add_prompts(prompts, clip_model.encode_text)
+    print('{} triplet prompts, {} encoded, saved in {}'.format(len(prompts), len(cache.prompts) - num_cached, cache.path))
+
+
+if __name__ == '__main__':
+    main()
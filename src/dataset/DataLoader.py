@@ -188,6 +188,7 @@ def collate_fn_ws(batch):
     batch_ids, scan_id, split_id = [], [], []
     obj_texts, tri_texts = [], []
     img_pair_info, img_pair_idx = [], []
+    obj_pseudo_labels = []
     
     count_obj = 0
     count_rel = 0
@@ -200,11 +201,12 @@ def collate_fn_ws(batch):
         descriptor.append(b[5])
         # get batchs location
         batch_ids.append(torch.full((b[0].shape[0], 1), i))
-        scan_id.append(np.full((b[0].shape[0], 1), b[6]))
-        split_id.append(np.full((b[0].shape[0], 1), b[7]))
+        scan_id.append(torch.full((b[0].shape[0], 1), b[6], dtype=torch.int64))
+        split_id.append(torch.full((b[0].shape[0], 1), b[7], dtype=torch.int64))
         origin_obj_point_list.append(b[8])
         obj_texts.append(b[9])
         tri_texts.append(b[10])
+        obj_pseudo_labels.append(b[13])
         if len(b[12]) != 0:
             img_pair_info.append(b[11])
             img_pair_idx.append(b[12] + count_rel)
@@ -216,11 +218,11 @@ def collate_fn_ws(batch):
     if len(img_pair_info) != 0:
         return torch.cat(obj_point_list, dim=0), torch.cat(obj_2d_feats, dim=0), torch.cat(obj_label_list, dim=0), \
             torch.cat(rel_label_list, dim=0), torch.cat(edge_indices, dim=0), torch.cat(descriptor, dim=0), torch.cat(batch_ids, dim=0),\
-            np.vstack(scan_id), np.vstack(split_id), origin_obj_point_list, obj_texts, tri_texts, torch.cat(img_pair_info, dim=0), torch.cat(img_pair_idx, dim=0)
+            torch.cat(scan_id, dim=0), torch.cat(split_id, dim=0), origin_obj_point_list, obj_texts, tri_texts, torch.cat(img_pair_info, dim=0), torch.cat(img_pair_idx, dim=0), torch.cat(obj_pseudo_labels, dim=0)
     else:
         return torch.cat(obj_point_list, dim=0), torch.cat(obj_2d_feats, dim=0), torch.cat(obj_label_list, dim=0), \
             torch.cat(rel_label_list, dim=0), torch.cat(edge_indices, dim=0), torch.cat(descriptor, dim=0), torch.cat(batch_ids, dim=0),\
-            np.vstack(scan_id), np.vstack(split_id), origin_obj_point_list, obj_texts, tri_texts, torch.tensor([]), torch.tensor([])
+            torch.cat(scan_id, dim=0), torch.cat(split_id, dim=0), origin_obj_point_list, obj_texts, tri_texts, torch.tensor([]), torch.tensor([]), torch.cat(obj_pseudo_labels, dim=0)
 
 
 
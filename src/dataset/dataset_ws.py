@@ -8,34 +8,37 @@ import torch
 import torch.utils.data as data
 import trimesh
 
-from process_data import compute_weight_occurrences
+from src.dataset.feature_store import FeatureStore
+from src.dataset.object_label_store import ObjectLabelStore, get_object_label_mode
+from src.dataset.relationship_index import load_relationship_index
+from src.dataset.scan_cache import ScanCache, ScanLRU, get_cache_path
 from src.utils import op_utils
 from utils import define, util, util_data, util_ply
 
+VALID_SCANS_FILE = 'valid_scans_{}.json'
 
-def dataset_loading_rio27(root:str, pth_selection:str,split:str,class_choice:list=None):
+
+def dataset_loading_rio27(root:str, pth_selection:str,split:str,class_choice:list=None,index_path:str=None):
     classNames = ['wall', 'floor', 'cabinet', 'bed', 'chair', 'sofa', 'table', 'door', 'window', 'counter', 
     'shelf', 'curtain', 'pillow', 'clothes', 'ceiling', 'fridge', 'tv', 'towel', 'plant', 'box', 'nightstand', 
     'toilet', 'sink', 'lamp', 'bathtub', 'object', 'blanket']
     relationNames = ['supported by', 'attached to', 'standing on', 'lying on', 'hanging on', 
                     'connected to', 'leaning against', 'part of', 'belonging to', 'build in',
                     'standing in', 'cover', 'lying in', 'hanging in', 'spatial proximity', 'close by']
-    # read relationship json
+    # read relationship json, or its precompiled index
     selected_scans=set()
     if split == 'train_scans' :
         selected_scans = selected_scans.union(util.read_txt_to_list(os.path.join(pth_selection,'train_rio27_scans.txt')))
-        with open(os.path.join(root, 'relationships_rio27_train.json'), "r") as read_file:
-            data = json.load(read_file)
+        data = load_relationship_index(os.path.join(root, 'relationships_rio27_train.json'), index_path)
     elif split == 'validation_scans':
         selected_scans = selected_scans.union(util.read_txt_to_list(os.path.join(pth_selection,'validation_rio27_scans.txt')))
-        with open(os.path.join(root, 'relationships_rio27_validation.json'), "r") as read_file:
-            data = json.load(read_file)
+        data = load_relationship_index(os.path.join(root, 'relationships_rio27_validation.json'), index_path)
     else:
         raise RuntimeError('unknown split type:',split)
     return  classNames, relationNames, data, selected_scans
 
 
-def dataset_loading_3RScan(root:str, pth_selection:str,split:str,class_choice:list=None):  
+def dataset_loading_3RScan(root:str, pth_selection:str,split:str,class_choice:list=None,index_path:str=None):  
     # read object class
     pth_catfile = os.path.join(pth_selection, 'classes.txt')
     classNames = util.read_txt_to_list(pth_catfile)
@@ -43,16 +46,14 @@ def dataset_loading_3RScan(root:str, pth_selection:str,split:str,class_choice:li
     pth_relationship = os.path.join(pth_selection, 'relationships.txt')
     util.check_file_exist(pth_relationship)
     relationNames = util.read_relationships(pth_relationship)
-    # read relationship json
+    # read relationship json, or its precompiled index
     selected_scans=set()
     if split == 'train_scans' :
         selected_scans = selected_scans.union(util.read_txt_to_list(os.path.join(pth_selection,'train_scans.txt')))
-        with open(os.path.join(root, 'relationships_train.json'), "r") as read_file:
-            data = json.load(read_file)
+        data = load_relationship_index(os.path.join(root, 'relationships_train.json'), index_path)
     elif split == 'validation_scans':
         selected_scans = selected_scans.union(util.read_txt_to_list(os.path.join(pth_selection,'validation_scans.txt')))
-        with open(os.path.join(root, 'relationships_validation.json'), "r") as read_file:
-            data = json.load(read_file)
+        data = load_relationship_index(os.path.join(root, 'relationships_validation.json'), index_path)
     else:
         raise RuntimeError('unknown split type:',split)
     return  classNames, relationNames, data, selected_scans
@@ -113,18 +114,20 @@ class SSGDatasetWS(data.Dataset):
         if self.mconfig.selection == "":
             self.mconfig.selection = self.root
         
+        # read the precompiled relationship index instead of parsing relationships_*.json
+        index_path = get_cache_path(self.mconfig) if self.mconfig.use_rel_index else None
         if self.mconfig.use_rio27_dataset:
             self.classNames, self.relationNames, data, selected_scans = \
-                dataset_loading_rio27(self.root, self.mconfig.selection, split)        
+                dataset_loading_rio27(self.root, self.mconfig.selection, split, index_path=index_path)
         else:
             self.classNames, self.relationNames, data, selected_scans = \
-                dataset_loading_3RScan(self.root, self.mconfig.selection, split)        
+                dataset_loading_3RScan(self.root, self.mconfig.selection, split, index_path=index_path)
         
         # for multi relation output, we just remove off 'None' relationship
         if multi_rel_outputs and not self.mconfig.use_rio27_dataset:
             self.relationNames.pop(0)
                 
-        wobjs, wrels, o_obj_cls, o_rel_cls = compute_weight_occurrences.compute(self.classNames, self.relationNames, data,selected_scans, False)
+        o_obj_cls, o_rel_cls = data.count_occurrences(self.classNames, self.relationNames, selected_scans)
         self.w_cls_obj = torch.from_numpy(np.array(o_obj_cls)).float()
         self.w_cls_rel = torch.from_numpy(np.array(o_rel_cls)).float()
         
@@ -155,10 +158,8 @@ class SSGDatasetWS(data.Dataset):
                 print('')
         print('')
         
-        # compile json file
-        self.relationship_json, self.objs_json, self.scans = self.read_relationship_json(data, selected_scans)  # self.objs_json 存储每一个split下object的索引和名称
-        print('num of data:',len(self.scans))
-        assert(len(self.scans)>0)
+        # select the scan splits of this split
+        self.rel_index, self.scans = self.read_relationship_index(data, selected_scans)
             
         self.dim_pts = 3
         if self.use_rgb:
@@ -166,6 +167,35 @@ class SSGDatasetWS(data.Dataset):
         if self.use_normal:
             self.dim_pts += 3
 
+        # read scans from the memory-mapped cache instead of parsing the ply files
+        self.scan_cache = None
+        if self.mconfig.load_cache:
+            self.scan_cache = ScanCache(get_cache_path(self.mconfig), self.mconfig.label_file, self.use_rgb, self.use_normal)
+
+        # keep the recently parsed meshes of this worker, all the splits of one scan share them
+        self.scan_lru = None
+        if self.scan_cache is None and self.mconfig.scan_lru_bytes:
+            self.scan_lru = ScanLRU(int(self.mconfig.scan_lru_bytes))
+
+        # read the 2D multi-view features from the packed per-split store instead of one .npy per object
+        self.feats_store = None
+        if self.mconfig.use_feats_store:
+            self.feats_store = FeatureStore(get_cache_path(self.mconfig), split, upcast=self.mconfig.feats_store_fp32)
+
+        # object pseudo labels computed offline, only used in training
+        self.object_labels = None
+        if self.mconfig.use_object_label_store and self.for_train:
+            self.object_labels = ObjectLabelStore(get_cache_path(self.mconfig), split, get_object_label_mode(self.config.MODEL), self.classNames)
+
+        # train only on the scan splits which have at least one relationship label
+        if self.for_train:
+            valid = self.get_valid_scans()
+            print('drop {} scan splits without relationship labels'.format(int((~valid).sum())))
+            self.rel_index = self.rel_index.select(valid)
+            self.scans = self.scans[valid]
+        print('num of data:',len(self.scans))
+        assert(len(self.scans)>0)
+
     def __getitem__(self, index):
         
         scan_id = self.scans[index]
@@ -173,35 +203,40 @@ class SSGDatasetWS(data.Dataset):
         # scan_id = "09582242-e2c2-2de1-942f-d1001cbff56b_1"
         
         scan_id_no_split, scan_split_idx = scan_id.rsplit('_',1)
-        map_instance2labelName = self.objs_json[scan_id]
-        path = os.path.join(self.root_3rscan, scan_id_no_split)
-        data = load_mesh(path, self.mconfig.label_file, self.use_rgb, self.use_normal)  # 读取points和instances
-        
+        instance2cls, rel_table = self.get_scan_annotation(index)
+        data = self.load_scan(scan_id_no_split)
         points = torch.from_numpy(data['points'])
-        instances = torch.from_numpy(data['instances'].astype(np.int16))
+        instances = torch.from_numpy(np.asarray(data['instances'], dtype=np.int16))
 
 
 
-        obj_points, obj_2d_feats, gt_rels, gt_class, edge_indices, descriptor, origin_obj_points, obj_texts, tri_texts, img_pair_info, img_pair_idx = \
+        obj_points, obj_2d_feats, gt_rels, gt_class, edge_indices, descriptor, origin_obj_points, obj_texts, tri_texts, img_pair_info, img_pair_idx, obj_pseudo_labels = \
             self.data_preparation(points, instances, self.mconfig.num_points, self.mconfig.num_points_union,
-                         for_train=self.for_train, instance2labelName=map_instance2labelName, 
-                         classNames=self.classNames,
-                         rel_json=self.relationship_json[scan_id], 
+                         for_train=self.for_train, instance2cls=instance2cls,
+                         rel_table=rel_table,
                          relationships=self.relationNames,
                          multi_rel_outputs=self.multi_rel_outputs,
                          padding=0.2,num_max_rel=self.max_edges,
                          shuffle_objs=self.shuffle_objs,
                          scene_id=scan_id_no_split,
+                         scan_split=scan_id,
                          use_2d_feats=self.use_2d_feats,
                          multi_view_root=self.config.multi_view_root)
         
+        # the scan is returned as its index in self.scans and its split number
+        return obj_points, obj_2d_feats, gt_class, gt_rels, edge_indices, descriptor, index, int(scan_split_idx), origin_obj_points, obj_texts, tri_texts, img_pair_info, img_pair_idx, obj_pseudo_labels
 
-        while gt_rels.sum()==0 and self.for_train:  # 如果当前的index无法正常获取到relation points，就再运行一遍
-            index = np.random.randint(self.__len__())
-            obj_points, obj_2d_feats, gt_class, gt_rels, edge_indices, descriptor, scan_id_no_split, scan_split_idx, origin_obj_points, obj_texts, tri_texts, img_pair_info, img_pair_idx = self.__getitem__(index)
-
-        return obj_points, obj_2d_feats, gt_class, gt_rels, edge_indices, descriptor, scan_id_no_split, scan_split_idx, origin_obj_points, obj_texts, tri_texts, img_pair_info, img_pair_idx
 
+    def load_scan(self, scan_id):
+        if self.scan_cache is not None:
+            return self.scan_cache.load(scan_id)
+        data = self.scan_lru.get(scan_id) if self.scan_lru is not None else None
+        if data is None:
+            path = os.path.join(self.root_3rscan, scan_id)
+            data = load_mesh(path, self.mconfig.label_file, self.use_rgb, self.use_normal)  # 读取points和instances
+            if self.scan_lru is not None:
+                self.scan_lru.put(scan_id, data)
+        return data
 
     def norm_tensor(self, points):
         assert points.ndim == 2
@@ -238,70 +273,121 @@ class SSGDatasetWS(data.Dataset):
     def __len__(self):
         return len(self.scans)
     
-    def read_relationship_json(self, data, selected_scans:list):
-        rel, objs, scans = dict(), dict(), []
-
-        for scan_i in data['scans']:
-            if scan_i["scan"] == 'fa79392f-7766-2d5c-869a-f5d6cfb62fc6':
-                if self.mconfig.label_file == "labels.instances.align.annotated.v2.ply":
-                    '''
-                    In the 3RScanV2, the segments on the semseg file and its ply file mismatch. 
-                    This causes error in loading data.
-                    To verify this, run check_seg.py
-                    '''
-                    continue
-            if scan_i['scan'] not in selected_scans:
-                continue
-                
-            relationships_i = []
-            for relationship in scan_i["relationships"]:
-                relationships_i.append(relationship)
-                
-            objects_i = {}
-            for id, name in scan_i["objects"].items():
-                objects_i[int(id)] = name
+    def read_relationship_index(self, data, selected_scans:list):
+        mask = np.isin(data.scans['scan'], list(selected_scans))
+        if self.mconfig.label_file == "labels.instances.align.annotated.v2.ply":
+            '''
+            In the 3RScanV2, the segments on the semseg file and its ply file mismatch. 
+            This causes error in loading data.
+            To verify this, run check_seg.py
+            '''
+            mask &= data.scans['scan'] != 'fa79392f-7766-2d5c-869a-f5d6cfb62fc6'
+        rel_index = data.select(mask)
+        # remap the ids of the index vocabularies to classNames / relationNames, -1 for unknown names
+        self.obj_vocab2idx = rel_index.name_lookup(self.classNames, rel_index.obj_names)
+        self.rel_vocab2idx = rel_index.name_lookup(self.relationNames, rel_index.rel_names)
+        return rel_index, rel_index.names()
 
-            rel[scan_i["scan"] + "_" + str(scan_i["split"])] = relationships_i
-            objs[scan_i["scan"]+"_"+str(scan_i['split'])] = objects_i
-            scans.append(scan_i["scan"] + "_" + str(scan_i["split"]))
+    def get_scan_annotation(self, index):
+        '''instance id -> class index and [subject id, object id, relation index] of every relationship'''
+        objects = self.rel_index.objects(index)
+        relationships = self.rel_index.relationships(index)
+        instance2cls = dict(zip(objects['id'].tolist(), self.obj_vocab2idx[objects['cls']].tolist()))
+        rel_table = np.stack([relationships['sub'], relationships['obj'], self.rel_vocab2idx[relationships['rel']]], axis=1).astype(np.int64)
+        return instance2cls, rel_table
 
-        return rel, objs, scans
-    
-    def data_preparation(self, points, instances, num_points, num_points_union, scene_id="",
+    def get_valid_scans(self):
+        '''
+        mask of the scan splits whose gt_rels is not empty. The result is cached in cache_path and
+        only the scan splits missing from the cache are checked, which loads their meshes once.
+        '''
+        pth_valid = os.path.join(get_cache_path(self.mconfig), VALID_SCANS_FILE.format(self.split))
+        meta = {'label_file': self.mconfig.label_file, 'multi_rel_outputs': bool(self.multi_rel_outputs),
+                'classNames': self.classNames, 'relationNames': self.relationNames,
+                'rel_index': self.rel_index.fingerprint()}
+        valid = dict()
+        if os.path.exists(pth_valid):
+            with open(pth_valid, 'r') as f:
+                cached = json.load(f)
+            if all(cached.get(k) == v for k, v in meta.items()):
+                valid = cached['valid']
+
+        scans = self.scans.tolist()
+        missing = [i for i, name in enumerate(scans) if name not in valid]
+        if len(missing) > 0:
+            print('check relationship labels of {} scan splits'.format(len(missing)))
+            instances = dict()
+            for i in missing:
+                scan_id = scans[i].rsplit('_', 1)[0]
+                if scan_id not in instances:
+                    if self.scan_cache is not None:
+                        data = self.scan_cache.load(scan_id)
+                    else:
+                        data = load_mesh(os.path.join(self.root_3rscan, scan_id), self.mconfig.label_file, self.use_rgb, self.use_normal)
+                    instances[scan_id] = set(np.unique(data['instances']).tolist())
+                valid[scans[i]] = self.has_gt_relations(i, instances[scan_id])
+            os.makedirs(os.path.dirname(pth_valid), exist_ok=True)
+            with open(pth_valid, 'w') as f:
+                json.dump(dict(meta, valid=valid), f)
+        return np.array([valid[name] for name in scans], dtype=bool)
+
+    def has_gt_relations(self, index, instance_ids):
+        '''whether data_preparation gives scan split index a non-empty gt_rels, instance_ids are the instances of the mesh'''
+        instance2cls, rel_table = self.get_scan_annotation(index)
+        nodes = set(instance2cls.keys()) & (instance_ids - {0})
+        gt = dict()
+        for sub, obj, rel in rel_table.tolist():
+            if sub in nodes and obj in nodes and sub != obj and rel >= 0:
+                gt[(sub, obj)] = rel  # later relationships of an edge overwrite the earlier ones, as in data_preparation
+        if self.multi_rel_outputs:
+            return len(gt) > 0
+        return any(rel > 0 for rel in gt.values())
+
+    def data_preparation(self, points, instances, num_points, num_points_union, scene_id="", scan_split="",
                      # use_rgb, use_normal,
-                     for_train=False, instance2labelName=None, classNames=None,
-                     rel_json=None, relationships=None, multi_rel_outputs=None,
+                     for_train=False, instance2cls=None,
+                     rel_table=None, relationships=None, multi_rel_outputs=None,
                      padding=0.2, num_max_rel=-1, shuffle_objs=True, all_edge=True, use_2d_feats=False, multi_view_root=None):
         #all_edge = for_train
-        # get instance list
-        all_instance = torch.unique(instances)  # 整个scene下的所有物体的索引集合
-        nodes_all = list(instance2labelName.keys())  # 获取该split下物体的索引集合
-
-        all_instance = all_instance[all_instance != 0]
-        # if 0 in all_instance: # remove background
-        #     all_instance.remove(0)
-
-        try:
-            obj_texts = np.array(list(instance2labelName.values()))
-            tri_texts = np.array([(instance2labelName[i[0]], i[3], instance2labelName[i[1]]) for i in rel_json])
-        except:
-            obj_texts = np.array(list(instance2labelName.values()))
-            tri_texts = np.array([(instance2labelName[i[0]], i[3], instance2labelName[i[1]]) for i in rel_json if i[0] in instance2labelName.keys() and i[1] in instance2labelName.keys()])
-            print(scene_id)
+        # group the points by instance in a single pass, the points of every object are then a contiguous slice of points_sorted
+        instances_np = instances.numpy()
+        order = np.argsort(instances_np, kind='stable')
+        instance_ids, starts, counts = np.unique(instances_np[order], return_index=True, return_counts=True)
+        points_sorted = points[torch.from_numpy(order)]
+        instance_slices = {int(k): (int(start), int(count)) for k, start, count in zip(instance_ids, starts, counts) if k != 0}  # 整个scene下的所有物体, 0是背景
+        nodes_all = list(instance2cls.keys())  # 获取该split下物体的索引集合
+
+        # class indices of the annotated objects and (subject class, relation index, object class) of the annotated relationships
+        obj_texts = torch.tensor(list(instance2cls.values()), dtype=torch.int64)
+        tri_texts = torch.tensor([(instance2cls[sub], rel, instance2cls[obj]) for sub, obj, rel in rel_table.tolist()
+                                  if sub in instance2cls and obj in instance2cls and rel >= 0], dtype=torch.int64).reshape(-1, 3)
 
         
-        nodes = [instance_id for instance_id in nodes_all if instance_id in all_instance]  # 节点索引列表
+        nodes = [instance_id for instance_id in nodes_all if instance_id in instance_slices]  # 节点索引列表
         # for instance_id in nodes_all:
         #     if instance_id in all_instance:
         #         nodes.append(instance_id)
         
-        # get edge (instance pair) list, which is just index, nodes[index] = instance_id
+        # map instance ids to node indices, then get edge (instance pair) list, which is just index, nodes[index] = instance_id
+        node_lookup = np.full(max(max(nodes, default=0), rel_table[:, :2].max(initial=0)) + 1, -1, dtype=np.int64)
+        node_lookup[nodes] = np.arange(len(nodes))
+        rel_sub, rel_obj = node_lookup[rel_table[:, 0]], node_lookup[rel_table[:, 1]]
+        rel_valid = (rel_sub >= 0) & (rel_obj >= 0)
+        rel_sub, rel_obj, rel_cls = rel_sub[rel_valid], rel_obj[rel_valid], rel_table[rel_valid, 2]
+        assert (rel_cls >= 0).all(), "invalid relation name"
         if all_edge:
-            edge_indices = list(product(list(range(len(nodes))), list(range(len(nodes)))))  # 构造list索引列表，product()用于构造笛卡尔积。[(0,1),(0,2),...,]
-            # filter out (i,i)
-            edge_indices = [i for i in edge_indices if i[0]!=i[1]]  # 把自己对自己删除
+            # product(range(n), range(n)) without (i, i), edge sub -> obj has the id sub * (n - 1) + obj - (obj > sub)
+            n = len(nodes)
+            edge_array = np.stack(np.divmod(np.arange(n * n, dtype=np.int64), n), axis=1)
+            edge_array = edge_array[edge_array[:, 0] != edge_array[:, 1]]
+            rel_self = rel_sub == rel_obj
+            rel_edge = (rel_sub * (n - 1) + rel_obj - (rel_obj > rel_sub))[~rel_self]
+            rel_cls = rel_cls[~rel_self]
         else:
-            edge_indices = [(nodes.index(r[0]), nodes.index(r[1])) for r in rel_json if r[0] in nodes and r[1] in nodes]
+            # one edge per annotated relationship, an edge takes the labels of all the relationships of its node pair
+            edge_array = np.stack([rel_sub, rel_obj], axis=1)
+            rel_edge, rel_row = np.nonzero((edge_array[:, None, 0] == rel_sub) & (edge_array[:, None, 1] == rel_obj))
+            rel_cls = rel_cls[rel_row]
         
         num_objects = len(nodes)
         dim_point = points.shape[-1]
@@ -314,17 +400,17 @@ class SSGDatasetWS(data.Dataset):
         obj_2d_feats = torch.zeros([num_objects, 512])  # 一般是[9,512]
         
         for i, instance_id in enumerate(nodes):
-            assert instance_id in all_instance, "invalid instance id"
-            # get node label name
-            instance_name = instance2labelName[instance_id]
-            label_node.append(classNames.index(instance_name))  # 在class.txt中的索引，是object的名字唯一索引
+            # get node label
+            label_node.append(instance2cls[instance_id])  # 在class.txt中的索引，是object的名字唯一索引
             # get node point
-            obj_pointset = points[torch.where(instances == instance_id)[0]]
-            origin_obj_points.append(obj_pointset)
+            start, count = instance_slices[instance_id]
+            obj_pointset = points_sorted[start:start + count]
+            if self.mconfig.return_origin_points:  # full resolution points, only used for result analysis
+                origin_obj_points.append(obj_pointset)
             min_box = torch.min(obj_pointset[:,:3], 0)[0] - padding
             max_box = torch.max(obj_pointset[:,:3], 0)[0] + padding
             instances_box[instance_id] = (min_box, max_box)  # 获取物体对应的bbox的左上角和右下角坐标
-            choice = torch.randint(0, len(obj_pointset), (num_points, ))  # 随机选择一组点
+            choice = torch.randint(0, count, (num_points, ))  # 随机选择一组点
             obj_pointset = obj_pointset[choice, :]
             descriptor[i] = op_utils.gen_descriptor(obj_pointset[:,:3])  # 生成点云的标准差，中心等函数
             obj_pointset = obj_pointset.to(torch.float32)
@@ -332,7 +418,7 @@ class SSGDatasetWS(data.Dataset):
             obj_points[i] = obj_pointset
 
             # obj_2d_feats特征
-            if multi_view_root is not None:  # TODO.这里可以根据instance中点的数量决定是用cropped feature 还是 origin feature
+            if multi_view_root is not None and self.feats_store is None:  # TODO.这里可以根据instance中点的数量决定是用cropped feature 还是 origin feature
                 obj_2d_feats[i] = torch.from_numpy(np.load(os.path.join(multi_view_root, f'data/3RScan/{scene_id}/multi_view_no_fea_match_top5/instance_{instance_id}_croped_view_mean.npy')))
                 # obj_2d_feats[i] = np.load(os.path.join(multi_view_root, f'data/3RScan/{scene_id}/multi_view/instance_{instance_id}_class_{instance_name}_origin_view_mean.npy'))
                 # if self.config.MODEL.use_object_pesudo_labels:
@@ -344,79 +430,38 @@ class SSGDatasetWS(data.Dataset):
                 # else:
                 #     obj_2d_feats[i] = np.load(os.path.join(multi_view_root, f'data/3RScan/{scene_id}/multi_view/instance_{instance_id}_class_{instance_name}_croped_view_mean.npy'))
         
-        # set gt label for relation
-        len_object = len(nodes)
-        if multi_rel_outputs:
-            adj_matrix_onehot = torch.zeros([len_object, len_object, len(relationships)])
-        else:
-            adj_matrix = torch.zeros([len_object, len_object]) #set all to none label.
-        
-        for r in rel_json:
-            if r[0] not in nodes or r[1] not in nodes: continue
-            assert r[3] in relationships, "invalid relation name"
-            r[2] = relationships.index(r[3]) # remap the index of relationships in case of custom relationNames
-            # 这里是relation在字典中的唯一索引
-
-            if multi_rel_outputs:
-                adj_matrix_onehot[nodes.index(r[0]), nodes.index(r[1]), r[2]] = 1
-            else:
-                adj_matrix[nodes.index(r[0]), nodes.index(r[1])] = r[2]
-        
-        # get relation union points
+        if multi_view_root is not None and self.feats_store is not None:
+            obj_2d_feats = self.feats_store.get(scene_id, nodes)
+
+        # object pseudo labels computed offline, -1 where they have to be matched online
+        obj_pseudo_labels = torch.zeros(0, dtype=torch.int64)
+        if self.object_labels is not None:
+            obj_pseudo_labels = self.object_labels.get(scan_split, obj_2d_feats, obj_texts)
+
+        # set gt label for relation, all relationships are scattered at once
         if multi_rel_outputs:
-            # adj_matrix_onehot = adj_matrix_onehot.to(torch.float32)  # [9, 9, 总体类别数量] 
-            gt_rels = torch.zeros(len(edge_indices), len(relationships), dtype = torch.float)
+            gt_rels = torch.zeros(len(edge_array), len(relationships), dtype = torch.float)
+            gt_rels[torch.from_numpy(rel_edge), torch.from_numpy(rel_cls)] = 1  # edge索引组获取one-hot的relation编码 (0,1)->(0,0,0,...,1,0,0)
         else:
-            adj_matrix = torch.from_numpy(np.array(adj_matrix, dtype=np.int64))
-            gt_rels = torch.zeros(len(edge_indices), dtype = torch.long)
+            gt_rels = np.zeros(len(edge_array), dtype=np.int64)
+            gt_rels[rel_edge] = rel_cls
+            gt_rels = torch.from_numpy(gt_rels)
         
         img_pair_info, img_pair_idx = [], []
-        for e in range(len(edge_indices)):  # 遍历边索引
-            edge = edge_indices[e]
-            index1 = edge[0]
-            index2 = edge[1]
-            instance1 = nodes[edge[0]]
-            instance2 = nodes[edge[1]]
-
-            # 读取img pair feature
-            if self.config.use_pair_info and self.split == "train_scans":
+        # 读取img pair feature
+        if self.config.use_pair_info and self.split == "train_scans":
+            for e, (index1, index2) in enumerate(edge_array.tolist()):  # 遍历边索引
+                instance1 = nodes[index1]
+                instance2 = nodes[index2]
                 if os.path.exists(os.path.join(multi_view_root, f'data/3RScan/{scene_id}/multi_view_pair/instance_{instance1}_and_{instance2}_pair_view_mean.npy')):
                     img_pair_info.append(np.load(os.path.join(multi_view_root, f'data/3RScan/{scene_id}/multi_view_pair_croped_blip/instance_{instance1}_and_{instance2}_pair_view_croped_mean.npy')))
                     img_pair_idx.append(e)
-
-            
-            if multi_rel_outputs:  # 这个判断条件的意思就是如果relation是一个多标签的
-                gt_rels[e,:] = adj_matrix_onehot[index1,index2,:]  # edge索引组获取one-hot的relation编码 (0,1)->(0,0,0,...,1,0,0)
-            else:
-                gt_rels[e] = adj_matrix[index1,index2]
-
-            # mask1 = (instances == instance1) * 1
-            # mask2 = (instances == instance2) * 2
-            # mask_ = (mask1 + mask2).unsqueeze(1)  # torch.unsqueeze()
-            # bbox1 = instances_box[instance1]  # 获取物体对应的bbox
-            # bbox2 = instances_box[instance2]
-            # min_box = torch.minimum(bbox1[0], bbox2[0])
-            # max_box = torch.maximum(bbox1[1], bbox2[1])
-            # filter_mask = (points[:,0] > min_box[0]) * (points[:,0] < max_box[0]) \
-            #             * (points[:,1] > min_box[1]) * (points[:,1] < max_box[1]) \
-            #             * (points[:,2] > min_box[2]) * (points[:,2] < max_box[2])
-            
-            # # add with context, to distingush the different object's points
-            # points4d = torch.cat([points, mask_], 1)
-
-            # pointset = points4d[torch.where(filter_mask > 0)[0], :]  # 过滤出两个bbox中的点
-            # choice = torch.randint(0, len(pointset), (num_points_union, ))
-            # pointset = pointset[choice, :]
-            # pointset = pointset.to(torch.float32)
-            # pointset[:,:3] = self.zero_mean(pointset[:,:3])
-            # rel_points.append(pointset)  # 
-        
         
         label_node = torch.tensor(label_node, dtype=torch.int64)
-        edge_indices = torch.tensor(edge_indices, dtype=torch.long)
+        edge_indices = torch.from_numpy(edge_array)
 
         if self.config.use_pair_info and img_pair_idx:
             img_pair_info = torch.vstack(img_pair_info)
             img_pair_idx = torch.tensor(img_pair_idx)
         
-        return obj_points, obj_2d_feats, gt_rels, label_node, edge_indices, descriptor, origin_obj_points, obj_texts, tri_texts, img_pair_info, img_pair_idx
+        return obj_points, obj_2d_feats, gt_rels, label_node, edge_indices, descriptor, origin_obj_points, obj_texts, tri_texts, img_pair_info, img_pair_idx, obj_pseudo_labels
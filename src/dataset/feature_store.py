@@ -0,0 +1,46 @@
+import json
+import os
+
+import numpy as np
+import torch
+
+FEATS_FILE = 'multi_view_feats_{}.npy'
+FEATS_INDEX_FILE = 'multi_view_feats_{}_index.json'
+
+
+class FeatureStore(object):
+    '''
+    Read-only access to the 2D multi-view CLIP features packed by process_data/pack_multi_view_feats.py.
+    The features of one split live in a single fp16 [num_instances, dim] array which is memory mapped,
+    the index maps scan_id -> {instance_id: row}.
+    '''
+    def __init__(self, cache_path, split, upcast=True):
+        pth_feats = os.path.join(cache_path, FEATS_FILE.format(split))
+        pth_index = os.path.join(cache_path, FEATS_INDEX_FILE.format(split))
+        if not os.path.exists(pth_index):
+            raise RuntimeError('Cannot find 2D feature store (', pth_index, '). Run process_data/pack_multi_view_feats.py first.')
+        with open(pth_index, 'r') as f:
+            index = json.load(f)
+        self.pth_feats = pth_feats
+        self.upcast = upcast
+        self.rows = {scan_id: {int(k): v for k, v in rows.items()} for scan_id, rows in index['rows'].items()}
+        self._feats = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_feats'] = None
+        return state
+
+    def get(self, scan_id, instance_ids):
+        '''features of the given instances of one scan, [len(instance_ids), dim]'''
+        if self._feats is None:
+            self._feats = np.load(self.pth_feats, mmap_mode='r')
+        rows = self.rows.get(scan_id, {})
+        try:
+            idx = [rows[int(i)] for i in instance_ids]
+        except KeyError as e:
+            raise RuntimeError('no 2D feature for instance', e.args[0], 'of scan', scan_id, 'in', self.pth_feats)
+        feats = torch.from_numpy(self._feats[np.asarray(idx, dtype=np.int64)])
+        if self.upcast:
+            feats = feats.float()
+        return feats
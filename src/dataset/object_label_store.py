@@ -0,0 +1,66 @@
+import hashlib
+import json
+import os
+import warnings
+
+import numpy as np
+import torch
+
+OBJECT_LABEL_FILE = 'object_pseudo_labels_{}_{}.npz'
+
+
+def get_object_label_mode(mconfig):
+    '''the object matching used by Mmgnet.forward for the MODEL config'''
+    if not mconfig.use_hungarian:
+        return 'argmax'
+    if mconfig.use_hungarian == 'sinkhorn':
+        return 'sinkhorn'
+    return 'hungarian' if mconfig.use_object_num else 'hungarian_plus'
+
+
+def scene_hash(obj_2d_feats, obj_texts):
+    '''hash of the inputs of the object matching of one scene: its fp16 2D features and class indices'''
+    h = hashlib.sha1(obj_2d_feats.half().numpy().tobytes())
+    h.update(obj_texts.numpy().astype(np.int64).tobytes())
+    return h.hexdigest()
+
+
+class ObjectLabelStore(object):
+    '''
+    Object pseudo labels of every scan split precomputed by process_data/precompute_object_labels.py
+    for one matching mode. Each scan split keeps the hash of the features and texts it was computed
+    from, get() warns and returns -1 labels for the scan splits whose inputs changed since, Mmgnet then
+    matches them online.
+    '''
+    def __init__(self, cache_path, split, mode, classNames):
+        pth = os.path.join(cache_path, OBJECT_LABEL_FILE.format(split, mode))
+        if not os.path.exists(pth):
+            raise RuntimeError('Cannot find object pseudo labels (', pth, '). Run process_data/precompute_object_labels.py first.')
+        data = np.load(pth)
+        meta = json.loads(str(data['meta']))
+        if meta['mode'] != mode or meta['classNames'] != list(classNames):
+            raise RuntimeError('object pseudo labels in', pth, 'were computed for another mode or class list, rerun process_data/precompute_object_labels.py')
+        self.rows = {name: i for i, name in enumerate(data['scans'].tolist())}
+        self.hashes = data['hashes']
+        self.offsets = data['offsets']
+        self.labels = data['labels']
+
+    def get(self, scan_split, obj_2d_feats, obj_texts):
+        '''labels of the objects in node order, -1 if the scan split is missing or outdated'''
+        i = self.rows.get(scan_split)
+        start, end = (self.offsets[i], self.offsets[i + 1]) if i is not None else (0, 0)
+        if i is None or end - start != len(obj_2d_feats) or self.hashes[i] != scene_hash(obj_2d_feats, obj_texts):
+            warnings.warn('object pseudo labels of {} are {}, matched online. Rerun process_data/precompute_object_labels.py'
+                          .format(scan_split, 'missing' if i is None else 'outdated'))
+            return torch.full((len(obj_2d_feats),), -1, dtype=torch.int64)
+        return torch.from_numpy(self.labels[start:end].astype(np.int64))
+
+    @staticmethod
+    def save(cache_path, split, mode, classNames, scans, hashes, labels):
+        '''scans, hashes: one per scan split; labels: one array per scan split, in node order'''
+        os.makedirs(cache_path, exist_ok=True)
+        meta = {'mode': mode, 'classNames': list(classNames)}
+        offsets = np.cumsum([0] + [len(l) for l in labels]).astype(np.int64)
+        np.savez(os.path.join(cache_path, OBJECT_LABEL_FILE.format(split, mode)),
+                 meta=np.array(json.dumps(meta)), scans=np.array(scans), hashes=np.array(hashes), offsets=offsets,
+                 labels=np.concatenate([np.zeros(0, dtype=np.int64)] + [np.asarray(l, dtype=np.int64) for l in labels]))
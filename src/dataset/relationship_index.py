@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+SCAN_DTYPE = np.dtype([('scan', 'U64'), ('split', np.int32)])
+OBJ_DTYPE = np.dtype([('id', np.int32), ('cls', np.int32)])
+REL_DTYPE = np.dtype([('sub', np.int32), ('obj', np.int32), ('rel', np.int32)])
+
+
+def get_index_file(json_file):
+    '''relationships_train.json -> relationships_train.npz'''
+    return os.path.splitext(os.path.basename(json_file))[0] + '.npz'
+
+
+def gather_ranges(starts, ends):
+    '''concatenation of arange(s, e) for every (s, e)'''
+    lens = ends - starts
+    if lens.sum() == 0:
+        return np.zeros(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.cumsum(lens) + lens, lens)
+    return offsets + np.arange(lens.sum())
+
+
+class RelationshipIndex(object):
+    '''
+    Compact form of a relationships_*.json file.
+    Scans, objects and relationships are numpy structured arrays, object classes and relation names
+    are integer ids into obj_names / rel_names. The objects and relationships of scan split i are
+    objects[obj_offsets[i]:obj_offsets[i+1]] and relationships[rel_offsets[i]:rel_offsets[i+1]], in
+    the order of the json file. Unlike the json dicts these arrays carry no per-item python objects,
+    so dataloader workers share them with the main process instead of slowly copying them.
+    '''
+    def __init__(self, scans, obj_offsets, objects, rel_offsets, relationships, obj_names, rel_names):
+        self.scans = scans
+        self.obj_offsets = obj_offsets
+        self.objects_all = objects
+        self.rel_offsets = rel_offsets
+        self.relationships_all = relationships
+        self.obj_names = obj_names
+        self.rel_names = rel_names
+
+    @classmethod
+    def from_json(cls, data):
+        obj_names = sorted({name for scan_i in data['scans'] for name in scan_i['objects'].values()})
+        rel_names = sorted({r[3] for scan_i in data['scans'] for r in scan_i['relationships']})
+        obj2idx = {name: i for i, name in enumerate(obj_names)}
+        rel2idx = {name: i for i, name in enumerate(rel_names)}
+
+        scans = np.array([(scan_i['scan'], scan_i['split']) for scan_i in data['scans']], dtype=SCAN_DTYPE)
+        objects = np.array([(int(k), obj2idx[v]) for scan_i in data['scans'] for k, v in scan_i['objects'].items()], dtype=OBJ_DTYPE)
+        relationships = np.array([(r[0], r[1], rel2idx[r[3]]) for scan_i in data['scans'] for r in scan_i['relationships']], dtype=REL_DTYPE)
+        obj_offsets = np.cumsum([0] + [len(scan_i['objects']) for scan_i in data['scans']]).astype(np.int64)
+        rel_offsets = np.cumsum([0] + [len(scan_i['relationships']) for scan_i in data['scans']]).astype(np.int64)
+        return cls(scans, obj_offsets, objects, rel_offsets, relationships, np.array(obj_names), np.array(rel_names))
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            raise RuntimeError('Cannot find relationship index (', path, '). Run process_data/build_relationship_index.py first.')
+        data = np.load(path)
+        return cls(data['scans'], data['obj_offsets'], data['objects'], data['rel_offsets'], data['relationships'],
+                   data['obj_names'], data['rel_names'])
+
+    def save(self, path):
+        np.savez(path, scans=self.scans, obj_offsets=self.obj_offsets, objects=self.objects_all,
+                 rel_offsets=self.rel_offsets, relationships=self.relationships_all,
+                 obj_names=self.obj_names, rel_names=self.rel_names)
+
+    def __len__(self):
+        return len(self.scans)
+
+    def fingerprint(self):
+        '''md5 of the scans, objects and relationships, to key the caches derived from this index'''
+        md5 = hashlib.md5()
+        for array in (self.scans, self.obj_offsets, self.objects_all, self.rel_offsets, self.relationships_all,
+                      self.obj_names, self.rel_names):
+            md5.update(np.ascontiguousarray(array).tobytes())
+        return md5.hexdigest()
+
+    def names(self):
+        '''"{scan}_{split}" of every scan split'''
+        return np.char.add(np.char.add(self.scans['scan'], '_'), self.scans['split'].astype(str))
+
+    def num_objects(self):
+        '''number of annotated objects of every scan split'''
+        return np.diff(self.obj_offsets)
+
+    def objects(self, i):
+        return self.objects_all[self.obj_offsets[i]:self.obj_offsets[i + 1]]
+
+    def relationships(self, i):
+        return self.relationships_all[self.rel_offsets[i]:self.rel_offsets[i + 1]]
+
+    def select(self, mask):
+        '''index restricted to the scan splits where mask is true'''
+        obj_idx = gather_ranges(self.obj_offsets[:-1][mask], self.obj_offsets[1:][mask])
+        rel_idx = gather_ranges(self.rel_offsets[:-1][mask], self.rel_offsets[1:][mask])
+        obj_offsets = np.concatenate([[0], np.cumsum(np.diff(self.obj_offsets)[mask])]).astype(np.int64)
+        rel_offsets = np.concatenate([[0], np.cumsum(np.diff(self.rel_offsets)[mask])]).astype(np.int64)
+        return RelationshipIndex(self.scans[mask], obj_offsets, self.objects_all[obj_idx], rel_offsets,
+                                 self.relationships_all[rel_idx], self.obj_names, self.rel_names)
+
+    def name_lookup(self, names, vocab):
+        '''map ids of the index vocabulary to positions in names, -1 if absent'''
+        name2idx = {name: i for i, name in enumerate(names)}
+        return np.array([name2idx.get(v, -1) for v in vocab.tolist()], dtype=np.int64)
+
+    def count_occurrences(self, classNames, relationNames, selections=None):
+        '''
+        Same counts as process_data.compute_weight_occurrences.compute: objects per class and
+        relationships per relation name whose subject and object are annotated in the scan split.
+        '''
+        index = self if selections is None else self.select(np.isin(self.scans['scan'], list(selections)))
+        obj_cls = index.name_lookup(classNames, index.obj_names)[index.objects_all['cls']]
+        if (obj_cls < 0).any():
+            raise RuntimeError('objects', set(index.obj_names[index.objects_all['cls'][obj_cls < 0]]), 'not in classNames')
+        o_obj_cls = np.bincount(obj_cls, minlength=len(classNames)).astype(np.float64)
+
+        rels = index.relationships_all
+        rel_cls = index.name_lookup(relationNames, index.rel_names)[rels['rel']]
+        known = rel_cls >= 0
+        if ((rels['sub'][known] == 0) | (rels['obj'][known] == 0)).any():
+            raise RuntimeError('found obj or sub is 0')
+        # relationships whose endpoints are objects of the same scan split
+        obj_scan = np.repeat(np.arange(len(index), dtype=np.int64), np.diff(index.obj_offsets))
+        rel_scan = np.repeat(np.arange(len(index), dtype=np.int64), np.diff(index.rel_offsets))
+        stride = int(max(index.objects_all['id'].max(initial=0), rels['sub'].max(initial=0), rels['obj'].max(initial=0))) + 1
+        obj_keys = obj_scan * stride + index.objects_all['id']
+        annotated = np.isin(rel_scan * stride + rels['sub'], obj_keys) & np.isin(rel_scan * stride + rels['obj'], obj_keys)
+        o_rel_cls = np.bincount(rel_cls[known & annotated], minlength=len(relationNames)).astype(np.float64)
+        return o_obj_cls, o_rel_cls
+
+
+def load_relationship_index(pth_json, index_path=None):
+    '''RelationshipIndex of a relationships json, read from its precompiled .npz in index_path if given'''
+    if index_path:
+        return RelationshipIndex.load(os.path.join(index_path, get_index_file(pth_json)))
+    with open(pth_json, "r") as read_file:
+        data = json.load(read_file)
+    return RelationshipIndex.from_json(data)
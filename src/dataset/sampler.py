@@ -0,0 +1,112 @@
+from collections import deque
+
+import numpy as np
+from torch.utils.data import Sampler
+
+
+def group_by_scan(scans):
+    '''"{scan}_{split}" entries -> list of index arrays, one per scan'''
+    scan_ids = np.array([s.rsplit('_', 1)[0] for s in scans])
+    _, inverse = np.unique(scan_ids, return_inverse=True)
+    order = np.argsort(inverse, kind='stable')
+    return np.split(order, np.cumsum(np.bincount(inverse))[:-1])
+
+
+class ScanAffinityBatchSampler(Sampler):
+    '''
+    Shuffled batches where all the splits of one scan are read by the same dataloader worker.
+    Scans are shuffled and dealt to the least loaded worker, each worker's samples are cut into
+    batches and the batches are interleaved round robin, the order in which the DataLoader hands
+    batches to its workers. The per-worker scan LRU of SSGDatasetWS then loads every mesh once.
+    The affinity is best-effort at the end of an epoch: the batches mixing the remainders of the
+    workers, and those moved to fill the slots of the workers with fewer batches, are dealt without it.
+    '''
+    def __init__(self, scans, batch_size, num_workers, shuffle=True, drop_last=False):
+        self.groups = group_by_scan(scans)
+        self.num_samples = len(scans)
+        self.batch_size = batch_size
+        self.num_workers = max(num_workers, 1)
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+
+    def __iter__(self):
+        groups = [np.random.permutation(g) for g in self.groups] if self.shuffle else self.groups
+        order = np.random.permutation(len(groups)) if self.shuffle else np.arange(len(groups))
+
+        streams, loads = [[] for _ in range(self.num_workers)], np.zeros(self.num_workers, dtype=np.int64)
+        for i in order:
+            w = int(np.argmin(loads))
+            streams[w].extend(groups[i].tolist())
+            loads[w] += len(groups[i])
+
+        worker_batches, leftover = [], []
+        for stream in streams:
+            n_full = len(stream) // self.batch_size * self.batch_size
+            worker_batches.append([stream[k:k + self.batch_size] for k in range(0, n_full, self.batch_size)])
+            leftover.extend(stream[n_full:])
+        leftover = [leftover[k:k + self.batch_size] for k in range(0, len(leftover), self.batch_size)]
+        if self.drop_last and len(leftover) > 0 and len(leftover[-1]) < self.batch_size:
+            leftover.pop()
+
+        # batch k goes to worker k % num_workers: the slot of a worker which ran out of batches is filled
+        # with a leftover batch, or else with the last batch of the longest stream, so that the later
+        # batches stay on their worker
+        worker_batches = [deque(batches) for batches in worker_batches]
+        leftover = deque(leftover)
+        while any(worker_batches) or leftover:
+            for batches in worker_batches:
+                if batches:
+                    yield batches.popleft()
+                elif leftover:
+                    yield leftover.popleft()
+                elif any(worker_batches):
+                    yield max(worker_batches, key=len).pop()
+
+    def __len__(self):
+        if self.drop_last:
+            return self.num_samples // self.batch_size
+        return (self.num_samples + self.batch_size - 1) // self.batch_size
+
+
+class EdgeBudgetBatchSampler(Sampler):
+    '''
+    Shuffled batches packed up to a total of max_edges edges and/or max_objects objects instead of
+    a fixed number of scan splits. A scan split with n objects has n*(n-1) edges, one larger than the
+    budget forms a batch of its own. The batches of the next epoch are planned ahead so that
+    __len__ is exact.
+    '''
+    def __init__(self, num_objects, max_edges=0, max_objects=0, shuffle=True):
+        if not max_edges and not max_objects:
+            raise RuntimeError('EdgeBudgetBatchSampler needs max_edges or max_objects')
+        self.num_objects = np.asarray(num_objects, dtype=np.int64)
+        self.num_edges = self.num_objects * (self.num_objects - 1)
+        self.max_edges = max_edges
+        self.max_objects = max_objects
+        self.shuffle = shuffle
+        self._batches = None
+
+    def plan(self):
+        order = np.random.permutation(len(self.num_objects)) if self.shuffle else np.arange(len(self.num_objects))
+        batches, batch, n_edges, n_objects = [], [], 0, 0
+        for i in order.tolist():
+            over_edges = self.max_edges and n_edges + self.num_edges[i] > self.max_edges
+            over_objects = self.max_objects and n_objects + self.num_objects[i] > self.max_objects
+            if len(batch) > 0 and (over_edges or over_objects):
+                batches.append(batch)
+                batch, n_edges, n_objects = [], 0, 0
+            batch.append(i)
+            n_edges += self.num_edges[i]
+            n_objects += self.num_objects[i]
+        if len(batch) > 0:
+            batches.append(batch)
+        return batches
+
+    def __iter__(self):
+        batches = self._batches if self._batches is not None else self.plan()
+        self._batches = None
+        return iter(batches)
+
+    def __len__(self):
+        if self._batches is None:
+            self._batches = self.plan()
+        return len(self._batches)
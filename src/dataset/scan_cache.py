@@ -0,0 +1,107 @@
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+INDEX_FILE = 'scan_cache_index.json'
+POINTS_FILE = 'scan_cache_points.bin'
+INSTANCES_FILE = 'scan_cache_instances.bin'
+
+
+def get_cache_path(mconfig):
+    '''the folder holding the preprocessed caches, <dataset.root>/cache if not given'''
+    if mconfig.cache_path:
+        return mconfig.cache_path
+    return os.path.join(mconfig.root, 'cache')
+
+
+class ScanCache(object):
+    '''
+    Read-only access to the scan cache written by process_data/build_scan_cache.py.
+    All scans are stored back to back in one float32 points file and one int16 instance file,
+    the index file keeps the [offset, count] of every scan. load() copies the scan out of the
+    memory map, so nothing is parsed when a scan is read and the arrays it returns are writable.
+    '''
+    def __init__(self, cache_path, label_file, use_rgb, use_normal):
+        pth_index = os.path.join(cache_path, INDEX_FILE)
+        if not os.path.exists(pth_index):
+            raise RuntimeError('Cannot find scan cache (', pth_index, '). Run process_data/build_scan_cache.py first.')
+        with open(pth_index, 'r') as f:
+            index = json.load(f)
+
+        if index['label_file'] != label_file:
+            raise RuntimeError('scan cache was built from', index['label_file'], 'but', label_file, 'is required')
+        if index['use_rgb'] != use_rgb or index['use_normal'] != use_normal:
+            raise RuntimeError('scan cache was built with use_rgb={} use_normal={}, rebuild it for use_rgb={} use_normal={}'.format(
+                index['use_rgb'], index['use_normal'], use_rgb, use_normal))
+
+        self.cache_path = cache_path
+        self.dim_pts = index['dim_pts']
+        self.num_points = index['num_points']
+        self.scans = index['scans']  # scan_id -> [offset, count]
+        self._points = None
+        self._instances = None
+
+    def _open(self):
+        # opened lazily so that every dataloader worker maps the files itself
+        self._points = np.memmap(os.path.join(self.cache_path, POINTS_FILE), dtype=np.float32, mode='r',
+                                 shape=(self.num_points, self.dim_pts))
+        self._instances = np.memmap(os.path.join(self.cache_path, INSTANCES_FILE), dtype=np.int16, mode='r',
+                                    shape=(self.num_points,))
+
+    def __contains__(self, scan_id):
+        return scan_id in self.scans
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_points'] = None
+        state['_instances'] = None
+        return state
+
+    def load(self, scan_id):
+        '''same output as dataset_ws.load_mesh'''
+        if scan_id not in self.scans:
+            raise RuntimeError('scan', scan_id, 'is not in the scan cache')
+        if self._points is None:
+            self._open()
+        offset, count = self.scans[scan_id]
+        result = dict()
+        result['points'] = np.array(self._points[offset:offset + count])
+        result['instances'] = np.array(self._instances[offset:offset + count])
+        return result
+
+
+class ScanLRU(object):
+    '''
+    Least recently used cache of decoded scans (the dicts returned by load_mesh), bounded by the
+    total bytes of their arrays. Every dataloader worker owns its copy of the dataset, so the cache
+    is per worker.
+    '''
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._scans = OrderedDict()
+
+    def get(self, scan_id):
+        data = self._scans.get(scan_id)
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._scans.move_to_end(scan_id)
+        return data
+
+    def put(self, scan_id, data):
+        nbytes = sum(v.nbytes for v in data.values())
+        if nbytes > self.max_bytes:
+            return
+        if scan_id in self._scans:
+            self.nbytes -= sum(v.nbytes for v in self._scans.pop(scan_id).values())
+        while self.nbytes + nbytes > self.max_bytes:
+            _, evicted = self._scans.popitem(last=False)
+            self.nbytes -= sum(v.nbytes for v in evicted.values())
+        self._scans[scan_id] = data
+        self.nbytes += nbytes
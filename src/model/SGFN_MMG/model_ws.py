@@ -1,17 +1,25 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import clip
 import numpy as np
 import torch
 import torch.nn.functional as F
 import torch.optim as optim
 from torch.optim.lr_scheduler import CosineAnnealingLR
-from itertools import product
 
 # from clip_adapter.model import AdapterModel
+from src.dataset.scan_cache import get_cache_path
+from src.model.model_utils.clip_text import ClipText
 from src.model.model_utils.model_base import BaseModel
 from src.model.model_utils.network_MMG import MMG_ws
 from src.model.model_utils.network_PointNet import (PointNetfeat,
                                                     PointNetRelCls,
                                                     PointNetRelClsMulti)
+from src.model.model_utils.object_label import match_object_labels
+from src.model.model_utils.rel_label_store import RelLabelStore
+from src.model.model_utils.text_cache import TRIPLET_TEXT_FILE, TripletTextCache
+from src.model.model_utils.text_embeddings import TextEmbeddings
 
 # from src.model.model_utils.model_pointnetpp import PointNetPP
 
@@ -19,7 +27,6 @@ from src.utils.eva_utils_acc import (evaluate_topk_object, evaluate_topk_object_
                                  evaluate_topk_predicate,
                                  evaluate_triplet_topk, get_gt)
 from utils import op_utils
-from scipy.optimize import linear_sum_assignment
 from src.utils.eval_utils_recall import evaluate_triplet_recallk, evaluate_triplet_mrecallk
 
 
@@ -76,13 +83,27 @@ class Mmgnet(BaseModel):
             torch.nn.Dropout(0.1)
         )
 
-        self.clip, preprocess = clip.load("ViT-B/32", device=self.config.DEVICE)  
+        # frozen CLIP text tower, not a submodule: kept out of the parameters and checkpoints, loaded on first use
+        self.clip = ClipText("ViT-B/32", device=self.config.DEVICE)
+
+        # embeddings of the class / relation prompts, read from the cache path without loading CLIP when precomputed
+        self.text_embeddings = TextEmbeddings(self.clip, classNames, relationNames,
+                                              get_cache_path(config.dataset) if mconfig.use_text_embedding_file else None)
+        self.obj_text_clip_fea = self.text_embeddings.obj / self.text_embeddings.obj.norm(dim=1, keepdim=True)
+
+        # CLIP embeddings of the triplet prompts, precomputed by process_data/precompute_triplet_text.py
+        self.triplet_text_cache = None
+        if mconfig.use_triplet_text_cache:
+            self.triplet_text_cache = TripletTextCache(os.path.join(get_cache_path(config.dataset), TRIPLET_TEXT_FILE),
+                                                       classNames, relationNames, self.config.DEVICE)
 
-        obj_text_input = op_utils.obj_prompt(classNames)
-        texts = clip.tokenize(obj_text_input).to(self.config.DEVICE)
-        self.obj_text_clip_fea = self.clip.encode_text(texts)
-        self.obj_text_clip_fea = self.obj_text_clip_fea / self.obj_text_clip_fea.norm(dim=1, keepdim=True)
+        # relation pseudo labels reused across the visits of a sample until they are refreshed
+        self.rel_label_store = None
+        if mconfig.use_rel_label_store:
+            self.rel_label_store = RelLabelStore(mconfig.rel_label_refresh_epochs or 0, mconfig.rel_label_drift_threshold or 0)
 
+        # threads running the per-scene assignments of the object pseudo labels
+        self.hungarian_pool = ThreadPoolExecutor(mconfig.hungarian_workers) if mconfig.hungarian_workers else None
 
         # Relationship Encoder
         self.rel_encoder_3d = PointNetfeat(
@@ -105,6 +126,8 @@ class Mmgnet(BaseModel):
             flow=self.flow,
             attention=self.mconfig.ATTENTION,
             use_edge=self.mconfig.USE_GCN_EDGE,
+            use_rel_self_attn=self.mconfig.use_rel_self_attn,
+            use_rel_obj_attn=self.mconfig.use_rel_obj_attn,
             DROP_OUT_ATTEN=self.mconfig.DROP_OUT_ATTEN)
 
         self.triplet_projector_3d = torch.nn.Sequential(
@@ -199,10 +222,6 @@ class Mmgnet(BaseModel):
         self.obj_predictor_3d.weight.data.copy_(obj_text_features)
         for param in self.obj_predictor_3d.parameters():
             param.requires_grad = True
-
-        # freeze clip adapter
-        for param in self.clip.parameters():
-            param.requires_grad = False
         
         self.obj_logit_scale.requires_grad = True
     
@@ -210,18 +229,9 @@ class Mmgnet(BaseModel):
         self.model_pre = new_model
     
     def get_label_weight(self):
-        self.clip_model, preprocess = clip.load("ViT-B/32", device=self.config.DEVICE)
-
-        for param in self.clip_model.parameters():
-            param.requires_grad = False
-        
         # get norm clip weight
-        obj_prompt = torch.cat([clip.tokenize(f"a photo of a {c}") for c in self.classNames]).cuda(self.config.DEVICE)
-        rel_prompt = torch.cat([clip.tokenize(f"{c}") for c in self.relationNames]).cuda(self.config.DEVICE)
-
-        with torch.no_grad():
-            obj_text_features = self.clip_model.encode_text(obj_prompt)
-            rel_text_features = self.clip_model.encode_text(rel_prompt)
+        obj_text_features = self.text_embeddings.obj
+        rel_text_features = self.text_embeddings.rel
         
         obj_text_features = obj_text_features / obj_text_features.norm(dim=-1, keepdim=True)
         rel_text_features = rel_text_features / rel_text_features.norm(dim=-1, keepdim=True)
@@ -253,281 +263,147 @@ class Mmgnet(BaseModel):
         return loss
 
 
-    def get_object_label_hungarain_plus(self, obj_2d_feature, obj_texts, batch_ids):
+    def match_object_labels(self, mode, obj_2d_feature, obj_texts, batch_ids):
         with torch.no_grad():
-            obj_label = []
-            batch_ids = batch_ids.squeeze(-1)
-            for i, obj_text in enumerate(obj_texts):
-                obj_text = np.unique(obj_text)
-                obj_text_idx = torch.tensor([self.classNames.index(i) for i in obj_text]).cuda(self.config.DEVICE)
-                
-                obj_text_feature = self.obj_text_clip_fea[obj_text_idx]
-                
-                obj_2d_fea = obj_2d_feature[batch_ids == i]
-                Num_2d = obj_2d_fea.shape[0]
-                obj_2d_fea = obj_2d_fea / obj_2d_fea.norm(dim=1, keepdim=True)
-
-                logit_scale = self.clip.logit_scale.exp()
-            
-                logits_per_text = logit_scale * obj_text_feature @ obj_2d_fea.t()
-                row_ind, col_ind = linear_sum_assignment(-logits_per_text.cpu())
-
-                f_indexs = torch.zeros(Num_2d, dtype = int).cuda(self.config.DEVICE)
-                f_indexs[col_ind] = obj_text_idx
-                
-                no_match_2d_idx = torch.tensor([i for i in range(Num_2d) if i not in col_ind]).cuda(self.config.DEVICE)
-                if no_match_2d_idx.shape[0] != 0:
-                    no_match_2d_fea = obj_2d_fea[no_match_2d_idx]
-                    
-                    logits_per_image = logit_scale * no_match_2d_fea @ obj_text_feature.t()
-                    col_ind = torch.max(logits_per_image, dim=1)[1]
-                    obj_indexs = obj_text_idx[col_ind]
-                    f_indexs[no_match_2d_idx] = obj_indexs
-
-                obj_label.append(f_indexs)
-        return torch.hstack(obj_label).cuda(self.config.DEVICE)
-
+            obj_2d_fea = obj_2d_feature / obj_2d_feature.norm(dim=1, keepdim=True)
+            return match_object_labels(mode, obj_2d_fea, batch_ids, obj_texts, self.obj_text_clip_fea,
+                                       self.text_embeddings.logit_scale.exp(), self.hungarian_pool, self.mconfig.sinkhorn_iters)
 
+    def get_object_label_hungarain_plus(self, obj_2d_feature, obj_texts, batch_ids):
+        return self.match_object_labels('hungarian_plus', obj_2d_feature, obj_texts, batch_ids)
 
     def get_object_label(self, obj_2d_feature, obj_texts, batch_ids):
-        with torch.no_grad():
-            obj_label = []
-            batch_ids = batch_ids.squeeze(-1)
-            for i, obj_text in enumerate(obj_texts):
-                obj_text = np.unique(obj_text)
-                obj_text_idx = torch.tensor([self.classNames.index(i) for i in obj_text]).cuda(self.config.DEVICE)
-                obj_text_feature = self.obj_text_clip_fea[obj_text_idx]
-                
-                obj_2d_fea = obj_2d_feature[batch_ids == i]
-                obj_2d_fea = obj_2d_fea / obj_2d_fea.norm(dim=1, keepdim=True)
-            
-                logits_per_image = self.clip.logit_scale.exp() * obj_2d_fea @ obj_text_feature.t()
-                row_ind, col_ind = linear_sum_assignment(-logits_per_image.cpu())
-                
-                obj_indexs = obj_text[col_ind]
-                f_indexs = torch.tensor([self.classNames.index(i) for i in obj_indexs])
-                obj_label.append(f_indexs)
-        return torch.hstack(obj_label).cuda(self.config.DEVICE)
-    
+        return self.match_object_labels('hungarian', obj_2d_feature, obj_texts, batch_ids)
 
     def get_object_label_wo_hungarain(self, obj_2d_feature, obj_texts, batch_ids):
-        with torch.no_grad():
-            obj_label = []
-            batch_ids = batch_ids.squeeze(-1)
-            for i, obj_text in enumerate(obj_texts):
-                obj_text = np.unique(obj_text)
-                obj_text_idx = torch.tensor([self.classNames.index(i) for i in obj_text]).cuda(self.config.DEVICE)
-                
-                obj_text_feature = self.obj_text_clip_fea[obj_text_idx]
-                
-                obj_2d_fea = obj_2d_feature[batch_ids == i]
-                obj_2d_fea = obj_2d_fea / obj_2d_fea.norm(dim=1, keepdim=True)
-            
-                logits_per_image = self.clip.logit_scale.exp() * obj_2d_fea @ obj_text_feature.t()
-                col_ind = torch.max(logits_per_image, dim=1)[1].cpu()
-                
-                obj_indexs = obj_text[col_ind]
-                f_indexs = torch.tensor([self.classNames.index(i) for i in obj_indexs])
-                obj_label.append(f_indexs)
-        return torch.hstack(obj_label).cuda(self.config.DEVICE)
-
-        
+        return self.match_object_labels('argmax', obj_2d_feature, obj_texts, batch_ids)
 
-    def get_best_match(self, tri_label, tri_token, sub_fea, obj_fea, rel_fea, edge_idx, edge_temp, temp_rel_lable, topk, descriptor, img_pair_info_temp):
-        def get_match(fea_0, fea_1):
-            fea_0 = fea_0 / fea_0.norm(dim=-1, keepdim=True)
-            fea_1 = fea_1 / fea_1.norm(dim=-1, keepdim=True)
-            logit_scale = self.clip.logit_scale.detach().clone().exp()
+    def tri_names(self, tri):
+        '''(subject class, relation, object class) indices -> names'''
+        return self.classNames[tri[0]], self.relationNames[tri[1]], self.classNames[tri[2]]
 
-            logits_per_fea_0 = logit_scale * fea_0 @ fea_1.t()
-            return torch.sigmoid(logits_per_fea_0).squeeze(0)
-        
-        with torch.no_grad():
-            tri_fea = self.clip.encode_text(tri_token)  # 文本特征
-            shape_weight = None
+    def encode_triplets(self, tris):
+        '''CLIP text embeddings of the triplet prompts, [len(tris), dim]'''
+        if self.triplet_text_cache is not None:
+            return self.triplet_text_cache.get(tris, self.clip.encode_text).type(self.clip.dtype)  # the file may come from a fp32 CLIP
+        tokens = clip.tokenize([op_utils.tri_prompt(self.tri_names(tri)) for tri in tris]).to(self.config.DEVICE)
+        return self.clip.encode_text(tokens)
 
-            if self.mconfig.use_shape_trick:
-                if tri_label[1] in ["bigger than", "smaller than", "higher than", "lower than"]:
-                    shape_weight = op_utils.shape_trick(tri_label, descriptor, edge_temp)
+    def match_relation_labels(self, tri_texts, batch_ids, obj_features, relation_fea=None, descriptor=None, img_pair_info=None, img_pair_idx=None, obj_label=None):
+        '''
+        Relation pseudo labels [E, num_rel] of a batch of fully connected scenes. All the triplets of the
+        batch are matched at once: the candidate edges of a triplet are the edges of its scene whose
+        subject / object have its classes in obj_label (all of them without obj_label), each triplet
+        labels as many candidates as it occurs in the scene, taken in ascending order of their scores
+        like the former per-triplet torch.sort. Candidates with equal scores are taken in edge order,
+        the former sort left the order of ties unspecified.
+        '''
+        device = obj_features.device
+        n = torch.bincount(batch_ids.view(-1).cpu(), minlength=len(tri_texts))
+        L = n * (n - 1)
+        node_off, edge_off = torch.cumsum(n, 0) - n, torch.cumsum(L, 0) - L
+        E, L_max, N_max = int(L.sum()), int(L.max()), int(n.max())
+        rel_label = torch.zeros(E, self.num_rel, device=device)
+
+        # the distinct triplets of every scene and how often they occur
+        groups = [torch.unique(t, dim=0, return_counts=True) if len(t) else (t.view(-1, 3), t.new_zeros(0)) for t in tri_texts]
+        g_size = torch.tensor([len(g[1]) for g in groups])
+        g_tri, g_num = torch.cat([g[0] for g in groups]), torch.cat([g[1] for g in groups])
+        if len(g_tri) == 0 or L_max == 0:
+            return rel_label
+        g_scene = torch.repeat_interleave(torch.arange(len(groups)), g_size)
+        g_local = torch.arange(len(g_tri)) - (torch.cumsum(g_size, 0) - g_size)[g_scene]
+        G_max, k_max = int(g_size.max()), min(int(g_num.max()), L_max)
+
+        # descriptor column and sign of the triplets weighted by shape_trick
+        shape = None
+        if self.mconfig.use_shape_trick:
+            shape = torch.tensor([op_utils.SHAPE_TRICK_RELATIONS.get(r, (-1, 0)) for r in self.relationNames])[g_tri[:, 1]]
+            has_shape = shape[:, 0] >= 0
+            shape, has_shape = (shape[has_shape].to(device), has_shape.to(device)) if has_shape.any() else (None, None)
+
+        g_tri, g_num, g_scene, g_local = g_tri.to(device), g_num.to(device), g_scene.to(device), g_local.to(device)
+        n, L, node_off, edge_off = n.to(device), L.to(device), node_off.to(device), edge_off.to(device)
+
+        # the edges of every scene padded to [B, L_max], in edge order
+        e = torch.arange(L_max, device=device).unsqueeze(0)
+        edge_valid = e < L.unsqueeze(1)
+        sub, obj = op_utils.edge_endpoints(e, n.unsqueeze(1))
+        sub, obj = sub.masked_fill(~edge_valid, 0), obj.masked_fill(~edge_valid, 0)
+        sub_node, obj_node = node_off.unsqueeze(1) + sub, node_off.unsqueeze(1) + obj
+
+        valid = edge_valid[g_scene]
+        if obj_label is not None:
+            obj_label = obj_label.to(device)
+            valid = valid & (obj_label[sub_node][g_scene] == g_tri[:, :1]) & (obj_label[obj_node][g_scene] == g_tri[:, 2:])
 
-            if rel_fea is None:
-                sub_logits = get_match(tri_fea, sub_fea.half())
-                obj_logits = get_match(tri_fea, obj_fea.half())
-                triplet_logits = torch.hstack([(sub_logits[0][i] + obj_logits[0][j]) / 2 for i, j in edge_temp])
+        with torch.no_grad():
+            tris, inverse = torch.unique(g_tri, dim=0, return_inverse=True)
+            tri_fea = self.encode_triplets(tris.tolist())[inverse]
+            tri_fea = tri_fea / tri_fea.norm(dim=-1, keepdim=True)
+            pad_tri = tri_fea.new_zeros(len(groups), G_max, tri_fea.shape[-1])
+            pad_tri[g_scene, g_local] = tri_fea
+            logit_scale = self.text_embeddings.logit_scale.exp()
+
+            if relation_fea is None:
+                # mean of the subject and object similarities
+                obj_fea = obj_features.half()
+                obj_fea = obj_fea / obj_fea.norm(dim=-1, keepdim=True)
+                scene = batch_ids.view(-1).to(device)
+                pad_obj = obj_fea.new_zeros(len(groups), N_max, obj_fea.shape[-1])
+                pad_obj[scene, torch.arange(len(scene), device=device) - node_off[scene]] = obj_fea
+                node_logits = torch.sigmoid(logit_scale * torch.bmm(pad_tri, pad_obj.transpose(1, 2)))[g_scene, g_local]
+                logits = (node_logits.gather(1, sub[g_scene]) + node_logits.gather(1, obj[g_scene])) / 2
             else:
-                triplet_fea = []
-                for i in range(len(edge_idx)):
-                    if self.mconfig.triplet_fea_get_way == "mean":
-                        t = (sub_fea[edge_temp[i][0]] + rel_fea[i] + obj_fea[edge_temp[i][1]]) / 3
-                    if self.mconfig.triplet_fea_get_way == "max":
-                        t = torch.max(torch.vstack([sub_fea[edge_temp[i][0]], rel_fea[i], obj_fea[edge_temp[i][1]]]), dim=0)[0]
-                    if self.mconfig.triplet_fea_get_way == "only_rel":
-                        t = rel_fea[i]
-                    if len(img_pair_info_temp)!= 0:
-                        if len(img_pair_info_temp[i]) != 0:
-                            t = img_pair_info_temp[i]  # Only extract the features of the pair of images.
-                            # t = (t + img_pair_info_temp[i]) / 2
-                    triplet_fea.append(t)
-                triplet_fea = torch.vstack(triplet_fea).half()
-                triplet_logits = get_match(tri_fea, triplet_fea).squeeze(0)
-
-            alpha = 1.0
-            
-            if shape_weight is not None:
-                triplet_logits = triplet_logits + alpha * shape_weight
-
-        tri_index = torch.sort(triplet_logits)[1]
-        for k, idx in enumerate(tri_index):
-            if k == topk:
-                break
-            i = edge_idx[idx]
-            temp_rel_lable[i][self.relationNames.index(tri_label[1])] = 1.0
+                sub_all, obj_all = sub_node[edge_valid], obj_node[edge_valid]
+                if self.mconfig.triplet_fea_get_way == "mean":
+                    triplet_fea = (obj_features[sub_all] + relation_fea + obj_features[obj_all]) / 3
+                elif self.mconfig.triplet_fea_get_way == "max":
+                    triplet_fea = torch.max(torch.stack([obj_features[sub_all], relation_fea, obj_features[obj_all]]), dim=0)[0]
+                elif self.mconfig.triplet_fea_get_way == "only_rel":
+                    triplet_fea = relation_fea
+                else:
+                    raise RuntimeError('unknown triplet_fea_get_way:', self.mconfig.triplet_fea_get_way)
+                if self.mconfig.use_pair_match and img_pair_idx is not None and len(img_pair_idx) != 0:
+                    # Only extract the features of the pair of images.
+                    triplet_fea = triplet_fea.index_copy(0, img_pair_idx.to(device).long(), img_pair_info.to(device).type(triplet_fea.dtype))
+                triplet_fea = triplet_fea.half()
+                triplet_fea = triplet_fea / triplet_fea.norm(dim=-1, keepdim=True)
+                pad_fea = triplet_fea.new_zeros(len(groups), L_max, triplet_fea.shape[-1])
+                pad_fea[edge_valid] = triplet_fea
+                logits = torch.sigmoid(logit_scale * torch.bmm(pad_tri, pad_fea.transpose(1, 2)))[g_scene, g_local]
+            logits = logits.float()
+
+            if shape is not None:
+                col = shape[:, :1].unsqueeze(1).expand(-1, L_max, 1)
+                metric = descriptor[sub_node[g_scene[has_shape]]].gather(2, col) - descriptor[obj_node[g_scene[has_shape]]].gather(2, col)
+                logits[has_shape] += op_utils.shape_trick_padded(shape[:, 1:] * metric.squeeze(2), valid[has_shape])
+
+        # every triplet labels its first candidates in ascending order of the scores, ties in edge order
+        k = torch.minimum(g_num, valid.sum(dim=1))
+        logits = torch.nan_to_num(logits, nan=1e30).masked_fill(~valid, float('inf'))
+        idx = torch.sort(logits, dim=1, stable=True)[1][:, :k_max]
+        sel = torch.arange(k_max, device=device).unsqueeze(0) < k.unsqueeze(1)
+        rel_label[(edge_off[g_scene].unsqueeze(1) + idx)[sel], g_tri[:, 1:2].expand_as(idx)[sel]] = 1.0
+        return rel_label
 
-        return temp_rel_lable
-    
-    
     def get_rel_label(self, obj_label, tri_texts, batch_ids, obj_features, relation_fea = None, descriptor = None, img_pair_info=None, img_pair_idx=None, edge_indices_all=None):
         """Match and confirm the features of the relation using the features of the triplet text and the three-dimensional features of the subject and object."""
-        def change_array_to_dict(tri_texts):
-            tri_dict = {}
-            for key in tri_texts:
-                k = tuple(key)
-                if k not in tri_dict.keys():
-                    tri_dict[k] = 1
-                else:
-                    tri_dict[k] += 1
-            return tri_dict
-        
-        split_batch_ids = [sum(batch_ids == i) for i in batch_ids.unique()]
-        
-        rel_label_list = []
-
-        edge_init_idx = 0
-        for i in range(len(tri_texts)):
-            idx = (batch_ids == i).squeeze(-1)
-            obj_feature_temp = obj_features[idx]
-            
-            descriptor_temp = descriptor[idx]
-            obj_label_i = obj_label[idx]
-            
-            edge_indices = list(product(list(range(split_batch_ids[i])), list(range(split_batch_ids[i]))))
-            edge_indices = [k for k in edge_indices if k[0]!=k[1]]
-            L = len(edge_indices)
-
-            if relation_fea is not None:
-                rel_feature_temp = relation_fea[edge_init_idx : edge_init_idx + L]
-
-            temp_rel_lable = [torch.zeros(self.num_rel).cuda(self.config.DEVICE) for _ in range(L)]
-            
-            tri_dict = change_array_to_dict(tri_texts[i])
-
-            for tri, num in tri_dict.items():
-                sub_idx = self.classNames.index(tri[0])
-                obj_idx = self.classNames.index(tri[2])
-                
-                sub_fea_idx = torch.where(obj_label_i == sub_idx)[0]
-                obj_fea_idx = torch.where(obj_label_i == obj_idx)[0]
-
-                if len(sub_fea_idx) == 0 or len(obj_fea_idx) == 0:  
-                    continue
-
-                if len(sub_fea_idx) == len(obj_fea_idx) == 1:
-                    if tri[0] != tri[2]:
-                        temp_rel_lable[edge_indices.index((int(sub_fea_idx[0]), int(obj_fea_idx[0])))][self.relationNames.index(tri[1])] = 1.0
-                else:
-                    edge_sub_obj = list(product(list(sub_fea_idx), list(obj_fea_idx)))
-                    edge_sub_obj = [i for i in edge_sub_obj if i[0] != i[1]]
-                    edge_idx = [edge_indices.index(i) for i in edge_sub_obj]
-                    
-                    quan_edge_idx = [t_i + edge_init_idx for t_i in edge_idx]
-                    if self.mconfig.use_pair_match:
-                        img_pair_info_temp = [img_pair_info[img_pair_idx == t_idx].squeeze(0) for t_idx in quan_edge_idx]
-                    else:
-                        img_pair_info_temp = []
-
-                    edge_temp = list(product(list(range(len(sub_fea_idx))), list(range(len(obj_fea_idx)))))
-                    if tri[0] == tri[2]:
-                        edge_temp = [i for i in edge_temp if i[0]!=i[1]]
-
-                    tri_token = clip.tokenize(op_utils.tri_prompt(tri)).to(self.config.DEVICE)
-                    
-                    sub_fea = obj_feature_temp[sub_fea_idx]
-                    obj_fea = obj_feature_temp[obj_fea_idx]
-
-                    descriptor_list = [descriptor_temp[sub_fea_idx], descriptor_temp[obj_fea_idx]]
-
-                    if relation_fea is not None:
-                        rel_fea = rel_feature_temp[edge_idx]
-                    else:
-                        rel_fea = None
-
-                    temp_rel_lable = self.get_best_match(tri, tri_token, sub_fea, obj_fea, rel_fea, edge_idx, edge_temp, temp_rel_lable, num, descriptor_list, img_pair_info_temp)
-
-            rel_label_list += temp_rel_lable
-            edge_init_idx += L
-        
-        rel_label_list = torch.vstack(rel_label_list).cuda(self.config.DEVICE)
-
-        return rel_label_list
+        return self.match_relation_labels(tri_texts, batch_ids, obj_features, relation_fea, descriptor, img_pair_info, img_pair_idx, obj_label=obj_label)
     
     
     def get_rel_label_no_mask(self, tri_texts, batch_ids, obj_features, relation_fea = None, distance_weight = None, descriptor = None, img_pair_info=None, img_pair_idx=None):
         """Match and confirm the features of the relation using the features of the triplet text and the three-dimensional features of the subject and object."""
-        def change_array_to_dict(tri_texts):
-            tri_dict = {}
-            for key in tri_texts:
-                k = tuple(key)
-                if k not in tri_dict.keys():
-                    tri_dict[k] = 1
-                else:
-                    tri_dict[k] += 1
-            return tri_dict
-        
-        split_batch_ids = [sum(batch_ids == i) for i in batch_ids.unique()]
-        rel_label_list = []
-        edge_init_idx = 0
-        for i in range(len(tri_texts)):
-            idx = (batch_ids == i).squeeze(-1)
-            obj_feature_temp = obj_features[idx]
-            
-            descriptor_temp = descriptor[idx]
-            
-            edge_indices = list(product(list(range(split_batch_ids[i])), list(range(split_batch_ids[i]))))
-            edge_indices = [i for i in edge_indices if i[0]!=i[1]]
-            L = len(edge_indices)
-
-            if relation_fea is not None:
-                rel_feature_temp = relation_fea[edge_init_idx : edge_init_idx + L]
-
-            temp_rel_lable = [torch.zeros(self.num_rel).cuda(self.config.DEVICE) for _ in range(L)]
-            
-            tri_dict = change_array_to_dict(tri_texts[i])
-
-            edge_idx = [edge_indices.index(i) for i in edge_indices]
-
-            if self.mconfig.use_pair_match:
-                quan_edge_idx = [t_i + edge_init_idx for t_i in edge_idx]
-                img_pair_info_temp = [img_pair_info[img_pair_idx == t_idx].squeeze(0) for t_idx in quan_edge_idx]
-            else:
-                img_pair_info_temp = []
-
-
-            sub_fea = obj_feature_temp
-            obj_fea = obj_feature_temp
-            descriptor_list = [descriptor_temp, descriptor_temp]
-
-            if relation_fea is not None:
-                rel_fea = rel_feature_temp[edge_idx]
-            else:
-                rel_fea = None
-
-            for tri, num in tri_dict.items():
-                tri_token = clip.tokenize(op_utils.tri_prompt(tri)).to(self.config.DEVICE)
-                temp_rel_lable = self.get_best_match(tri, tri_token, sub_fea, obj_fea, rel_fea, edge_idx, edge_indices, temp_rel_lable, num, descriptor_list, img_pair_info_temp)
-            
-            rel_label_list += temp_rel_lable
-            edge_init_idx += L
-        return torch.vstack(rel_label_list).cuda(self.config.DEVICE)
+        return self.match_relation_labels(tri_texts, batch_ids, obj_features, relation_fea, descriptor, img_pair_info, img_pair_idx)
+
+    def get_rel_label_stored(self, sample_ids, obj_label, tri_texts, batch_ids, obj_features, relation_fea=None, descriptor=None, img_pair_info=None, img_pair_idx=None, edge_indices=None):
+        '''get_rel_label / get_rel_label_no_mask through the relation label store, only the stale samples are matched'''
+        n = torch.bincount(batch_ids.view(-1).cpu(), minlength=len(tri_texts))
+        # the drift is measured on the features the labels are matched from
+        edge_fea = relation_fea if relation_fea is not None else obj_features[edge_indices[0]] + obj_features[edge_indices[1]]
+        obj_label = obj_label if self.mconfig.use_mask_filter else None
+        match_fn = lambda tris: self.match_relation_labels(tris, batch_ids, obj_features, relation_fea, descriptor, img_pair_info, img_pair_idx, obj_label=obj_label)
+        return self.rel_label_store.match(match_fn, sample_ids, self.epoch, tri_texts, edge_fea, (n * (n - 1)).tolist())
                     
 
     def get_tri_predict_and_label(self, tri_list):
@@ -537,11 +413,11 @@ class Mmgnet(BaseModel):
         for tris in tri_list:
             tri_label = torch.zeros((len(tris), self.num_class + self.num_rel))
             tri_tokens = []
-            for idx, i in enumerate(tris):
-                tri_tokens.append(op_utils.tri_prompt(i))
-                tri_label[idx][self.classNames.index(i[0])] = 1.0
-                tri_label[idx][self.classNames.index(i[2])] = 1.0
-                tri_label[idx][self.num_class + self.relationNames.index(i[1])] = 1.0
+            for idx, i in enumerate(tris.tolist()):
+                tri_tokens.append(op_utils.tri_prompt(self.tri_names(i)))
+                tri_label[idx][i[0]] = 1.0
+                tri_label[idx][i[2]] = 1.0
+                tri_label[idx][self.num_class + i[1]] = 1.0
                            
             tri_tokens = clip.tokenize(tri_tokens).to(self.config.DEVICE)
             tri_fea = self.clip.encode_text(tri_tokens)
@@ -559,7 +435,12 @@ class Mmgnet(BaseModel):
         return return_fea
 
 
-    def forward(self, obj_points, obj_2d_feats, edge_indices, descriptor, batch_ids, gt_obj_labels, obj_texts = None, tri_texts = None, img_pair_info=None, img_pair_idx=None, istrain=False):
+    def match_rel_labels(self, obj_points, obj_2d_feats, edge_indices, descriptor, batch_ids, gt_obj_labels, obj_texts, tri_texts, img_pair_info=None, img_pair_idx=None, obj_pseudo_labels=None, sample_ids=None):
+        '''relation pseudo labels of a training batch as forward(istrain=True) matches them, used by the async label worker'''
+        return self(obj_points, obj_2d_feats, edge_indices.t().contiguous(), descriptor, batch_ids, gt_obj_labels, obj_texts, tri_texts,
+                    img_pair_info=img_pair_info, img_pair_idx=img_pair_idx, istrain=True, obj_pseudo_labels=obj_pseudo_labels, sample_ids=sample_ids)[6]
+
+    def forward(self, obj_points, obj_2d_feats, edge_indices, descriptor, batch_ids, gt_obj_labels, obj_texts = None, tri_texts = None, img_pair_info=None, img_pair_idx=None, istrain=False, obj_pseudo_labels=None, rel_pseudo_labels=None, sample_ids=None):
         
         obj_feature = self.obj_3d_encoder(obj_points)
         
@@ -594,7 +475,11 @@ class Mmgnet(BaseModel):
             rel_3d_persudo_label = None
             
             if self.mconfig.use_object_pesudo_labels:
-                if self.mconfig.use_hungarian:
+                if obj_pseudo_labels is not None:
+                    obj_3d_persudo_label = obj_pseudo_labels  # precomputed by process_data/precompute_object_labels.py
+                elif self.mconfig.use_hungarian == "sinkhorn":
+                    obj_3d_persudo_label = self.match_object_labels('sinkhorn', obj_2d_feats.detach().clone().half(), obj_texts, batch_ids)
+                elif self.mconfig.use_hungarian:
                     if self.mconfig.use_object_num:
                         obj_3d_persudo_label = self.get_object_label(obj_2d_feats.detach().clone().half(), obj_texts, batch_ids)
                     else:
@@ -609,7 +494,12 @@ class Mmgnet(BaseModel):
                 t_rel = None
 
             if self.mconfig.use_relation_pesudo_labels:
-                if self.mconfig.use_mask_filter:
+                if rel_pseudo_labels is not None:
+                    rel_3d_persudo_label = rel_pseudo_labels  # matched by the async label worker
+                elif self.rel_label_store is not None and sample_ids is not None:
+                    rel_3d_persudo_label = self.get_rel_label_stored(sample_ids, obj_3d_persudo_label, tri_texts, batch_ids, gcn_obj_feature_3d.detach().clone(),
+                                                                     t_rel, descriptor=descriptor, img_pair_info=img_pair_info, img_pair_idx=img_pair_idx, edge_indices=edge_indices)
+                elif self.mconfig.use_mask_filter:
                     rel_3d_persudo_label = self.get_rel_label(obj_3d_persudo_label, tri_texts, batch_ids, gcn_obj_feature_3d.detach().clone(),
                                                             t_rel, descriptor = descriptor, img_pair_info=img_pair_info, img_pair_idx=img_pair_idx, edge_indices_all=edge_indices)
                 else:
@@ -633,10 +523,10 @@ class Mmgnet(BaseModel):
 
 
     
-    def process_train(self, obj_points, obj_2d_feats, descriptor, edge_indices, batch_ids, obj_texts, tri_texts, gt_rel_cls, gt_class, with_log=False, ignore_none_rel=False, weights_obj=None, weights_rel=None, img_pair_info=None, img_pair_idx=None):
+    def process_train(self, obj_points, obj_2d_feats, descriptor, edge_indices, batch_ids, obj_texts, tri_texts, gt_rel_cls, gt_class, with_log=False, ignore_none_rel=False, weights_obj=None, weights_rel=None, img_pair_info=None, img_pair_idx=None, obj_pseudo_labels=None, rel_pseudo_labels=None, sample_ids=None):
         self.iteration +=1   
 
-        obj_logits_3d, rel_cls_3d, obj_feature_3d, obj_feature_2d, obj_logit_scale, obj_persudo_label, rel_persudo_label, visual_rel_feature_3d = self(obj_points, obj_2d_feats, edge_indices.t().contiguous(), descriptor, batch_ids, gt_class, obj_texts, tri_texts, img_pair_info=img_pair_info, img_pair_idx=img_pair_idx, istrain=True)  
+        obj_logits_3d, rel_cls_3d, obj_feature_3d, obj_feature_2d, obj_logit_scale, obj_persudo_label, rel_persudo_label, visual_rel_feature_3d = self(obj_points, obj_2d_feats, edge_indices.t().contiguous(), descriptor, batch_ids, gt_class, obj_texts, tri_texts, img_pair_info=img_pair_info, img_pair_idx=img_pair_idx, istrain=True, obj_pseudo_labels=obj_pseudo_labels, rel_pseudo_labels=rel_pseudo_labels, sample_ids=sample_ids)  
         
         if self.mconfig.use_relation_pesudo_labels:
             pass
@@ -742,6 +632,8 @@ class Mmgnet(BaseModel):
     
         log.append(("train/logit_scale", obj_logit_scale.detach().item()))
         log.append(("train/loss", loss.detach().item()))
+        if self.rel_label_store is not None:
+            log += self.rel_label_store.logs()
         return log
 
 
@@ -78,7 +78,7 @@ class MMGNet():
     
     @torch.no_grad()
     def data_processing_val(self, items):
-        obj_points, obj_2d_feats, gt_class, gt_rel_cls, edge_indices, descriptor, batch_ids, scan_id, split_id, origin_obj_points, _, _, _, _ = items 
+        obj_points, obj_2d_feats, gt_class, gt_rel_cls, edge_indices, descriptor, batch_ids, scan_id, split_id, origin_obj_points, _, _, _, _, _ = items 
         obj_points = obj_points.permute(0,2,1).contiguous()
         obj_points, obj_2d_feats, gt_class, gt_rel_cls, edge_indices, descriptor, batch_ids = \
             self.cuda(obj_points, obj_2d_feats, gt_class, gt_rel_cls, edge_indices, descriptor, batch_ids)
@@ -10,7 +10,9 @@ from torch.utils.tensorboard import SummaryWriter
 
 from src.dataset.DataLoader import (CustomDataLoader, collate_fn_mmg, collate_fn_ws)
 from src.dataset.dataset_builder import build_dataset
+from src.dataset.sampler import EdgeBudgetBatchSampler, ScanAffinityBatchSampler
 from src.model.SGFN_MMG.model_ws import Mmgnet
+from src.model.model_utils.async_labels import AsyncRelLabeler
 from src.utils import op_utils
 from src.utils.eva_utils_acc import get_mean_recall, get_zero_shot_recall, get_head_body_tail
 from src.utils.eval_utils_recall import handle_mean_recall
@@ -56,12 +58,21 @@ class MMGNet():
         self.num_rel_class = num_rel_class
         
         if config.MODE  == 'train' or config.MODE  == 'trace':
-            self.total = self.config.total = len(self.dataset_train) // self.config.Batch_Size
-            self.max_iteration = self.config.max_iteration = int(float(self.config.MAX_EPOCHES)*len(self.dataset_train) // self.config.Batch_Size)
-            self.max_iteration_scheduler = self.config.max_iteration_scheduler = int(float(100)*len(self.dataset_train) // self.config.Batch_Size)
+            self.train_batch_sampler = self.build_train_batch_sampler()
+            if isinstance(self.train_batch_sampler, EdgeBudgetBatchSampler):
+                # the number of batches depends on the budget, take the one of the first epoch
+                num_batches = len(self.train_batch_sampler)
+                self.total = self.config.total = num_batches
+                self.max_iteration = self.config.max_iteration = int(float(self.config.MAX_EPOCHES)*num_batches)
+                self.max_iteration_scheduler = self.config.max_iteration_scheduler = int(float(100)*num_batches)
+            else:
+                self.total = self.config.total = len(self.dataset_train) // self.config.Batch_Size
+                self.max_iteration = self.config.max_iteration = int(float(self.config.MAX_EPOCHES)*len(self.dataset_train) // self.config.Batch_Size)
+                self.max_iteration_scheduler = self.config.max_iteration_scheduler = int(float(100)*len(self.dataset_train) // self.config.Batch_Size)
         
         ''' Build Model '''
         self.model = Mmgnet(self.config, self.dataset_valid.classNames, self.dataset_valid.relationNames).to(config.DEVICE)
+        self.rel_labeler = None
 
 
         self.samples_path = os.path.join(config.PATH, self.model_name, self.exp,  'samples')
@@ -79,32 +90,88 @@ class MMGNet():
         
     @torch.no_grad()
     def data_processing_train(self, items):
-        obj_points, obj_2d_feats, gt_class, gt_rel_cls, edge_indices, descriptor, batch_ids, scan_id, split_id, origin_obj_points, obj_texts, tri_texts, img_pair_info, img_pair_idx = items 
+        obj_points, obj_2d_feats, gt_class, gt_rel_cls, edge_indices, descriptor, batch_ids, scan_id, split_id, origin_obj_points, obj_texts, tri_texts, img_pair_info, img_pair_idx, obj_pseudo_labels = items 
+        # dataset index of every scene of the batch, the key of the relation label store
+        num_objs = torch.bincount(batch_ids.view(-1))
+        sample_ids = scan_id.view(-1)[torch.cumsum(num_objs, 0) - num_objs].tolist()
         obj_points = obj_points.permute(0,2,1).contiguous()
         obj_points, obj_2d_feats, edge_indices, descriptor, batch_ids, img_pair_info, img_pair_idx, gt_class, gt_rel_cls = \
             self.cuda(obj_points, obj_2d_feats, edge_indices, descriptor, batch_ids, img_pair_info, img_pair_idx, gt_class, gt_rel_cls)
-        return obj_points, obj_2d_feats, edge_indices, descriptor, batch_ids, obj_texts, tri_texts, gt_rel_cls, gt_class, img_pair_info, img_pair_idx
+        obj_2d_feats = obj_2d_feats.float()  # the feature store may ship fp16
+        # use the offline object pseudo labels only if every object of the batch has one
+        if len(obj_pseudo_labels) != len(obj_points) or (obj_pseudo_labels < 0).any():
+            obj_pseudo_labels = None
+        else:
+            obj_pseudo_labels = obj_pseudo_labels.to(self.config.DEVICE)
+        if not self.config.use_pair_info:
+            img_pair_info, img_pair_idx = None, None
+        return obj_points, obj_2d_feats, edge_indices, descriptor, batch_ids, obj_texts, tri_texts, gt_rel_cls, gt_class, img_pair_info, img_pair_idx, obj_pseudo_labels, sample_ids
     
     @torch.no_grad()
     def data_processing_val(self, items):
-        obj_points, obj_2d_feats, gt_class, gt_rel_cls, edge_indices, descriptor, batch_ids, scan_id, split_id, origin_obj_points, _, _, _, _ = items 
+        obj_points, obj_2d_feats, gt_class, gt_rel_cls, edge_indices, descriptor, batch_ids, scan_id, split_id, origin_obj_points, _, _, _, _, _ = items 
         obj_points = obj_points.permute(0,2,1).contiguous()
         obj_points, obj_2d_feats, gt_class, gt_rel_cls, edge_indices, descriptor, batch_ids = \
             self.cuda(obj_points, obj_2d_feats, gt_class, gt_rel_cls, edge_indices, descriptor, batch_ids)
+        obj_2d_feats = obj_2d_feats.float()
         return obj_points, obj_2d_feats, gt_class, gt_rel_cls, edge_indices, descriptor, batch_ids, scan_id, split_id, origin_obj_points
           
+    def build_train_batch_sampler(self):
+        ''' batches of at most Batch_Max_Edges edges / Batch_Max_Objects objects, or scan-affine batches of Batch_Size '''
+        if self.config.Batch_Max_Edges or self.config.Batch_Max_Objects:
+            if self.config.dataset.scan_affinity:
+                raise RuntimeError('dataset.scan_affinity cannot be combined with Batch_Max_Edges (', self.config.Batch_Max_Edges,
+                                   ') / Batch_Max_Objects (', self.config.Batch_Max_Objects, ')')
+            return EdgeBudgetBatchSampler(self.dataset_train.rel_index.num_objects(),
+                                          max_edges=self.config.Batch_Max_Edges, max_objects=self.config.Batch_Max_Objects, shuffle=True)
+        if self.config.dataset.scan_affinity:
+            # keep all the splits of a scan on one worker so that its scan LRU loads the mesh once
+            return ScanAffinityBatchSampler(self.dataset_train.scans, self.config.Batch_Size, self.config.WORKERS,
+                                            shuffle=True, drop_last=True)
+        return None
+
+    def train_batches(self, loader):
+        '''
+        processed training batches and their async label job (None without MODEL.async_rel_labels).
+        The job of the next batch is submitted before the current batch is handed out, so the label
+        worker matches it during the current training step.
+        '''
+        pending = None
+        for items in loader:
+            batch = self.data_processing_train(items)
+            if self.rel_labeler is None:
+                yield batch, None
+                continue
+            obj_points, obj_2d_feats, edge_indices, descriptor, batch_ids, obj_texts, tri_texts, gt_rel_cls, gt_class, img_pair_info, img_pair_idx, obj_pseudo_labels, sample_ids = batch
+            job = self.rel_labeler.submit(self.model.epoch, obj_points, obj_2d_feats, edge_indices, descriptor, batch_ids, gt_class, obj_texts, tri_texts,
+                                          img_pair_info=img_pair_info, img_pair_idx=img_pair_idx, obj_pseudo_labels=obj_pseudo_labels, sample_ids=sample_ids)
+            if pending is not None:
+                yield pending
+            pending = batch, job
+        if pending is not None:
+            yield pending
+
     def train(self):
         ''' create data loader '''
         drop_last = True
-        train_loader = CustomDataLoader(
-            config = self.config,
-            dataset=self.dataset_train,
-            batch_size=self.config.Batch_Size,
-            num_workers=self.config.WORKERS,
-            drop_last=drop_last,
-            shuffle=True,
-            collate_fn=collate_fn_ws,
-        )
+        if self.train_batch_sampler is not None:
+            train_loader = CustomDataLoader(
+                config = self.config,
+                dataset=self.dataset_train,
+                batch_sampler=self.train_batch_sampler,
+                num_workers=self.config.WORKERS,
+                collate_fn=collate_fn_ws,
+            )
+        else:
+            train_loader = CustomDataLoader(
+                config = self.config,
+                dataset=self.dataset_train,
+                batch_size=self.config.Batch_Size,
+                num_workers=self.config.WORKERS,
+                drop_last=drop_last,
+                shuffle=True,
+                collate_fn=collate_fn_ws,
+            )
         
         self.model.epoch = 1
         keep_training = True
@@ -120,6 +187,10 @@ class MMGNet():
                    
         if self.mconfig.use_pretrain != "":
             self.model.load_pretrain_model(self.mconfig.use_pretrain, is_freeze=True)
+
+        if self.mconfig.async_rel_labels and self.mconfig.use_relation_pesudo_labels:
+            # match the relation pseudo labels on a snapshot of the model in the background
+            self.rel_labeler = AsyncRelLabeler(self.model, self.mconfig.rel_label_snapshot_interval)
         
         for k, p in self.model.named_parameters():
             if p.requires_grad:
@@ -136,13 +207,15 @@ class MMGNet():
             num_obj_text_unique_1 = 0
             num_all_obj_text = 0
             
-            for items in loader:
+            for batch, job in self.train_batches(loader):
                 self.model.train()
                 
                 ''' get data '''
-                obj_points, obj_2d_feats, edge_indices, descriptor, batch_ids, obj_texts, tri_texts, gt_rel_cls, gt_class, img_pair_info, img_pair_idx = self.data_processing_train(items)
-                if not self.config.use_pair_info:
-                    img_pair_info, img_pair_idx = None, None
+                obj_points, obj_2d_feats, edge_indices, descriptor, batch_ids, obj_texts, tri_texts, gt_rel_cls, gt_class, img_pair_info, img_pair_idx, obj_pseudo_labels, sample_ids = batch
+                rel_pseudo_labels = None
+                if job is not None:
+                    rel_pseudo_labels, snapshot_iteration = self.rel_labeler.result(job)
+                    staleness = self.model.iteration - snapshot_iteration
                 
                 # 计算模型参数量
                 # from torchsummary import summary
@@ -158,7 +231,10 @@ class MMGNet():
                                                 weights_obj=self.dataset_train.w_cls_obj, 
                                                 weights_rel=self.dataset_train.w_cls_rel,
                                                 img_pair_info=img_pair_info, img_pair_idx=img_pair_idx, 
-                                                ignore_none_rel = False)
+                                                ignore_none_rel = False, obj_pseudo_labels=obj_pseudo_labels, rel_pseudo_labels=rel_pseudo_labels, sample_ids=sample_ids)
+                if job is not None:
+                    logs.append(("Label/staleness", staleness))
+                    self.rel_labeler.refresh(self.model)
                 
                 # for i in obj_texts:
                 #     if len(np.unique(i)) == len(i):
@@ -196,6 +272,9 @@ class MMGNet():
                 self.save()
             
             self.model.epoch += 1
+
+        if self.rel_labeler is not None:
+            self.rel_labeler.close()
                    
     def cuda(self, *args):
         return [item.to(self.config.DEVICE) for item in args]
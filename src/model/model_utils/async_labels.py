@@ -0,0 +1,83 @@
+import copy
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+# members of Mmgnet the snapshot shares with the trained model instead of copying them
+SHARED_MEMBERS = ('config', 'mconfig', 'clip', 'text_embeddings', 'obj_text_clip_fea', 'triplet_text_cache', 'rel_label_store', 'hungarian_pool', 'optimizer', 'lr_scheduler')
+
+
+class AsyncRelLabeler(object):
+    '''
+    Relation pseudo labels matched by a background thread while the training step runs.
+    The thread owns a snapshot of the model, refreshed from the trained model every `interval`
+    iterations, and runs Mmgnet.match_rel_labels on its own CUDA stream. The labels of a batch
+    come from weights up to `interval` iterations (+1 for the prefetched batch) older than the
+    ones they train.
+    '''
+    def __init__(self, model, interval):
+        memo = {id(m): m for m in (getattr(model, name, None) for name in SHARED_MEMBERS) if m is not None}
+        self.snapshot = copy.deepcopy(model, memo)
+        self.snapshot.train()
+        snapshot_state = self.snapshot.state_dict(keep_vars=True)
+        # the tensors to copy on refresh, the frozen shared ones (CLIP) are skipped
+        self.pairs = [(snapshot_state[k], v) for k, v in model.state_dict(keep_vars=True).items() if snapshot_state[k] is not v]
+        self.interval = max(int(interval), 1)
+        self.snapshot_iteration = model.iteration
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.stream = torch.cuda.Stream() if torch.cuda.is_available() else None
+        self.main_stream = torch.cuda.current_stream() if torch.cuda.is_available() else None
+
+    def record(self):
+        '''event marking the work queued so far on the main stream'''
+        if self.stream is None:
+            return None
+        event = torch.cuda.Event()
+        event.record(self.main_stream)
+        return event
+
+    def submit(self, epoch, *args, **kwargs):
+        '''queue Mmgnet.match_rel_labels(*args, **kwargs) on the snapshot during epoch, returns a job for result()'''
+        return self.snapshot_iteration, self.executor.submit(self.label, self.record(), epoch, args, kwargs)
+
+    def label(self, event, epoch, args, kwargs):
+        self.snapshot.epoch = epoch
+        with torch.no_grad(), torch.cuda.stream(self.stream):
+            if event is not None:
+                self.stream.wait_event(event)
+            labels = self.snapshot.match_rel_labels(*args, **kwargs)
+            done = None
+            if self.stream is not None:
+                labels.record_stream(self.main_stream)
+                done = torch.cuda.Event()
+                done.record(self.stream)
+        return labels, done
+
+    def result(self, job):
+        '''the labels of a submitted batch and the iteration of the snapshot which matched them'''
+        snapshot_iteration, future = job
+        labels, done = future.result()
+        if done is not None:
+            self.main_stream.wait_event(done)
+        return labels, snapshot_iteration
+
+    def refresh(self, model):
+        '''copy the weights of model into the snapshot once it is `interval` iterations old'''
+        if model.iteration - self.snapshot_iteration < self.interval:
+            return
+        with torch.no_grad():
+            state = [v.detach().clone() for _, v in self.pairs]
+        self.snapshot_iteration = model.iteration
+        self.executor.submit(self.load, self.record(), state)
+
+    def load(self, event, state):
+        with torch.no_grad(), torch.cuda.stream(self.stream):
+            if event is not None:
+                self.stream.wait_event(event)
+            for (s, _), v in zip(self.pairs, state):
+                s.copy_(v)
+                if self.stream is not None:
+                    v.record_stream(self.stream)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,42 @@
+import clip
+import torch
+
+
+class ClipText(object):
+    '''
+    Frozen text tower of a CLIP model: encode_text, logit_scale and dtype, the parts used for the
+    pseudo labels. The weights are loaded on first use and the visual encoder is dropped. A plain
+    object rather than an nn.Module, so a model holding it does not register its weights: they stay
+    out of parameters(), state_dict(), the checkpoints and .to() moves.
+    '''
+    def __init__(self, name="ViT-B/32", device="cpu"):
+        self.name = name
+        self.device = device
+        self.dtype = torch.float32 if str(device) == "cpu" else torch.float16  # as clip.load gives it
+        self.loaded = False
+
+    def load(self):
+        if self.loaded:
+            return
+        model, _ = clip.load(self.name, device="cpu")
+        del model.visual
+        if str(self.device) != "cpu":
+            clip.model.convert_weights(model)  # the fp16 weights clip.load gives on gpu
+        model = model.to(self.device).eval().requires_grad_(False)
+        self.token_embedding = model.token_embedding
+        self.positional_embedding = model.positional_embedding
+        self.transformer = model.transformer
+        self.ln_final = model.ln_final
+        self.text_projection = model.text_projection
+        self._logit_scale = model.logit_scale
+        self.loaded = True
+
+    @property
+    def logit_scale(self):
+        self.load()
+        return self._logit_scale
+
+    def encode_text(self, text):
+        self.load()
+        # CLIP.encode_text only reads the text tower and dtype
+        return clip.model.CLIP.encode_text(self, text)
@@ -4,7 +4,7 @@
 #
 import torch
 import torch.nn as nn
-from src.model.model_utils.network_util import build_mlp, Gen_Index, Aggre_Index, MLP
+from src.model.model_utils.network_util import build_mlp, Gen_Index, Aggre_Index, MLP, distance_bias, factorized_linear, gather, padding_mask, scene_mask, to_block_diagonal
 from src.model.model_utils.networks_base import BaseNetwork
 from src.model.transformer.attention import MultiHeadAttention
 import inspect
@@ -84,14 +84,18 @@ class MultiHeadedEdgeAttention(torch.nn.Module):
         else:
             raise NotImplementedError('')
         
-    def forward(self, query, edge, value):
-        batch_dim = query.size(0)
-        edge_feature = self.nn_edge( torch.cat([query,edge,value],dim=1) )#.view(b, -1, 1)
+    def forward(self, query, edge, value, index_i=None, index_j=None):
+        '''with index_i / index_j, query and value are node features and edge e joins query[index_i[e]] and value[index_j[e]],
+        the node terms of the first nn_edge layer, proj_query and proj_value are computed once per node'''
+        batch_dim = edge.size(0)
+        # = nn_edge(torch.cat([query,edge,value],dim=1))
+        edge_feature = factorized_linear(self.nn_edge[0], [query, edge, value], [index_i, None, index_j])
+        edge_feature = self.nn_edge[1:]( edge_feature )#.view(b, -1, 1)
         
         
         if self.attention == 'fat':
-            value = self.proj_value(value)
-            query = self.proj_query(query).view(batch_dim, self.d_n, self.num_heads)
+            value = gather(self.proj_value(value), index_j)
+            query = gather(self.proj_query(query), index_i).view(batch_dim, self.d_n, self.num_heads)
             edge = self.proj_edge(edge).view(batch_dim, self.d_e, self.num_heads)
             if self.use_edge:
                 prob = self.nn(torch.cat([query,edge],dim=1)) # b, dim, head    
@@ -105,7 +109,7 @@ class MultiHeadedEdgeAttention(torch.nn.Module):
     def trace(self, pth = './tmp',name_prefix=''):
         params = inspect.signature(self.forward).parameters
         params = OrderedDict(params)
-        names_i = [name for name in params.keys()]
+        names_i = [name for name in params.keys()][:3]  # query, edge, value
         names_o = ['w_'+names_i[0], 'prob']
         x1 = torch.rand(1, self.dim_node)
         e = torch.rand(1, self.dim_edge)
@@ -149,8 +153,8 @@ class GraphEdgeAttenNetwork(BaseNetwork):
     def forward(self, x, edge_feature, edge_index):
         assert x.ndim == 2
         assert edge_feature.ndim == 2
-        x_i, x_j = self.index_get(x, edge_index)
-        xx, gcn_edge_feature, prob = self.edgeatten(x_i,edge_feature,x_j)
+        index_i, index_j = self.index_get.index(edge_index)
+        xx, gcn_edge_feature, prob = self.edgeatten(x,edge_feature,x,index_i,index_j)
         xx = self.index_aggr(xx, edge_index, dim_size = x.shape[0])
         xx = self.prop(torch.cat([x,xx],dim=1))
         return xx, gcn_edge_feature, prob
@@ -230,30 +234,11 @@ class GraphEdgeAttenNetworkLayers(torch.nn.Module):
 
         if obj_center is not None:
             # get attention weight
-            batch_size = batch_ids.max().item() + 1
             N_K = node_feature.shape[0]
-            mask = torch.zeros(1, 1, N_K, N_K).cuda(self.device)
-            distance = torch.zeros(1, self.num_heads, N_K, N_K).cuda(self.device)
-            count = 0
-
-            for i in range(batch_size):
-
-                idx_i = torch.where(batch_ids == i)[0]
-                mask[:, :, count:count + len(idx_i), count:count + len(idx_i)] = 1
-            
-                center_A = obj_center[None, idx_i, :].clone().detach().repeat(len(idx_i), 1, 1)
-                center_B = obj_center[idx_i, None, :].clone().detach().repeat(1, len(idx_i), 1)
-                center_dist = (center_A - center_B)
-                dist = center_dist.pow(2)
-                dist = torch.sqrt(torch.sum(dist, dim=-1))[:, :, None]
-                weights = torch.cat([center_dist, dist], dim=-1).unsqueeze(0)  # 1 N N 4
-
-                dist_weights = self.self_attn_fc(weights).permute(0,3,1,2)  # 1 num_heads N N
-                
-                attention_matrix_way = 'add'
-                distance[:, :, count:count + len(idx_i), count:count + len(idx_i)] = dist_weights
-
-                count += len(idx_i)
+            node_mask = padding_mask(batch_ids)
+            mask = scene_mask(batch_ids, batch_ids)
+            distance = to_block_diagonal(distance_bias(obj_center, node_mask, self.self_attn_fc), node_mask, N_K)  # 1 num_heads N N
+            attention_matrix_way = 'add'
         else:
             mask = None
             distance = None
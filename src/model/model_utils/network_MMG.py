@@ -5,7 +5,12 @@ import torch.nn as nn
 import torch.nn.functional as F
 
 from src.model.model_utils.network_util import (MLP, Aggre_Index, Gen_Index,
-                                                build_mlp)
+                                                build_mlp, distance_bias,
+                                                edge_batch_ids,
+                                                factorized_linear, from_padded,
+                                                gather, padding_mask,
+                                                scene_mask, to_block_diagonal,
+                                                to_padded)
 from src.model.transformer.attention import MultiHeadAttention
 
 
@@ -34,8 +39,8 @@ class GraphEdgeAttenNetwork(torch.nn.Module):
     def forward(self, x, edge_feature, edge_index, weight=None, istrain=False):
         assert x.ndim == 2
         assert edge_feature.ndim == 2
-        x_i, x_j = self.index_get(x, edge_index)
-        xx, gcn_edge_feature, prob = self.edgeatten(x_i, edge_feature, x_j, weight, istrain=istrain)
+        index_i, index_j = self.index_get.index(edge_index)
+        xx, gcn_edge_feature, prob = self.edgeatten(x, edge_feature, x, weight, istrain=istrain, index_i=index_i, index_j=index_j)
         xx = self.index_aggr(xx, edge_index, dim_size = x.shape[0])
         xx = self.prop(torch.cat([x,xx],dim=1))  # 残差
         return xx, gcn_edge_feature
@@ -81,21 +86,24 @@ class MultiHeadedEdgeAttention(torch.nn.Module):
             self.proj_value = build_mlp([dim_node,dim_atten])
 
         
-    def forward(self, query, edge, value, weight=None, istrain=False):
-        '''计算方法：将query和edge的特征处理成多头注意力模式，然后拼接并过一个MLP得到prob，最后将prob和value相乘得到更新后的特征'''
-        batch_dim = query.size(0)
+    def forward(self, query, edge, value, weight=None, istrain=False, index_i=None, index_j=None):
+        '''计算方法：将query和edge的特征处理成多头注意力模式，然后拼接并过一个MLP得到prob，最后将prob和value相乘得到更新后的特征
+        给出index_i / index_j时query和value是节点特征, 第i条边取query[index_i[i]]和value[index_j[i]]:
+        nn_edge第一层、proj_query和proj_value中节点的部分每个节点只算一次, 再按边gather'''
+        batch_dim = edge.size(0)
         
-        edge_feature = torch.cat([query, edge, value],dim=1)
         # avoid overfitting by mask relation input object feature
         # if random.random() < self.mask_obj and istrain: 
         #     feat_mask = torch.cat([torch.ones_like(query),torch.zeros_like(edge), torch.ones_like(value)],dim=1)
         #     edge_feature = torch.where(feat_mask == 1, edge_feature, torch.zeros_like(edge_feature))
         
-        edge_feature = self.nn_edge( edge_feature )#.view(b, -1, 1)
+        # = nn_edge(torch.cat([query, edge, value],dim=1))
+        edge_feature = factorized_linear(self.nn_edge[0], [query, edge, value], [index_i, None, index_j])
+        edge_feature = self.nn_edge[1:]( edge_feature )#.view(b, -1, 1)
 
         if self.attention == 'fat':
-            value = self.proj_value(value)
-            query = self.proj_query(query).view(batch_dim, self.d_n, self.num_heads)
+            value = gather(self.proj_value(value), index_j)
+            query = gather(self.proj_query(query), index_i).view(batch_dim, self.d_n, self.num_heads)
             edge = self.proj_edge(edge).view(batch_dim, self.d_e, self.num_heads)
             if self.use_edge:
                 prob = self.nn(torch.cat([query,edge],dim=1)) # b, dim, head    
@@ -182,29 +190,12 @@ class MMG(torch.nn.Module):
         # compute weight for obj
         if obj_center is not None:
             # get attention weight for object
-            batch_size = batch_ids.max().item() + 1
             N_K = obj_feature_3d.shape[0]
-            obj_mask = torch.zeros(1, 1, N_K, N_K).to(self.cuda_device)
-            obj_distance_weight = torch.zeros(1, self.num_heads, N_K, N_K).to(self.cuda_device)
-            count = 0
-
-            for i in range(batch_size):
-
-                idx_i = torch.where(batch_ids == i)[0]
-                obj_mask[:, :, count:count + len(idx_i), count:count + len(idx_i)] = 1  # 同一个场景下的物体之间会被赋值为1,表示这两个物体之间存在联系。不同场景的物体之间赋值为0，表示不存在联系
-            
-                center_A = obj_center[None, idx_i, :].clone().detach().repeat(len(idx_i), 1, 1)  # 获取一个场景的中心
-                center_B = obj_center[idx_i, None, :].clone().detach().repeat(1, len(idx_i), 1)
-                center_dist = (center_A - center_B)
-                dist = center_dist.pow(2)  # 取平方
-                dist = torch.sqrt(torch.sum(dist, dim=-1))[:, :, None]
-                weights = torch.cat([center_dist, dist], dim=-1).unsqueeze(0)  # 1 N N 4
-                dist_weights = self.self_attn_fc(weights).permute(0,3,1,2)  # 1 num_heads N N
-                
-                attention_matrix_way = 'add'
-                obj_distance_weight[:, :, count:count + len(idx_i), count:count + len(idx_i)] = dist_weights  # 存储dist attention权重,后续和obj_feature_3d产生的自注意力一起使用
-
-                count += len(idx_i)
+            node_mask = padding_mask(batch_ids)
+            obj_mask = scene_mask(batch_ids, batch_ids)  # 同一个场景下的物体之间为True,表示这两个物体之间存在联系。不同场景的物体之间为False，表示不存在联系
+            # dist attention权重,后续和obj_feature_3d产生的自注意力一起使用
+            obj_distance_weight = to_block_diagonal(distance_bias(obj_center, node_mask, self.self_attn_fc), node_mask, N_K)  # 1 num_heads N N
+            attention_matrix_way = 'add'
         else:
             obj_mask = None
             obj_distance = None
@@ -300,37 +291,16 @@ class MMG_transformer(torch.nn.Module):
         # compute weight for obj
         if obj_center is not None:
             # get attention weight for object
-            batch_size = batch_ids.max().item() + 1
             N_K = obj_feature_3d.shape[0]
             N_R = edge_feature_3d.shape[0]
-            obj_mask = torch.zeros(1, 1, N_K, N_K).to(self.cuda_device)
-            rel_mask = torch.zeros(1, 1, N_R, N_R).to(self.cuda_device)
-            rel_to_obj_mask = torch.zeros(1, 1, N_R, N_K).to(self.cuda_device)
-            obj_distance_weight = torch.zeros(1, self.num_heads, N_K, N_K).to(self.cuda_device)
-            count = 0
-            count_rel = 0
-
-            for i in range(batch_size):
-
-                idx_i = torch.where(batch_ids == i)[0]
-                L = len(idx_i)
-                obj_mask[:, :, count:count + L, count:count + L] = 1  # 同一个场景下的物体之间会被赋值为1,表示这两个物体之间存在联系。不同场景的物体之间赋值为0，表示不存在联系
-                rel_mask[:, :, count_rel:count_rel + L * (L - 1), count_rel:count_rel + L * (L - 1)] = 1
-                rel_to_obj_mask[:, :, count_rel:count_rel + L * (L - 1), count:count + L] = 1
-            
-                center_A = obj_center[None, idx_i, :].clone().detach().repeat(len(idx_i), 1, 1)  # 获取一个场景的中心
-                center_B = obj_center[idx_i, None, :].clone().detach().repeat(1, len(idx_i), 1)
-                center_dist = (center_A - center_B)
-                dist = center_dist.pow(2)  # 取平方
-                dist = torch.sqrt(torch.sum(dist, dim=-1))[:, :, None]
-                weights = torch.cat([center_dist, dist], dim=-1).unsqueeze(0)  # 1 N N 4
-                dist_weights = self.self_attn_fc(weights).permute(0,3,1,2)  # 1 num_heads N N
-                
-                attention_matrix_way = 'add'
-                obj_distance_weight[:, :, count:count + len(idx_i), count:count + len(idx_i)] = dist_weights  # 存储dist attention权重,后续和obj_feature_3d产生的自注意力一起使用
-
-                count += L
-                count_rel += L * (L - 1)
+            node_mask = padding_mask(batch_ids)
+            obj_mask = scene_mask(batch_ids, batch_ids)  # 同一个场景下的物体之间为True,表示这两个物体之间存在联系。不同场景的物体之间为False，表示不存在联系
+            edge_ids = edge_batch_ids(node_mask, N_R)
+            rel_mask = scene_mask(edge_ids, edge_ids)
+            rel_to_obj_mask = scene_mask(edge_ids, batch_ids)
+            # dist attention权重,后续和obj_feature_3d产生的自注意力一起使用
+            obj_distance_weight = to_block_diagonal(distance_bias(obj_center, node_mask, self.self_attn_fc), node_mask, N_K)  # 1 num_heads N N
+            attention_matrix_way = 'add'
         else:
             obj_mask = None
             obj_distance = None
@@ -446,37 +416,16 @@ class MMG_transformer_rel_pc(torch.nn.Module):
         # compute weight for obj
         if obj_center is not None:
             # get attention weight for object
-            batch_size = batch_ids.max().item() + 1
             N_K = obj_feature_3d.shape[0]
             N_R = edge_feature_3d.shape[0]
-            obj_mask = torch.zeros(1, 1, N_K, N_K).to(self.cuda_device)
-            rel_mask = torch.zeros(1, 1, N_R, N_R).to(self.cuda_device)
-            rel_to_obj_mask = torch.zeros(1, 1, N_R, N_K).to(self.cuda_device)
-            obj_distance_weight = torch.zeros(1, self.num_heads, N_K, N_K).to(self.cuda_device)
-            count = 0
-            count_rel = 0
-
-            for i in range(batch_size):
-
-                idx_i = torch.where(batch_ids == i)[0]
-                L = len(idx_i)
-                obj_mask[:, :, count:count + L, count:count + L] = 1  # 同一个场景下的物体之间会被赋值为1,表示这两个物体之间存在联系。不同场景的物体之间赋值为0，表示不存在联系
-                rel_mask[:, :, count_rel:count_rel + L * (L - 1), count_rel:count_rel + L * (L - 1)] = 1
-                rel_to_obj_mask[:, :, count_rel:count_rel + L * (L - 1), count:count + L] = 1
-            
-                center_A = obj_center[None, idx_i, :].clone().detach().repeat(len(idx_i), 1, 1)  # 获取一个场景的中心
-                center_B = obj_center[idx_i, None, :].clone().detach().repeat(1, len(idx_i), 1)
-                center_dist = (center_A - center_B)
-                dist = center_dist.pow(2)  # 取平方
-                dist = torch.sqrt(torch.sum(dist, dim=-1))[:, :, None]
-                weights = torch.cat([center_dist, dist], dim=-1).unsqueeze(0)  # 1 N N 4
-                dist_weights = self.self_attn_fc(weights).permute(0,3,1,2)  # 1 num_heads N N
-                
-                attention_matrix_way = 'add'
-                obj_distance_weight[:, :, count:count + len(idx_i), count:count + len(idx_i)] = dist_weights  # 存储dist attention权重,后续和obj_feature_3d产生的自注意力一起使用
-
-                count += L
-                count_rel += L * (L - 1)
+            node_mask = padding_mask(batch_ids)
+            obj_mask = scene_mask(batch_ids, batch_ids)  # 同一个场景下的物体之间为True,表示这两个物体之间存在联系。不同场景的物体之间为False，表示不存在联系
+            edge_ids = edge_batch_ids(node_mask, N_R)
+            rel_mask = scene_mask(edge_ids, edge_ids)
+            rel_to_obj_mask = scene_mask(edge_ids, batch_ids)
+            # dist attention权重,后续和obj_feature_3d产生的自注意力一起使用
+            obj_distance_weight = to_block_diagonal(distance_bias(obj_center, node_mask, self.self_attn_fc), node_mask, N_K)  # 1 num_heads N N
+            attention_matrix_way = 'add'
         else:
             obj_mask = None
             obj_distance = None
@@ -643,37 +592,16 @@ class MMG_transformer_vlsat(torch.nn.Module):
         # compute weight for obj
         if obj_center is not None:
             # get attention weight for object
-            batch_size = batch_ids.max().item() + 1
             N_K = obj_feature_3d.shape[0]
             N_R = edge_feature_3d.shape[0]
-            obj_mask = torch.zeros(1, 1, N_K, N_K).to(self.cuda_device)
-            rel_mask = torch.zeros(1, 1, N_R, N_R).to(self.cuda_device)
-            rel_to_obj_mask = torch.zeros(1, 1, N_R, N_K).to(self.cuda_device)
-            obj_distance_weight = torch.zeros(1, self.num_heads, N_K, N_K).to(self.cuda_device)
-            count = 0
-            count_rel = 0
-
-            for i in range(batch_size):
-
-                idx_i = torch.where(batch_ids == i)[0]
-                L = len(idx_i)
-                obj_mask[:, :, count:count + L, count:count + L] = 1  # 同一个场景下的物体之间会被赋值为1,表示这两个物体之间存在联系。不同场景的物体之间赋值为0，表示不存在联系
-                rel_mask[:, :, count_rel:count_rel + L * (L - 1), count_rel:count_rel + L * (L - 1)] = 1
-                rel_to_obj_mask[:, :, count_rel:count_rel + L * (L - 1), count:count + L] = 1
-            
-                center_A = obj_center[None, idx_i, :].clone().detach().repeat(len(idx_i), 1, 1)  # 获取一个场景的中心
-                center_B = obj_center[idx_i, None, :].clone().detach().repeat(1, len(idx_i), 1)
-                center_dist = (center_A - center_B)
-                dist = center_dist.pow(2)  # 取平方
-                dist = torch.sqrt(torch.sum(dist, dim=-1))[:, :, None]
-                weights = torch.cat([center_dist, dist], dim=-1).unsqueeze(0)  # 1 N N 4
-                dist_weights = self.self_attn_fc(weights).permute(0,3,1,2)  # 1 num_heads N N
-                
-                attention_matrix_way = 'add'
-                obj_distance_weight[:, :, count:count + len(idx_i), count:count + len(idx_i)] = dist_weights  # 存储dist attention权重,后续和obj_feature_3d产生的自注意力一起使用
-
-                count += L
-                count_rel += L * (L - 1)
+            node_mask = padding_mask(batch_ids)
+            obj_mask = scene_mask(batch_ids, batch_ids)  # 同一个场景下的物体之间为True,表示这两个物体之间存在联系。不同场景的物体之间为False，表示不存在联系
+            edge_ids = edge_batch_ids(node_mask, N_R)
+            rel_mask = scene_mask(edge_ids, edge_ids)
+            rel_to_obj_mask = scene_mask(edge_ids, batch_ids)
+            # dist attention权重,后续和obj_feature_3d产生的自注意力一起使用
+            obj_distance_weight = to_block_diagonal(distance_bias(obj_center, node_mask, self.self_attn_fc), node_mask, N_K)  # 1 num_heads N N
+            attention_matrix_way = 'add'
         else:
             obj_mask = None
             obj_distance = None
@@ -750,7 +678,7 @@ class MMG_ws(torch.nn.Module):
 
     def __init__(self, dim_node, dim_edge, dim_atten, cuda_device, num_heads=1, aggr= 'max', 
                  use_bn=False,flow='target_to_source', attention = 'fat', 
-                 hidden_size=512, depth=1, use_edge:bool=True, **kwargs
+                 hidden_size=512, depth=1, use_edge:bool=True, use_rel_self_attn=False, use_rel_obj_attn=False, **kwargs
                  ):
         
         super().__init__()
@@ -758,6 +686,10 @@ class MMG_ws(torch.nn.Module):
         self.num_heads = num_heads
         self.depth = depth
         self.cuda_device = cuda_device
+        # 同一场景内的边之间做attention: 仍是每个场景边数的平方, [B, heads, E_max, E_max], E = N(N-1),
+        # 即物体数的四次方, 物体多的场景显存开销大
+        self.use_rel_self_attn = use_rel_self_attn
+        self.use_rel_obj_attn = use_rel_obj_attn  # 边对同一场景内的物体做attention, [B, heads, E_max, N_max]
 
         self.self_attn = nn.ModuleList(
             MultiHeadAttention(d_model=dim_node, d_k=dim_node // num_heads, d_v=dim_node // num_heads, h=num_heads) for i in range(depth))
@@ -798,60 +730,44 @@ class MMG_ws(torch.nn.Module):
     
     def forward(self, obj_feature_3d, edge_feature_3d, edge_index, batch_ids, obj_center=None, discriptor=None, istrain=False):
 
+        # 每个场景的物体单独做attention: [B, N_max] padding, 只mask掉padding的key
+        node_mask = padding_mask(batch_ids)
+        obj_mask = node_mask[:, None, None, :]
+
+        # 边按场景padding到[B, E_max], 只在开启关系attention时计算
+        if self.use_rel_self_attn or self.use_rel_obj_attn:
+            edge_mask = padding_mask(batch_ids.view(-1)[edge_index[0]], node_mask.shape[0])
+            # 没有边的场景attend到padding, 避免整行被mask
+            edge_key_mask = (edge_mask | ~edge_mask.any(1, keepdim=True))[:, None, None, :]
+
         # compute weight for obj
         if obj_center is not None:
             # get attention weight for object
-            batch_size = batch_ids.max().item() + 1
-            N_K = obj_feature_3d.shape[0]
-            N_R = edge_feature_3d.shape[0]
-            obj_mask = torch.zeros(1, 1, N_K, N_K).to(self.cuda_device)
-            rel_mask = torch.zeros(1, 1, N_R, N_R).to(self.cuda_device)
-            rel_to_obj_mask = torch.zeros(1, 1, N_R, N_K).to(self.cuda_device)
-            obj_distance_weight = torch.zeros(1, self.num_heads, N_K, N_K).to(self.cuda_device)
-            count = 0
-            count_rel = 0
-
-            for i in range(batch_size):
-
-                idx_i = torch.where(batch_ids == i)[0]
-                L = len(idx_i)
-                obj_mask[:, :, count:count + L, count:count + L] = 1  # 同一个场景下的物体之间会被赋值为1,表示这两个物体之间存在联系。不同场景的物体之间赋值为0，表示不存在联系
-                rel_mask[:, :, count_rel:count_rel + L * (L - 1), count_rel:count_rel + L * (L - 1)] = 1
-                rel_to_obj_mask[:, :, count_rel:count_rel + L * (L - 1), count:count + L] = 1
-            
-                center_A = obj_center[None, idx_i, :].clone().detach().repeat(len(idx_i), 1, 1)  # 获取一个场景的中心
-                center_B = obj_center[idx_i, None, :].clone().detach().repeat(1, len(idx_i), 1)
-                center_dist = (center_A - center_B)
-                dist = center_dist.pow(2)  # 取平方
-                dist = torch.sqrt(torch.sum(dist, dim=-1))[:, :, None]
-                weights = torch.cat([center_dist, dist], dim=-1).unsqueeze(0)  # 1 N N 4
-                dist_weights = self.self_attn_fc(weights).permute(0,3,1,2)  # 1 num_heads N N
-                
-                attention_matrix_way = 'add'
-                obj_distance_weight[:, :, count:count + len(idx_i), count:count + len(idx_i)] = dist_weights  # 存储dist attention权重,后续和obj_feature_3d产生的自注意力一起使用
-
-                count += L
-                count_rel += L * (L - 1)
+            obj_distance_weight = distance_bias(obj_center, node_mask, self.self_attn_fc)  # B num_heads N N, 和obj_feature_3d产生的自注意力一起使用
+            attention_matrix_way = 'add'
         else:
-            obj_mask = None
-            obj_distance = None
+            obj_distance_weight = None
             attention_matrix_way = 'mul'
 
 
         for i in range(self.depth):
 
-            obj_feature_3d = obj_feature_3d.unsqueeze(0)
+            obj_feature_3d = to_padded(obj_feature_3d, node_mask)
             obj_feature_3d = self.self_attn[i](obj_feature_3d, obj_feature_3d, obj_feature_3d, attention_weights=obj_distance_weight, way=attention_matrix_way, attention_mask=obj_mask, use_knn=False)
+            obj_feature_3d = from_padded(obj_feature_3d, node_mask)
             # obj_feature_3d = self.cross_attn[i](obj_feature_3d, obj_feature_2d, obj_feature_2d, attention_weights=obj_distance_weight, way=attention_matrix_way, attention_mask=obj_mask, use_knn=False)
             # obj_feature_2d = self.cross_attn[i](obj_feature_2d, obj_feature_3d, obj_feature_3d, attention_weights=obj_distance_weight, way=attention_matrix_way, attention_mask=obj_mask, use_knn=False)
             
-            edge_feature_3d = edge_feature_3d.unsqueeze(0)
-            # edge_feature_3d = self.self_attn_rel[i](edge_feature_3d, edge_feature_3d, edge_feature_3d, attention_mask=rel_mask)
-            
-            # edge_feature_3d = self.cross_attn_rel_to_obj[i](edge_feature_3d, obj_feature_3d, obj_feature_3d, attention_mask=rel_to_obj_mask)
-            
-            edge_feature_3d = edge_feature_3d.squeeze(0)
-            obj_feature_3d = obj_feature_3d.squeeze(0)
+            if self.use_rel_self_attn:
+                edge_feature_3d = to_padded(edge_feature_3d, edge_mask)
+                edge_feature_3d = self.self_attn_rel[i](edge_feature_3d, edge_feature_3d, edge_feature_3d, attention_mask=edge_key_mask)
+                edge_feature_3d = from_padded(edge_feature_3d, edge_mask)
+
+            if self.use_rel_obj_attn:
+                obj_feature_pad = to_padded(obj_feature_3d, node_mask)
+                edge_feature_3d = to_padded(edge_feature_3d, edge_mask)
+                edge_feature_3d = self.cross_attn_rel_to_obj[i](edge_feature_3d, obj_feature_pad, obj_feature_pad, attention_mask=obj_mask)
+                edge_feature_3d = from_padded(edge_feature_3d, edge_mask)
             
             obj_feature_3d, edge_feature_3d = self.gcn_3ds[i](obj_feature_3d, edge_feature_3d, edge_index, istrain=istrain)
 
@@ -938,29 +854,12 @@ class MMG_vlsat(torch.nn.Module):
         # compute weight for obj
         if obj_center is not None:
             # get attention weight for object
-            batch_size = batch_ids.max().item() + 1
             N_K = obj_feature_3d.shape[0]
-            obj_mask = torch.zeros(1, 1, N_K, N_K).to(self.cuda_device)
-            obj_distance_weight = torch.zeros(1, self.num_heads, N_K, N_K).to(self.cuda_device)
-            count = 0
-
-            for i in range(batch_size):
-
-                idx_i = torch.where(batch_ids == i)[0]
-                obj_mask[:, :, count:count + len(idx_i), count:count + len(idx_i)] = 1  # 同一个场景下的物体之间会被赋值为1,表示这两个物体之间存在联系。不同场景的物体之间赋值为0，表示不存在联系
-            
-                center_A = obj_center[None, idx_i, :].clone().detach().repeat(len(idx_i), 1, 1)  # 获取一个场景的中心
-                center_B = obj_center[idx_i, None, :].clone().detach().repeat(1, len(idx_i), 1)
-                center_dist = (center_A - center_B)
-                dist = center_dist.pow(2)  # 取平方
-                dist = torch.sqrt(torch.sum(dist, dim=-1))[:, :, None]
-                weights = torch.cat([center_dist, dist], dim=-1).unsqueeze(0)  # 1 N N 4
-                dist_weights = self.self_attn_fc(weights).permute(0,3,1,2)  # 1 num_heads N N
-                
-                attention_matrix_way = 'add'
-                obj_distance_weight[:, :, count:count + len(idx_i), count:count + len(idx_i)] = dist_weights  # 存储dist attention权重,后续和obj_feature_3d产生的自注意力一起使用
-
-                count += len(idx_i)
+            node_mask = padding_mask(batch_ids)
+            obj_mask = scene_mask(batch_ids, batch_ids)  # 同一个场景下的物体之间为True,表示这两个物体之间存在联系。不同场景的物体之间为False，表示不存在联系
+            # dist attention权重,后续和obj_feature_3d产生的自注意力一起使用
+            obj_distance_weight = to_block_diagonal(distance_bias(obj_center, node_mask, self.self_attn_fc), node_mask, N_K)  # 1 num_heads N N
+            attention_matrix_way = 'add'
         else:
             obj_mask = None
             obj_distance = None
@@ -1118,29 +1017,11 @@ class MMG_teacher(torch.nn.Module):
 
         if obj_center is not None:
             # get attention weight
-            batch_size = batch_ids.max().item() + 1
             N_K = obj_feature_3d.shape[0]
-            mask = torch.zeros(1, 1, N_K, N_K).to(self.cuda_device)
-            distance = torch.zeros(1, self.num_heads, N_K, N_K).to(self.cuda_device)
-            count = 0
-
-            for i in range(batch_size):
-
-                idx_i = torch.where(batch_ids == i)[0]
-                mask[:, :, count:count + len(idx_i), count:count + len(idx_i)] = 1
-            
-                center_A = obj_center[None, idx_i, :].clone().detach().repeat(len(idx_i), 1, 1)
-                center_B = obj_center[idx_i, None, :].clone().detach().repeat(1, len(idx_i), 1)
-                center_dist = (center_A - center_B)
-                dist = center_dist.pow(2)
-                dist = torch.sqrt(torch.sum(dist, dim=-1))[:, :, None]
-                weights = torch.cat([center_dist, dist], dim=-1).unsqueeze(0)  # 1 N N 4
-                dist_weights = self.self_attn_fc(weights).permute(0,3,1,2)  # 1 num_heads N N
-                
-                attention_matrix_way = 'add'
-                distance[:, :, count:count + len(idx_i), count:count + len(idx_i)] = dist_weights
-
-                count += len(idx_i)
+            node_mask = padding_mask(batch_ids)
+            mask = scene_mask(batch_ids, batch_ids)
+            distance = to_block_diagonal(distance_bias(obj_center, node_mask, self.self_attn_fc), node_mask, N_K)  # 1 num_heads N N
+            attention_matrix_way = 'add'
         else:
             mask = None
             distance = None
@@ -1234,29 +1115,11 @@ class MMG_student(torch.nn.Module):
         
         if obj_center is not None:
             # get attention weight
-            batch_size = batch_ids.max().item() + 1
             N_K = obj_feature.shape[0]
-            mask = torch.zeros(1, 1, N_K, N_K).to(self.cuda_device)
-            distance = torch.zeros(1, self.num_heads, N_K, N_K).to(self.cuda_device)
-            count = 0
-
-            for i in range(batch_size):
-
-                idx_i = torch.where(batch_ids == i)[0]
-                mask[:, :, count:count + len(idx_i), count:count + len(idx_i)] = 1
-            
-                center_A = obj_center[None, idx_i, :].clone().detach().repeat(len(idx_i), 1, 1)
-                center_B = obj_center[idx_i, None, :].clone().detach().repeat(1, len(idx_i), 1)
-                center_dist = (center_A - center_B)
-                dist = center_dist.pow(2)
-                dist = torch.sqrt(torch.sum(dist, dim=-1))[:, :, None]
-                weights = torch.cat([center_dist, dist], dim=-1).unsqueeze(0)  # 1 N N 4
-                dist_weights = self.self_attn_fc(weights).permute(0,3,1,2)  # 1 num_heads N N
-                
-                attention_matrix_way = 'add'
-                distance[:, :, count:count + len(idx_i), count:count + len(idx_i)] = dist_weights
-
-                count += len(idx_i)
+            node_mask = padding_mask(batch_ids)
+            mask = scene_mask(batch_ids, batch_ids)
+            distance = to_block_diagonal(distance_bias(obj_center, node_mask, self.self_attn_fc), node_mask, N_K)  # 1 num_heads N N
+            attention_matrix_way = 'add'
         else:
             mask = None
             distance = None
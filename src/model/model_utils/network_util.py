@@ -7,7 +7,7 @@ Created on Sat Oct 10 16:46:24 2020
 """
 
 import torch
-from torch_geometric.nn.conv import MessagePassing
+from torch_scatter import scatter
 from src.model.model_utils.networks_base import mySequential
 
 def MLP(channels: list, do_bn=False, on_last=False, drop_out=None):
@@ -47,32 +47,103 @@ def build_mlp(dim_list, activation='relu', do_bn=False,
    return torch.nn.Sequential(*layers)
 
 
-class Gen_Index(MessagePassing):
-    """ A sequence of scene graph convolution layers  """
+def padding_mask(batch_ids, batch_size=0):
+    """ [B, N_max] mask of the nodes of every scene in a padded batch, batch_ids: [N] sorted scene index of each node """
+    counts = torch.bincount(batch_ids.view(-1), minlength=batch_size)
+    return torch.arange(int(counts.max()), device=batch_ids.device) < counts.unsqueeze(1)
+
+
+def to_padded(x, mask):
+    """ [N, ...] node features -> [B, N_max, ...] zero padded per scene """
+    padded = x.new_zeros(*mask.shape, *x.shape[1:])
+    # masked_scatter fills in node order without a host sync
+    return padded.masked_scatter(mask.view(*mask.shape, *[1] * (x.dim() - 1)).expand_as(padded), x)
+
+
+def from_padded(x, mask):
+    """ [B, N_max, ...] padded features -> [N, ...] in node order """
+    return x[mask]
+
+
+def scene_mask(batch_ids_q, batch_ids_k):
+    """ [1, 1, Nq, Nk] mask of the query / key pairs of the same scene, for an attention over a whole batch """
+    return (batch_ids_q.view(-1, 1) == batch_ids_k.view(1, -1))[None, None]
+
+
+def edge_batch_ids(node_mask, num_edges):
+    """ [E] scene of every edge of fully connected scenes, N * (N - 1) edges per scene in scene order """
+    counts = node_mask.sum(1)
+    return torch.repeat_interleave(torch.arange(len(counts), device=counts.device), counts * (counts - 1), output_size=num_edges)
+
+
+def distance_bias(obj_center, node_mask, fc):
+    """ [B, heads, N_max, N_max] attention bias fc([c_j - c_i, |c_j - c_i|]) between the objects i, j of every scene """
+    center = to_padded(obj_center.detach(), node_mask)  # B N 3
+    center_dist = center[:, None, :, :] - center[:, :, None, :]  # B N N 3
+    dist = torch.sqrt(torch.sum(center_dist.pow(2), dim=-1))[..., None]
+    return fc(torch.cat([center_dist, dist], dim=-1)).permute(0, 3, 1, 2)
+
+
+def to_block_diagonal(x, node_mask, num_nodes):
+    """ [B, C, N_max, N_max] per scene -> [1, C, num_nodes, num_nodes] block diagonal over the nodes of the batch """
+    B, C, N = x.shape[:3]
+    counts = node_mask.sum(1)
+    pos = (torch.cumsum(counts, 0) - counts)[:, None] + torch.arange(N, device=x.device)
+    pos = pos.masked_fill(~node_mask, num_nodes)  # padding goes to an extra row / column, dropped
+    index = (pos[:, :, None] * (num_nodes + 1) + pos[:, None, :]).view(-1)
+    out = x.new_zeros(C, (num_nodes + 1) ** 2)
+    out[:, index] = x.transpose(0, 1).reshape(C, -1)
+    return out.view(C, num_nodes + 1, num_nodes + 1)[:, :num_nodes, :num_nodes].unsqueeze(0)
+
+
+def gather(x, index):
+    """ x[index], x itself for index None """
+    return x if index is None else x[index]
+
+
+def factorized_linear(linear, parts, indices):
+    """ linear(torch.cat([gather(p, i) for p, i in zip(parts, indices)], dim=1)) with every part multiplied by its
+        columns of the weight before the gather, so node features are multiplied once per node instead of once per edge """
+    out, start = linear.bias, 0
+    for part, index in zip(parts, indices):
+        out = out + gather(part @ linear.weight[:, start:start + part.shape[1]].t(), index)
+        start += part.shape[1]
+    return out
+
+
+def flow_index(edges_indices, flow: str):
+    """ the node indices (i, j) of x_i, x_j of every edge, i the node the messages are aggregated at (as MessagePassing) """
+    if flow == 'source_to_target':
+        return edges_indices[1], edges_indices[0]
+    return edges_indices[0], edges_indices[1]
+
+
+class Gen_Index(torch.nn.Module):
+    """ x_i, x_j of every edge, as MessagePassing.message(x_i, x_j) with the same flow """
     def __init__(self,flow="target_to_source"):
-        super().__init__(flow=flow)
+        super().__init__()
+        self.flow = flow
+        self.node_dim = -2
         
     def forward(self, x, edges_indices):
-        size = self._check_input(edges_indices, None)
-        coll_dict = self._collect(self._user_args,edges_indices,size, {"x":x})
-        msg_kwargs = self.inspector.collect_param_data('message', coll_dict)
-        x_i, x_j = self.message(**msg_kwargs)
-        return x_i, x_j
-    def message(self, x_i, x_j):  # 确定
-        return x_i,x_j
-
-class Aggre_Index(MessagePassing):
+        index_i, index_j = self.index(edges_indices)
+        return x.index_select(self.node_dim, index_i), x.index_select(self.node_dim, index_j)
+    def index(self, edges_indices):
+        """ the node indices of x_i, x_j of every edge """
+        return flow_index(edges_indices, self.flow)
+
+class Aggre_Index(torch.nn.Module):
+    """ aggregate the edge features at node i of every edge, as MessagePassing.aggregate with the same aggr and flow """
     def __init__(self,aggr='add', node_dim=-2,flow="source_to_target"):
-        super().__init__(aggr=aggr, node_dim=node_dim, flow=flow)
-    def forward(self, x, edge_index,dim_size):
-        size = self._check_input(edge_index, None)
-        coll_dict = self._collect(self._user_args, edge_index, size,{})
-        coll_dict['dim_size'] = dim_size
-        aggr_kwargs = self.inspector.collect_param_data('aggregate', coll_dict)
+        super().__init__()
+        self.aggr = aggr
+        self.node_dim = node_dim
+        self.flow = flow
+    def forward(self, x, edge_index, dim_size: int):
         # 信息传递，将x_i的信息传递给x_j，不论是aggregate还是message还是update都有固有的参数输入。
         # 信息传递的方式由aggr决定，方向由flow决定
-        x = self.aggregate(x, **aggr_kwargs)  
-        return x
+        index_i, _ = flow_index(edge_index, self.flow)
+        return scatter(x, index_i, dim=self.node_dim, dim_size=dim_size, reduce=self.aggr)
 
 if __name__ == '__main__':
     flow = 'source_to_target'
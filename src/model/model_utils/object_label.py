@@ -0,0 +1,107 @@
+import numpy as np
+import torch
+import torch.nn.functional as F
+from scipy.optimize import linear_sum_assignment
+
+MODES = ('hungarian_plus', 'hungarian', 'argmax', 'sinkhorn')
+NEG = -1e9
+
+
+def sinkhorn_plan(logits, obj_valid, cls_valid, iters):
+    '''
+    entropic optimal transport between the objects and the classes of every scene, on the device.
+    logits: [B, N, C] scores, obj_valid: [B, N], cls_valid: [B, C] the unpadded rows and columns.
+    Every object and every class carries a mass of 1, a dummy class takes the objects left over
+    when a scene has more objects than classes and a dummy object the classes left over otherwise,
+    as the one to one matching of hungarian_plus. Returns the [B, N + 1, C + 1] log transport plan,
+    the dummy object / class last.
+    '''
+    B, N, C = logits.shape
+    num_objs, num_classes = obj_valid.sum(1), cls_valid.sum(1)
+    score = logits.float().masked_fill(~(obj_valid.unsqueeze(2) & cls_valid.unsqueeze(1)), NEG)
+    score = F.pad(score, (0, 1, 0, 1))
+    score[:, N, C] = NEG
+    log_a = torch.cat([torch.zeros_like(score[:, :N, 0]).masked_fill(~obj_valid, NEG),
+                       (num_classes - num_objs).clamp(min=1).float().log().masked_fill(num_classes <= num_objs, NEG).unsqueeze(1)], 1)
+    log_b = torch.cat([torch.zeros_like(score[:, 0, :C]).masked_fill(~cls_valid, NEG),
+                       (num_objs - num_classes).clamp(min=1).float().log().masked_fill(num_objs <= num_classes, NEG).unsqueeze(1)], 1)
+
+    # log domain iterations, u / v the row / column potentials
+    u, v = torch.zeros_like(log_a), torch.zeros_like(log_b)
+    for _ in range(iters):
+        u = log_a - torch.logsumexp(score + v.unsqueeze(1), dim=2)
+        v = log_b - torch.logsumexp(score + u.unsqueeze(2), dim=1)
+    return score + u.unsqueeze(2) + v.unsqueeze(1)
+
+
+def sinkhorn_assignment(logits, obj_valid, cls_valid, iters):
+    '''[B, N] the class column each object is rounded to (argmax of its sinkhorn_plan row), C for the dummy class'''
+    return sinkhorn_plan(logits, obj_valid, cls_valid, iters)[:, :logits.shape[1]].argmax(dim=2)
+
+
+def match_object_labels(mode, obj_2d_fea, batch_ids, obj_texts, obj_text_feature, logit_scale, executor=None, sinkhorn_iters=50):
+    '''
+    pseudo labels of the objects of a batch.
+    obj_2d_fea: normalized 2D features [N, dim], batch_ids: [N] the scene of each object (sorted),
+    obj_texts: the class indices of the annotated objects of every scene (a scene has at most
+    len(obj_texts[i]) objects), obj_text_feature: normalized text embeddings of all classes,
+    logit_scale: the exponentiated CLIP logit scale.
+    hungarian_plus: one to one matching, the objects left over take their most similar class.
+    hungarian: one to one matching (use_object_num). When a scene has more objects than classes
+    the objects left over take their most similar class: get_object_label used to return only
+    min(N, C) labels for such a scene, out of line with its objects.
+    argmax: most similar class. sinkhorn: hungarian_plus relaxed to sinkhorn_iters iterations of
+    entropic optimal transport, rounded to the closest class.
+    The objects are padded to [B, max len(obj_texts[i]), dim] and scored against all the classes
+    with one matmul, the classes absent from a scene masked. argmax and sinkhorn stay on the
+    device: the padding comes from the host side lengths of obj_texts, nothing is read back.
+    The hungarian modes copy the scores to the host once and the assignments of the scenes may
+    run in the threads of executor.
+    '''
+    if mode not in MODES:
+        raise RuntimeError('unknown object matching mode:', mode)
+    device = obj_2d_fea.device
+    B = len(obj_texts)
+    num_texts = [len(t.view(-1)) for t in obj_texts]
+    batch_ids = batch_ids.view(-1).to(device, torch.long)
+    # counted into B bins known on the host: bincount / unique_consecutive size their output from the data and sync
+    num_objs = torch.zeros(B, dtype=torch.long, device=device).scatter_add_(0, batch_ids, torch.ones_like(batch_ids))
+    obj_offset = torch.cumsum(num_objs, 0) - num_objs
+
+    # padded [B, N_max, dim] objects and [B, num_classes] classes present in every scene
+    obj_pos = torch.arange(len(batch_ids), device=device) - obj_offset[batch_ids]
+    obj_pad = obj_2d_fea.new_zeros(B, max(num_texts), obj_2d_fea.shape[1])
+    obj_pad[batch_ids, obj_pos] = obj_2d_fea
+    obj_valid = torch.arange(obj_pad.shape[1], device=device) < num_objs.unsqueeze(1)
+    texts = torch.cat([t.view(-1) for t in obj_texts]).to(device)
+    text_scene = torch.repeat_interleave(torch.arange(B, device=device), torch.tensor(num_texts, device=device), output_size=len(texts))
+    cls_valid = torch.zeros(B, obj_text_feature.shape[0], dtype=torch.bool, device=device)
+    cls_valid[text_scene, texts] = True
+
+    logits_per_image = logit_scale * obj_pad @ obj_text_feature.t()
+    logits_per_image = logits_per_image.masked_fill(~cls_valid.unsqueeze(1), float('-inf'))
+    # most similar class of every object, kept by the objects left out of the assignment
+    labels = logits_per_image.argmax(dim=2)[batch_ids, obj_pos]
+    if mode == 'argmax':
+        return labels
+    if mode == 'sinkhorn':
+        col = sinkhorn_assignment(logits_per_image, obj_valid, cls_valid, sinkhorn_iters)[batch_ids, obj_pos]
+        return torch.where(col < cls_valid.shape[1], col, labels)
+
+    scores = logits_per_image.float().cpu().numpy()
+    num_objs, obj_offset = num_objs.tolist(), obj_offset.tolist()
+    classes = [torch.unique(t.view(-1).cpu()).numpy() for t in obj_texts]
+
+    def assign(i):
+        s = scores[i, :num_objs[i]][:, classes[i]]
+        if mode == 'hungarian_plus':
+            cls_ind, obj_ind = linear_sum_assignment(-s.T)
+        else:
+            obj_ind, cls_ind = linear_sum_assignment(-s)
+        return obj_offset[i] + obj_ind, classes[i][cls_ind]
+
+    # scipy releases the GIL, the scenes can be assigned in parallel
+    assigned = list(executor.map(assign, range(B))) if executor is not None else [assign(i) for i in range(B)]
+    obj_ind = torch.from_numpy(np.concatenate([a[0] for a in assigned])).to(device)
+    labels[obj_ind] = torch.from_numpy(np.concatenate([a[1] for a in assigned])).to(device)
+    return labels
@@ -0,0 +1,82 @@
+import time
+
+import torch
+
+SKETCH_DIM = 32
+
+
+class RelLabelStore(object):
+    '''
+    Relation pseudo labels of every training sample (dataset index) kept between its visits.
+    The node and edge order of a scan split is the same at every visit, so the labels are kept in
+    edge order, on cpu, with a sketch of the features they were matched from: the edge features
+    projected on SKETCH_DIM fixed random directions. A sample is matched again when it is missing,
+    when its labels are refresh_epochs epochs old, or when the mean cosine distance between the
+    sketches of its edges now and at matching time exceeds drift_threshold (0 disables a rule).
+    '''
+    def __init__(self, refresh_epochs=0, drift_threshold=0, seed=0):
+        self.refresh_epochs = refresh_epochs
+        self.drift_threshold = drift_threshold
+        self.seed = seed
+        self.projection = None
+        self.entries = dict()  # sample id -> (labels, sketch, epoch)
+        self.hits = 0
+        self.misses = 0
+        self.refresh_time = 0.0
+
+    def sketch(self, features):
+        '''[E, SKETCH_DIM] normalized sketches of the edge features, on cpu'''
+        if self.projection is None or self.projection.shape[0] != features.shape[-1]:
+            g = torch.Generator().manual_seed(self.seed)
+            self.projection = torch.randn(features.shape[-1], SKETCH_DIM, generator=g)
+        self.projection = self.projection.to(features.device)
+        s = features.detach().float() @ self.projection
+        return (s / s.norm(dim=-1, keepdim=True).clamp(min=1e-6)).half().cpu()
+
+    def drift(self, old, new):
+        return float(1 - (old.float() * new.float()).sum(-1).mean()) if len(new) else 0.0
+
+    def lookup(self, sample_ids, epoch, sketches):
+        '''the stored labels of each sample, None for the ones to match again'''
+        out = []
+        for sample_id, s in zip(sample_ids, sketches):
+            entry = self.entries.get(sample_id)
+            if entry is not None and (len(entry[1]) != len(s) or
+                                      (self.refresh_epochs and epoch - entry[2] >= self.refresh_epochs) or
+                                      (self.drift_threshold and self.drift(entry[1], s) > self.drift_threshold)):
+                entry = None
+            out.append(entry[0] if entry is not None else None)
+        self.misses += sum(l is None for l in out)
+        self.hits += sum(l is not None for l in out)
+        return out
+
+    def update(self, sample_ids, epoch, labels, sketches, cost):
+        '''store freshly matched labels, cost: seconds spent matching them'''
+        for sample_id, l, s in zip(sample_ids, labels, sketches):
+            self.entries[sample_id] = (l.bool().cpu(), s, epoch)
+        self.refresh_time += cost
+
+    def logs(self):
+        '''hit rate and matching time per batch since the last call'''
+        total = self.hits + self.misses
+        log = [("Label/rel_store_hit_rate", self.hits / total if total else 0.0),
+               ("Label/rel_store_refresh_ms", 1000 * self.refresh_time)]
+        self.hits, self.misses, self.refresh_time = 0, 0, 0.0
+        return log
+
+    def match(self, match_fn, sample_ids, epoch, tri_texts, edge_features, num_edges):
+        '''
+        labels [E, num_rel] of a batch. Stored labels are reused, the other samples are matched by
+        match_fn(tri_texts) where the triplets of the reused samples are dropped.
+        '''
+        sketches = self.sketch(edge_features).split(num_edges)
+        cached = self.lookup(sample_ids, epoch, sketches)
+        stale = [i for i, l in enumerate(cached) if l is None]
+        fresh = None
+        if stale:
+            t0 = time.time()
+            fresh = match_fn([t if l is None else t[:0] for t, l in zip(tri_texts, cached)]).split(num_edges)
+            labels = [fresh[i].bool().cpu() for i in stale]
+            self.update([sample_ids[i] for i in stale], epoch, labels, [sketches[i] for i in stale], time.time() - t0)
+        device = edge_features.device
+        return torch.cat([fresh[i] if l is None else l.to(device).float() for i, l in enumerate(cached)])
@@ -0,0 +1,62 @@
+import os
+
+import clip
+import torch
+
+from src.utils import op_utils
+
+TRIPLET_TEXT_FILE = 'triplet_text_embeddings.pt'
+
+
+class TripletTextCache(object):
+    '''
+    CLIP text embeddings of the triplet prompts op_utils.tri_prompt, keyed by (subject class,
+    relation, object class) indices. On disk the embeddings are keyed by prompt, so the file stays
+    valid when classNames / relationNames change. Missing prompts are encoded in one batch and the
+    file is written back.
+    '''
+    def __init__(self, path, classNames, relationNames, device):
+        self.path = path
+        self.classNames = classNames
+        self.relationNames = relationNames
+        self.device = device
+        self.prompts = dict()  # prompt -> embedding on cpu, the content of the file
+        self.embeddings = dict()  # (sub, rel, obj) -> embedding on device
+        self.hits = 0
+        self.misses = 0
+        if os.path.exists(path):
+            data = torch.load(path, map_location='cpu')
+            self.prompts = dict(zip(data['prompts'], data['embeddings']))
+
+    def prompt(self, tri):
+        return op_utils.tri_prompt((self.classNames[tri[0]], self.relationNames[tri[1]], self.classNames[tri[2]]))
+
+    def add_prompts(self, prompts, encode_text, batch_size=256):
+        '''encode the prompts which are not cached yet and save the file'''
+        prompts = sorted({p for p in prompts if p not in self.prompts})
+        if len(prompts) == 0:
+            return
+        with torch.no_grad():
+            for i in range(0, len(prompts), batch_size):
+                tokens = clip.tokenize(prompts[i:i + batch_size]).to(self.device)
+                self.prompts.update(zip(prompts[i:i + batch_size], encode_text(tokens).cpu()))
+        self.save()
+
+    def get(self, tris, encode_text):
+        '''[len(tris), dim] embeddings of the triplets'''
+        keys = [tuple(t) for t in tris]
+        missing = {k for k in keys if k not in self.embeddings}
+        self.misses += len(missing)
+        self.hits += len(keys) - len(missing)
+        if len(missing) > 0:
+            self.add_prompts([self.prompt(t) for t in missing], encode_text)
+            for t in missing:
+                self.embeddings[t] = self.prompts[self.prompt(t)].to(self.device)
+        return torch.stack([self.embeddings[k] for k in keys])
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        prompts = list(self.prompts.keys())
+        tmp = self.path + '.tmp'
+        torch.save({'prompts': prompts, 'embeddings': torch.stack([self.prompts[p] for p in prompts])}, tmp)
+        os.replace(tmp, self.path)
@@ -0,0 +1,47 @@
+import hashlib
+import json
+import os
+
+import clip
+import torch
+
+from src.utils import op_utils
+
+TEXT_EMBEDDING_FILE = 'text_embeddings_{}.pt'
+
+
+def rel_prompt(rel_text):
+    return [f"{c}" for c in rel_text]
+
+
+class TextEmbeddings(object):
+    '''
+    CLIP embeddings of the object prompts op_utils.obj_prompt and relation prompts rel_prompt of the
+    vocabulary, with the CLIP logit scale. The file name holds a hash of the model name and of all
+    the prompts, so a file is only read for the same vocabulary and templates. Without a file the
+    embeddings are computed with clip_text (which loads CLIP) and written to cache_path if given.
+    '''
+    def __init__(self, clip_text, classNames, relationNames, cache_path=None):
+        obj_prompts, rel_prompts = [str(p) for p in op_utils.obj_prompt(classNames)], rel_prompt(relationNames)
+        key = json.dumps({'model': clip_text.name, 'obj': obj_prompts, 'rel': rel_prompts})
+        self.path = None
+        if cache_path:
+            self.path = os.path.join(cache_path, TEXT_EMBEDDING_FILE.format(hashlib.sha1(key.encode()).hexdigest()[:16]))
+
+        if self.path is not None and os.path.exists(self.path):
+            data = torch.load(self.path, map_location='cpu')
+        else:
+            with torch.no_grad():
+                data = {'model': clip_text.name, 'obj_prompts': obj_prompts, 'rel_prompts': rel_prompts,
+                        'obj': clip_text.encode_text(clip.tokenize(obj_prompts).to(clip_text.device)).cpu(),
+                        'rel': clip_text.encode_text(clip.tokenize(rel_prompts).to(clip_text.device)).cpu(),
+                        'logit_scale': clip_text.logit_scale.detach().cpu()}
+            if self.path is not None:
+                os.makedirs(cache_path, exist_ok=True)
+                torch.save(data, self.path + '.tmp')
+                os.replace(self.path + '.tmp', self.path)
+
+        # the file may come from a fp32 CLIP
+        self.obj = data['obj'].to(clip_text.device).type(clip_text.dtype)
+        self.rel = data['rel'].to(clip_text.device).type(clip_text.dtype)
+        self.logit_scale = data['logit_scale'].to(clip_text.device)
@@ -4,7 +4,6 @@ if __name__ == '__main__' and __package__ is None:
 
 import os,sys,time,math,torch
 import numpy as np
-from torch_geometric.nn.conv import MessagePassing
 
 
 def shape_trick(tri_label, descriptor, edge_temp):
@@ -30,6 +29,31 @@ def shape_trick(tri_label, descriptor, edge_temp):
     return metric_list * 10
 
 
+# relations weighted by shape_trick: descriptor column compared (9: size, 10: height) and sign
+SHAPE_TRICK_RELATIONS = {"bigger than": (9, 1), "smaller than": (9, -1), "higher than": (10, 1), "lower than": (10, -1)}
+
+
+def shape_trick_padded(metric, valid):
+    '''
+    shape_trick for padded candidates: metric [G, K] is the signed descriptor difference (sub - obj) of
+    the candidate edges of G triplets, valid [G, K] masks the padding. Same weights as shape_trick.
+    '''
+    lo = metric.masked_fill(~valid, float('inf')).min(dim=1, keepdim=True)[0]
+    hi = metric.masked_fill(~valid, float('-inf')).max(dim=1, keepdim=True)[0]
+    return (2 * (metric - lo) / (hi - lo) - 1) * 10
+
+
+def edge_endpoints(edge, num_nodes):
+    '''
+    (sub, obj) of the edge ids of a fully connected scene of num_nodes objects, num_nodes may be a tensor
+    broadcast with edge. The edges are ordered like the datasets build them, product(range(n), range(n))
+    without (i, i): edge sub -> obj has the id sub * (n - 1) + obj - (obj > sub).
+    '''
+    d = torch.clamp(num_nodes - 1, min=1) if torch.is_tensor(num_nodes) else max(num_nodes - 1, 1)
+    sub, obj = edge // d, edge % d
+    return sub, obj + (obj >= sub).long()
+
+
 def obj_prompt(obj_text):
     return np.array([f"a photo of a {i}" for i in obj_text])
 
@@ -112,17 +136,20 @@ def gen_descriptor(pts:torch.tensor):
     return torch.cat([centroid_pts,std_pts,segment_dims,segment_volume,segment_lengths],dim=0)
 
 
-class Gen_edge_descriptor(MessagePassing):#TODO: move to model
+class Gen_edge_descriptor(torch.nn.Module):#TODO: move to model
     """ A sequence of scene graph convolution layers  """
     def __init__(self, flow="source_to_target"):
-        # flow：定义消息传递的流向（"source_to_target "或 “target_to_source”）
-        super().__init__(flow=flow)
+        # flow：定义消息传递的流向（"source_to_target "或 “target_to_source”）, 和MessagePassing一样
+        super().__init__()
+        self.flow = flow
     
     def forward(self, descriptor, edges_indices):
-        size = self._check_input(edges_indices, None)
-        coll_dict = self._collect(self._user_args, edges_indices, size, {"x":descriptor})  # 收集相关参数，将用户参数和父类需要的参数进行对应
-        msg_kwargs = self.inspector.collect_param_data('message', coll_dict)  # 获得message函数的输入参数，也就是x_i, x_j
-        edge_feature = self.message(**msg_kwargs)  # 消息传递   
+        # x_i为消息汇聚的节点: source_to_target时是edges_indices[1]
+        if self.flow == "source_to_target":
+            index_i, index_j = edges_indices[1], edges_indices[0]
+        else:
+            index_i, index_j = edges_indices[0], edges_indices[1]
+        edge_feature = self.message(descriptor.index_select(0, index_i), descriptor.index_select(0, index_j))
         return edge_feature
     
     def message(self, x_i, x_j):
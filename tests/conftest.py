@@ -0,0 +1,49 @@
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# the same import roots as main.py: the repository for src.* / utils.*, ./src for the model code
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, 'src')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+CLASSES = ['chair', 'table', 'floor', 'wall', 'lamp', 'sofa']
+RELATIONS = ['none', 'standing on', 'attached to', 'close by']
+
+
+def make_relationships(seed, num_scans=5, max_objects=8):
+    '''a relationships_*.json: 2 splits per scan, some relationships naming unknown relations or objects'''
+    rng = np.random.RandomState(seed)
+    scans = []
+    for s in range(num_scans):
+        ids = sorted(rng.choice(np.arange(1, 40), rng.randint(2, max_objects + 1), replace=False).tolist())
+        for split in range(2):
+            objects = {str(i): CLASSES[rng.randint(len(CLASSES))] for i in ids}
+            relationships = []
+            for _ in range(rng.randint(0, 8)):
+                sub, obj = rng.choice(ids + [99], 2, replace=False).tolist()
+                rel = rng.randint(len(RELATIONS) + 1)
+                name = RELATIONS[rel] if rel < len(RELATIONS) else 'unknown'
+                relationships.append([sub, obj, rel, name])
+            scans.append({'scan': 'scan{:02d}'.format(s), 'split': split, 'objects': objects, 'relationships': relationships})
+    return {'scans': scans}
+
+
+@pytest.fixture
+def ssg_root(tmp_path):
+    '''a 3DSSG root folder with class / relation lists, scan splits and relationship jsons'''
+    root = tmp_path / '3DSSG_subset'
+    root.mkdir()
+    (root / 'classes.txt').write_text('\n'.join(CLASSES) + '\n')
+    (root / 'relationships.txt').write_text('\n'.join(RELATIONS) + '\n')
+    for i, split in enumerate(['train', 'validation']):
+        data = make_relationships(i)
+        scans = sorted({scan['scan'] for scan in data['scans']})
+        (root / '{}_scans.txt'.format(split)).write_text('\n'.join(scans[:-1]) + '\n')
+        with open(str(root / 'relationships_{}.json'.format(split)), 'w') as f:
+            json.dump(data, f)
+    return str(root)
@@ -0,0 +1,110 @@
+from itertools import product
+
+import numpy as np
+import pytest
+import torch
+
+pytest.importorskip('trimesh')
+
+from src.dataset.dataset_ws import SSGDatasetWS
+from src.utils import op_utils
+from src.utils.config import Config
+
+CLASSES = ['chair', 'table', 'floor', 'wall', 'lamp']
+RELATIONS = ['none', 'standing on', 'attached to', 'close by']
+NUM_POINTS = 16
+
+
+def reference(dataset, points, instances, instance2labelName, rel_json, multi_rel_outputs):
+    '''the per-object / per-edge data_preparation the vectorized one replaces'''
+    all_instance = torch.unique(instances)
+    all_instance = all_instance[all_instance != 0]
+    obj_texts = [instance2labelName[i] for i in instance2labelName]
+    tri_texts = [(instance2labelName[r[0]], r[3], instance2labelName[r[1]]) for r in rel_json
+                 if r[0] in instance2labelName and r[1] in instance2labelName]
+    nodes = [i for i in instance2labelName if i in all_instance]
+    edge_indices = [i for i in product(range(len(nodes)), range(len(nodes))) if i[0] != i[1]]
+
+    label_node, origin_obj_points = [], []
+    obj_points = torch.zeros([len(nodes), NUM_POINTS, points.shape[-1]])
+    descriptor = torch.zeros([len(nodes), 11])
+    for i, instance_id in enumerate(nodes):
+        label_node.append(CLASSES.index(instance2labelName[instance_id]))
+        obj_pointset = points[torch.where(instances == instance_id)[0]]
+        origin_obj_points.append(obj_pointset)
+        choice = torch.randint(0, len(obj_pointset), (NUM_POINTS, ))
+        obj_pointset = obj_pointset[choice, :]
+        descriptor[i] = op_utils.gen_descriptor(obj_pointset[:, :3])
+        obj_pointset = obj_pointset.to(torch.float32)
+        obj_pointset[:, :3] = dataset.zero_mean(obj_pointset[:, :3])
+        obj_points[i] = obj_pointset
+
+    adj = torch.zeros([len(nodes), len(nodes), len(RELATIONS)]) if multi_rel_outputs else torch.zeros([len(nodes), len(nodes)])
+    for r in rel_json:
+        if r[0] not in nodes or r[1] not in nodes:
+            continue
+        rel = RELATIONS.index(r[3])
+        if multi_rel_outputs:
+            adj[nodes.index(r[0]), nodes.index(r[1]), rel] = 1
+        else:
+            adj[nodes.index(r[0]), nodes.index(r[1])] = rel
+    if multi_rel_outputs:
+        gt_rels = torch.stack([adj[a, b] for a, b in edge_indices]) if edge_indices else torch.zeros(0, len(RELATIONS))
+    else:
+        gt_rels = torch.tensor([int(adj[a, b]) for a, b in edge_indices], dtype=torch.long)
+    return obj_points, gt_rels, torch.tensor(label_node), torch.tensor(edge_indices, dtype=torch.long).reshape(-1, 2), \
+        descriptor, origin_obj_points, obj_texts, tri_texts
+
+
+def make_scene(seed):
+    '''a mesh whose instances are partly annotated, and annotations naming instances missing from the mesh'''
+    rng = np.random.RandomState(seed)
+    mesh_ids = rng.choice(np.arange(1, 30), rng.randint(1, 9), replace=False)
+    instances = rng.choice(np.concatenate([[0], mesh_ids]), 400)
+    instances[:len(mesh_ids)] = mesh_ids  # every instance of the mesh has a point
+    points = torch.from_numpy(rng.rand(400, 6).astype(np.float32))
+    annotated = rng.choice(np.concatenate([mesh_ids, [31, 32]]), rng.randint(1, len(mesh_ids) + 2), replace=False)
+    instance2labelName = {int(i): CLASSES[rng.randint(len(CLASSES))] for i in annotated}
+    ids = list(instance2labelName) + [99]
+    rel_json = []
+    for _ in range(rng.randint(0, 12)):
+        sub, obj = rng.choice(ids, 2, replace=False).tolist() if len(ids) > 1 else (ids[0], ids[0])
+        rel = rng.randint(len(RELATIONS))
+        rel_json.append([sub, obj, rel, RELATIONS[rel]])
+    return points, torch.from_numpy(instances.astype(np.int16)), instance2labelName, rel_json
+
+
+@pytest.fixture
+def dataset():
+    dataset = SSGDatasetWS.__new__(SSGDatasetWS)
+    dataset.config = Config({'use_pair_info': False})
+    dataset.mconfig = Config({'return_origin_points': True})
+    dataset.split = 'train_scans'
+    dataset.feats_store = None
+    dataset.object_labels = None
+    return dataset
+
+
+@pytest.mark.parametrize('multi_rel_outputs', [True, False])
+def test_matches_reference(dataset, multi_rel_outputs):
+    for seed in range(100):
+        points, instances, instance2labelName, rel_json = make_scene(seed)
+        instance2cls = {k: CLASSES.index(v) for k, v in instance2labelName.items()}
+        rel_table = np.array([r[:2] + [RELATIONS.index(r[3])] for r in rel_json], dtype=np.int64).reshape(-1, 3)
+
+        torch.manual_seed(seed)
+        expected = reference(dataset, points, instances, instance2labelName, rel_json, multi_rel_outputs)
+        torch.manual_seed(seed)
+        out = dataset.data_preparation(points, instances, NUM_POINTS, 0, instance2cls=instance2cls, rel_table=rel_table,
+                                       relationships=RELATIONS, multi_rel_outputs=multi_rel_outputs)
+        obj_points, _, gt_rels, label_node, edge_indices, descriptor, origin_obj_points, obj_texts, tri_texts = out[:9]
+
+        exp_points, exp_rels, exp_label, exp_edges, exp_descriptor, exp_origin, exp_obj_texts, exp_tri_texts = expected
+        assert torch.equal(obj_points, exp_points)
+        assert torch.equal(gt_rels, exp_rels)
+        assert torch.equal(label_node, exp_label)
+        assert torch.equal(edge_indices, exp_edges)
+        assert torch.equal(descriptor, exp_descriptor)
+        assert len(origin_obj_points) == len(exp_origin) and all(torch.equal(a, b) for a, b in zip(origin_obj_points, exp_origin))
+        assert [CLASSES[c] for c in obj_texts.tolist()] == exp_obj_texts
+        assert [(CLASSES[s], RELATIONS[r], CLASSES[o]) for s, r, o in tri_texts.tolist()] == exp_tri_texts
@@ -0,0 +1,69 @@
+import json
+import os
+import pickle
+
+import numpy as np
+import pytest
+import torch
+
+pytest.importorskip('trimesh')  # pack_multi_view_feats reads the relationships through dataset_ws
+
+from process_data.pack_multi_view_feats import MULTI_VIEW_FILE, pack
+from src.dataset.feature_store import FeatureStore
+from src.utils.config import Config
+
+
+@pytest.fixture
+def packed(tmp_path, ssg_root):
+    '''the per-object .npy features of the training scans, and their packed store'''
+    multi_view_root = tmp_path / 'multi_view'
+    with open(os.path.join(ssg_root, 'relationships_train.json')) as f:
+        data = json.load(f)
+    rng = np.random.RandomState(0)
+    feats = dict()
+    for scan in data['scans']:
+        for instance_id in scan['objects']:
+            key = (scan['scan'], int(instance_id))
+            if key in feats:
+                continue
+            feats[key] = rng.randn(1, 16).astype(np.float32)
+            pth = multi_view_root / MULTI_VIEW_FILE.format(*key)
+            pth.parent.mkdir(parents=True, exist_ok=True)
+            np.save(str(pth), feats[key])
+    config = Config({'multi_view_root': str(multi_view_root),
+                     'dataset': Config({'root': ssg_root, 'selection': '', 'cache_path': '', 'use_rio27_dataset': False})})
+    pack(config, 'train_scans')
+    return os.path.join(ssg_root, 'cache'), feats
+
+
+def test_round_trip(packed):
+    cache_path, feats = packed
+    store = FeatureStore(cache_path, 'train_scans')
+    assert len(store.rows) > 0
+    for scan_id in sorted(store.rows):
+        instance_ids = sorted(store.rows[scan_id])[::-1]
+        out = store.get(scan_id, instance_ids)
+        assert out.dtype == torch.float32 and out.shape == (len(instance_ids), 16)
+        expected = np.concatenate([feats[(scan_id, i)] for i in instance_ids]).astype(np.float16)
+        np.testing.assert_array_equal(out.numpy(), expected.astype(np.float32))
+
+
+def test_fp16_and_pickle(packed):
+    cache_path, _ = packed
+    store = FeatureStore(cache_path, 'train_scans', upcast=False)
+    scan_id = next(iter(store.rows))
+    ids = list(store.rows[scan_id])
+    out = store.get(scan_id, ids)
+    assert out.dtype == torch.float16
+    copy = pickle.loads(pickle.dumps(store))
+    assert copy._feats is None
+    assert torch.equal(copy.get(scan_id, ids), out)
+
+
+def test_missing_instance(packed):
+    cache_path, _ = packed
+    store = FeatureStore(cache_path, 'train_scans')
+    with pytest.raises(RuntimeError):
+        store.get(next(iter(store.rows)), [0])
+    with pytest.raises(RuntimeError):
+        FeatureStore(cache_path, 'validation_scans')
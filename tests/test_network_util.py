@@ -0,0 +1,109 @@
+import pytest
+import torch
+
+pytest.importorskip('torch_scatter')
+
+from process_data.benchmark_index_ops import MPAggre_Index, MPGen_edge_descriptor, MPGen_Index
+from src.model.model_utils.network_util import (Aggre_Index, Gen_Index, distance_bias, edge_batch_ids, padding_mask,
+                                                 scene_mask, to_block_diagonal)
+from src.utils.op_utils import Gen_edge_descriptor
+
+HEADS = 4
+
+
+def make_scenes(seed):
+    g = torch.Generator().manual_seed(seed)
+    ns = torch.randint(1, 8, (int(torch.randint(1, 6, (1,), generator=g)),), generator=g)
+    batch_ids = torch.cat([torch.full((int(n),), i) for i, n in enumerate(ns)]).view(-1, 1)
+    return ns, batch_ids, torch.randn(len(batch_ids), 3, generator=g)
+
+
+def reference(ns, batch_ids, obj_center, fc):
+    '''the former per-scene loop: block diagonal distance weights and object / relation / rel->obj masks'''
+    N_K, N_R = len(batch_ids), int((ns * (ns - 1)).sum())
+    obj_mask, rel_mask, rel_to_obj_mask = torch.zeros(1, 1, N_K, N_K), torch.zeros(1, 1, N_R, N_R), torch.zeros(1, 1, N_R, N_K)
+    weight = torch.zeros(1, HEADS, N_K, N_K)
+    count, count_rel = 0, 0
+    for i in range(len(ns)):
+        idx_i = torch.where(batch_ids == i)[0]
+        L = len(idx_i)
+        obj_mask[:, :, count:count + L, count:count + L] = 1
+        rel_mask[:, :, count_rel:count_rel + L * (L - 1), count_rel:count_rel + L * (L - 1)] = 1
+        rel_to_obj_mask[:, :, count_rel:count_rel + L * (L - 1), count:count + L] = 1
+        center_A = obj_center[None, idx_i, :].clone().detach().repeat(L, 1, 1)
+        center_B = obj_center[idx_i, None, :].clone().detach().repeat(1, L, 1)
+        center_dist = center_A - center_B
+        dist = torch.sqrt(torch.sum(center_dist ** 2, dim=-1))[:, :, None]
+        weights = torch.cat([center_dist, dist], dim=-1).unsqueeze(0)
+        weight[:, :, count:count + L, count:count + L] = fc(weights).permute(0, 3, 1, 2)
+        count += L
+        count_rel += L * (L - 1)
+    return weight, obj_mask, rel_mask, rel_to_obj_mask
+
+
+@pytest.fixture
+def fc():
+    torch.manual_seed(0)
+    return torch.nn.Sequential(torch.nn.Linear(4, 32), torch.nn.ReLU(), torch.nn.LayerNorm(32), torch.nn.Linear(32, HEADS))
+
+
+def test_masks_and_distance_bias(fc):
+    for seed in range(30):
+        ns, batch_ids, obj_center = make_scenes(seed)
+        weight, obj_mask, rel_mask, rel_to_obj_mask = reference(ns, batch_ids, obj_center, fc)
+        node_mask = padding_mask(batch_ids)
+        edge_ids = edge_batch_ids(node_mask, rel_mask.shape[2])
+        assert torch.equal(scene_mask(batch_ids, batch_ids).float(), obj_mask)
+        assert torch.equal(scene_mask(edge_ids, edge_ids).float(), rel_mask)
+        assert torch.equal(scene_mask(edge_ids, batch_ids).float(), rel_to_obj_mask)
+
+        bias = distance_bias(obj_center, node_mask, fc)
+        assert bias.shape == (len(ns), HEADS, int(ns.max()), int(ns.max()))
+        assert torch.allclose(to_block_diagonal(bias, node_mask, len(batch_ids)), weight, atol=1e-6)
+        # the padded bias of a scene is its block
+        count = 0
+        for i, n in enumerate(ns.tolist()):
+            assert torch.allclose(bias[i, :, :n, :n], weight[0, :, count:count + n, count:count + n], atol=1e-6)
+            count += n
+
+
+def test_distance_bias_gradients(fc):
+    ns, batch_ids, obj_center = make_scenes(3)
+    weight = reference(ns, batch_ids, obj_center, fc)[0]
+    bias = to_block_diagonal(distance_bias(obj_center, padding_mask(batch_ids), fc), padding_mask(batch_ids), len(batch_ids))
+    w = torch.arange(weight.numel(), dtype=torch.float).view_as(weight).sin()
+    expected = torch.autograd.grad((weight * w).sum(), fc[0].weight)[0]
+    assert torch.allclose(torch.autograd.grad((bias * w).sum(), fc[0].weight)[0], expected, atol=1e-4)
+
+
+@pytest.fixture
+def graph():
+    '''random edges over 12 nodes, a few of them without edges, and rows of positive descriptors'''
+    g = torch.Generator().manual_seed(0)
+    edge_index = torch.randint(0, 10, (2, 40), generator=g)
+    edge_index = edge_index[:, edge_index[0] != edge_index[1]]
+    return edge_index, torch.randn(12, 8, generator=g), torch.rand(12, 11, generator=g) + 0.1
+
+
+@pytest.mark.parametrize('flow', ['target_to_source', 'source_to_target'])
+def test_gen_index_matches_message_passing(flow, graph):
+    edge_index, x, _ = graph
+    for a, b in zip(Gen_Index(flow=flow)(x, edge_index), MPGen_Index(flow=flow)(x, edge_index)):
+        assert torch.equal(a, b)
+
+
+@pytest.mark.parametrize('flow', ['target_to_source', 'source_to_target'])
+@pytest.mark.parametrize('aggr', ['add', 'mean', 'max'])
+def test_aggre_index_matches_message_passing(flow, aggr, graph):
+    edge_index, _, _ = graph
+    edge = torch.randn(edge_index.shape[1], 8, generator=torch.Generator().manual_seed(1))
+    out = Aggre_Index(aggr=aggr, flow=flow)(edge, edge_index, dim_size=12)
+    assert torch.allclose(out, MPAggre_Index(aggr=aggr, flow=flow)(edge, edge_index, dim_size=12), atol=1e-6)
+
+
+@pytest.mark.parametrize('flow', ['target_to_source', 'source_to_target'])
+def test_gen_edge_descriptor_matches_message_passing(flow, graph):
+    edge_index, _, descriptor = graph
+    out = Gen_edge_descriptor(flow=flow)(descriptor, edge_index)
+    assert out.shape == (edge_index.shape[1], 11, 1)
+    assert torch.equal(out, MPGen_edge_descriptor(flow=flow)(descriptor, edge_index))
@@ -0,0 +1,96 @@
+import pytest
+import torch
+
+from src.model.model_utils.object_label import MODES, match_object_labels, sinkhorn_plan
+
+NUM_CLASSES, DIM = 30, 16
+
+
+def make_batch(seed, max_texts=14, more_objects=False):
+    '''normalized object features, [N, 1] batch ids, class indices of every scene and normalized text features'''
+    g = torch.Generator().manual_seed(seed)
+    text_feature = torch.randn(NUM_CLASSES, DIM, generator=g)
+    text_feature = text_feature / text_feature.norm(dim=1, keepdim=True)
+    feats, batch_ids, obj_texts = [], [], []
+    for b in range(int(torch.randint(1, 6, (1,), generator=g))):
+        texts = torch.randint(0, NUM_CLASSES, (int(torch.randint(1, max_texts, (1,), generator=g)),), generator=g)
+        if more_objects:  # fewer classes than objects: every object of the scene but a few share a class
+            texts[len(texts) // 2:] = texts[0]
+        n = len(texts) if more_objects else int(torch.randint(1, len(texts) + 1, (1,), generator=g))
+        obj_texts.append(texts)
+        feats.append(torch.randn(n, DIM, generator=g))
+        batch_ids.append(torch.full((n, 1), b))
+    feats = torch.cat(feats)
+    return feats / feats.norm(dim=1, keepdim=True), torch.cat(batch_ids), obj_texts, text_feature
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_one_label_per_object(mode):
+    for seed in range(50):
+        feats, batch_ids, obj_texts, text_feature = make_batch(seed, more_objects=True)
+        labels = match_object_labels(mode, feats, batch_ids, obj_texts, text_feature, torch.tensor(100.))
+        assert labels.shape == (len(feats),)
+        for b, texts in enumerate(obj_texts):
+            assert set(labels[batch_ids.view(-1) == b].tolist()) <= set(texts.tolist())
+
+
+@pytest.mark.parametrize('mode', ['hungarian', 'hungarian_plus'])
+def test_hungarian_more_objects_than_classes(mode):
+    for seed in range(50):
+        feats, batch_ids, obj_texts, text_feature = make_batch(seed, more_objects=True)
+        labels = match_object_labels(mode, feats, batch_ids, obj_texts, text_feature, torch.tensor(100.))
+        for b, texts in enumerate(obj_texts):
+            scene = labels[batch_ids.view(-1) == b]
+            classes = torch.unique(texts)
+            # every class of the scene is matched to one object, the others take their most similar class
+            assert set(scene.tolist()) == set(classes.tolist())
+            logits = feats[batch_ids.view(-1) == b] @ text_feature[classes].t()
+            best = classes[logits.argmax(1)]
+            assert (scene != best).sum() <= len(classes)
+
+
+def test_hungarian_is_one_to_one():
+    for seed in range(50):
+        feats, batch_ids, obj_texts, text_feature = make_batch(seed)
+        labels = match_object_labels('hungarian', feats, batch_ids, obj_texts, text_feature, torch.tensor(100.))
+        for b, texts in enumerate(obj_texts):
+            scene = labels[batch_ids.view(-1) == b]
+            if len(scene) <= len(torch.unique(texts)):
+                assert len(set(scene.tolist())) == len(scene)
+
+
+def test_sinkhorn_marginals():
+    g = torch.Generator().manual_seed(0)
+    B, N, C = 8, 7, 10
+    logits = 5 * torch.randn(B, N, C, generator=g)
+    num_objs = torch.randint(1, N + 1, (B,), generator=g)
+    obj_valid = torch.arange(N) < num_objs.unsqueeze(1)
+    cls_valid = torch.rand(B, C, generator=g) < 0.6
+    cls_valid[:, 0] = True
+    plan = sinkhorn_plan(logits, obj_valid, cls_valid, 500).exp()
+    rows, cols = plan.sum(2), plan.sum(1)
+    # every object and class carries a mass of 1, the dummies the difference
+    assert torch.allclose(rows[:, :N], obj_valid.float(), atol=1e-3)
+    assert torch.allclose(cols[:, :C], cls_valid.float(), atol=1e-3)
+    assert torch.allclose(rows[:, N], (cls_valid.sum(1) - num_objs).clamp(min=0).float(), atol=1e-3)
+    assert torch.allclose(cols[:, C], (num_objs - cls_valid.sum(1)).clamp(min=0).float(), atol=1e-3)
+
+
+@pytest.mark.parametrize('more_objects', [True, False])
+def test_sinkhorn_matches_hungarian_plus(more_objects):
+    # objects close to the text feature of their class, the classes of a scene shared only when it has
+    # more objects: the assignment is clear cut
+    for seed in range(20):
+        _, batch_ids, obj_texts, text_feature = make_batch(seed, more_objects=more_objects)
+        g = torch.Generator().manual_seed(seed)
+        feats = []
+        for b, texts in enumerate(obj_texts):
+            n = int((batch_ids.view(-1) == b).sum())
+            classes = torch.unique(texts)
+            classes = classes[torch.randperm(len(classes), generator=g)]
+            feats.append(text_feature[classes[torch.arange(n) % len(classes)]])
+        feats = torch.cat(feats)
+        feats = feats + 0.05 * torch.randn(feats.shape, generator=g)
+        feats = feats / feats.norm(dim=1, keepdim=True)
+        expected = match_object_labels('hungarian_plus', feats, batch_ids, obj_texts, text_feature, torch.tensor(100.))
+        assert torch.equal(match_object_labels('sinkhorn', feats, batch_ids, obj_texts, text_feature, torch.tensor(100.)), expected)
@@ -0,0 +1,54 @@
+import pytest
+import torch
+
+from src.dataset.object_label_store import ObjectLabelStore, get_object_label_mode, scene_hash
+from src.utils.config import Config
+
+CLASSES = ['chair', 'table', 'floor']
+
+
+@pytest.fixture
+def scenes():
+    g = torch.Generator().manual_seed(0)
+    return {'scan{}_0'.format(i): (torch.randn(n, 8, generator=g), torch.randint(0, 3, (n,), generator=g))
+            for i, n in enumerate([3, 1, 5])}
+
+
+@pytest.fixture
+def store_path(tmp_path, scenes):
+    names = list(scenes)
+    hashes = [scene_hash(*scenes[name]) for name in names]
+    labels = [texts.numpy()[::-1] for _, texts in scenes.values()]
+    ObjectLabelStore.save(str(tmp_path), 'train_scans', 'hungarian', CLASSES, names, hashes, labels)
+    return str(tmp_path)
+
+
+def test_round_trip(store_path, scenes):
+    store = ObjectLabelStore(store_path, 'train_scans', 'hungarian', CLASSES)
+    for name, (feats, texts) in scenes.items():
+        assert store.get(name, feats, texts).tolist() == texts.tolist()[::-1]
+
+
+def test_outdated_scene_warns(store_path, scenes):
+    store = ObjectLabelStore(store_path, 'train_scans', 'hungarian', CLASSES)
+    feats, texts = scenes['scan0_0']
+    with pytest.warns(UserWarning, match='outdated'):
+        assert store.get('scan0_0', feats + 1, texts).tolist() == [-1] * len(feats)
+    with pytest.warns(UserWarning, match='outdated'):
+        assert store.get('scan0_0', feats, (texts + 1) % 3).tolist() == [-1] * len(feats)
+    with pytest.warns(UserWarning, match='missing'):
+        assert store.get('scan9_0', feats, texts).tolist() == [-1] * len(feats)
+
+
+def test_other_mode_or_classes(store_path):
+    with pytest.raises(RuntimeError):
+        ObjectLabelStore(store_path, 'train_scans', 'argmax', CLASSES)
+    with pytest.raises(RuntimeError):
+        ObjectLabelStore(store_path, 'train_scans', 'hungarian', CLASSES[::-1])
+
+
+def test_mode_of_config():
+    assert get_object_label_mode(Config({'use_hungarian': False})) == 'argmax'
+    assert get_object_label_mode(Config({'use_hungarian': 'sinkhorn'})) == 'sinkhorn'
+    assert get_object_label_mode(Config({'use_hungarian': True, 'use_object_num': True})) == 'hungarian'
+    assert get_object_label_mode(Config({'use_hungarian': True, 'use_object_num': False})) == 'hungarian_plus'
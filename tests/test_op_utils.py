@@ -0,0 +1,48 @@
+from itertools import product
+
+import pytest
+import torch
+
+from src.utils import op_utils
+
+
+def scene_edges(n):
+    '''the edges of a fully connected scene, in the order of the datasets'''
+    return torch.tensor([e for e in product(range(n), range(n)) if e[0] != e[1]], dtype=torch.long).view(-1, 2)
+
+
+def test_edge_endpoints_dataset_order():
+    for n in range(1, 12):
+        edges = scene_edges(n)
+        sub, obj = op_utils.edge_endpoints(torch.arange(len(edges)), n)
+        assert torch.equal(torch.stack([sub, obj], 1), edges)
+
+
+def test_edge_endpoints_batch():
+    # [B, L_max] padded edges of the scenes, num_nodes broadcast per scene as in the batched matcher
+    ns = torch.tensor([3, 1, 6, 2])
+    L = ns * (ns - 1)
+    sub, obj = op_utils.edge_endpoints(torch.arange(int(L.max())).unsqueeze(0), ns.unsqueeze(1))
+    for i, n in enumerate(ns.tolist()):
+        assert torch.equal(torch.stack([sub[i, :L[i]], obj[i, :L[i]]], 1), scene_edges(n))
+
+
+@pytest.mark.parametrize('flow', ['target_to_source', 'source_to_target'])
+def test_edge_endpoints_gen_index(flow):
+    network_util = pytest.importorskip('src.model.model_utils.network_util')
+    ns = [3, 5, 1, 4]
+    offsets = torch.tensor([0] + ns[:-1]).cumsum(0)
+    # the edge_indices of a batch, collated with the node offset of every scene
+    edge_indices = torch.cat([scene_edges(n) + off for n, off in zip(ns, offsets.tolist())]).t().contiguous()
+    x = torch.arange(sum(ns), dtype=torch.float).unsqueeze(1)
+    x_i, x_j = network_util.Gen_Index(flow=flow)(x, edge_indices)
+
+    sub, obj = [], []
+    for n, off in zip(ns, offsets.tolist()):
+        s, o = op_utils.edge_endpoints(torch.arange(n * (n - 1)), n)
+        sub.append(s + off)
+        obj.append(o + off)
+    sub, obj = torch.cat(sub).float(), torch.cat(obj).float()
+    if flow == 'source_to_target':
+        sub, obj = obj, sub
+    assert torch.equal(x_i.view(-1), sub) and torch.equal(x_j.view(-1), obj)
@@ -0,0 +1,76 @@
+import torch
+
+from src.model.model_utils.rel_label_store import RelLabelStore
+
+NUM_REL = 8
+
+
+class Matcher(object):
+    '''a match_fn whose labels tell the call and the number of triplets of the scene they come from'''
+    def __init__(self, num_edges):
+        self.num_edges = num_edges
+        self.calls = []
+
+    def __call__(self, tri_texts):
+        self.calls.append([len(t) for t in tri_texts])
+        return torch.cat([self.labels(len(self.calls), len(t), e) for t, e in zip(tri_texts, self.num_edges)])
+
+    @staticmethod
+    def labels(call, num_tris, num_edges):
+        out = torch.zeros(num_edges, NUM_REL)
+        out[:, (call + num_tris) % NUM_REL] = 1.0
+        return out
+
+
+def make_batch(seed, num_edges):
+    g = torch.Generator().manual_seed(seed)
+    tri_texts = [torch.zeros(i + 1, 3, dtype=torch.long) for i in range(len(num_edges))]
+    return tri_texts, torch.randn(sum(num_edges), 16, generator=g)
+
+
+def test_reuse_and_partial_match():
+    num_edges = [6, 2, 12]
+    tri_texts, edge_fea = make_batch(0, num_edges)
+    store, match_fn = RelLabelStore(), Matcher(num_edges)
+    first = store.match(match_fn, [0, 1, 2], 0, tri_texts, edge_fea, num_edges)
+    assert torch.equal(first, torch.cat([Matcher.labels(1, len(t), e) for t, e in zip(tri_texts, num_edges)]))
+    assert torch.equal(store.match(match_fn, [0, 1, 2], 1, tri_texts, edge_fea, num_edges), first)
+    assert len(match_fn.calls) == 1
+
+    # sample 3 is new: only its triplets are matched, the others keep their labels
+    out = store.match(match_fn, [0, 3, 2], 1, tri_texts, edge_fea, num_edges)
+    assert match_fn.calls[-1] == [0, 2, 0]
+    assert torch.equal(out[6:8], Matcher.labels(2, 2, 2))
+    assert torch.equal(out[:6], first[:6]) and torch.equal(out[8:], first[8:])
+    assert store.logs()[0] == ("Label/rel_store_hit_rate", 5 / 9)
+    assert store.logs()[0] == ("Label/rel_store_hit_rate", 0.0)
+
+
+def test_refresh_epochs():
+    num_edges = [6, 2]
+    tri_texts, edge_fea = make_batch(0, num_edges)
+    store, match_fn = RelLabelStore(refresh_epochs=2), Matcher(num_edges)
+    for epoch in range(5):
+        store.match(match_fn, [0, 1], epoch, tri_texts, edge_fea, num_edges)
+    assert len(match_fn.calls) == 3  # epochs 0, 2 and 4
+
+
+def test_drift_and_edge_count():
+    num_edges = [6, 2]
+    tri_texts, edge_fea = make_batch(0, num_edges)
+    store, match_fn = RelLabelStore(drift_threshold=0.1), Matcher(num_edges)
+    store.match(match_fn, [0, 1], 0, tri_texts, edge_fea, num_edges)
+    # the sketches are normalized: scaled features have not drifted
+    store.match(match_fn, [0, 1], 0, tri_texts, 3 * edge_fea, num_edges)
+    assert len(match_fn.calls) == 1
+    moved = edge_fea.clone()
+    moved[:6] = make_batch(1, num_edges)[1][:6]
+    store.match(match_fn, [0, 1], 0, tri_texts, moved, num_edges)
+    assert match_fn.calls[-1] == [1, 0]
+
+    # another number of edges for a sample id is matched again
+    num_edges = [6, 12]
+    edge_fea = torch.cat([moved[:6], make_batch(2, [12])[1]])
+    match_fn.num_edges = num_edges
+    out = store.match(match_fn, [0, 1], 0, tri_texts, edge_fea, num_edges)
+    assert match_fn.calls[-1] == [0, 2] and out.shape == (18, NUM_REL)
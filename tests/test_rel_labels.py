@@ -0,0 +1,137 @@
+from itertools import product
+from types import SimpleNamespace
+
+import pytest
+import torch
+
+pytest.importorskip('clip')
+pytest.importorskip('torch_scatter')
+
+from src.model.SGFN_MMG.model_ws import Mmgnet
+from src.utils.config import Config
+
+NUM_CLASSES, NUM_REL, DIM = 4, 5, 16
+
+
+def get_match(fea_0, fea_1, logit_scale):
+    fea_0 = fea_0 / fea_0.norm(dim=-1, keepdim=True)
+    fea_1 = fea_1 / fea_1.norm(dim=-1, keepdim=True)
+    return torch.sigmoid(logit_scale * fea_0 @ fea_1.t()).squeeze(0)
+
+
+def reference(tri_texts, batch_ids, obj_features, relation_fea, obj_label, tri_table, logit_scale, way, stable=False):
+    '''
+    the former per-scene, per-triplet get_rel_label (obj_label) / get_rel_label_no_mask (None), and
+    whether a triplet had tied scores at the boundary of the candidates it labels
+    '''
+    rel_label, tied, edge_init_idx = [], False, 0
+    for i, tris in enumerate(tri_texts):
+        idx = batch_ids.view(-1) == i
+        obj_feature_temp = obj_features[idx]
+        n = int(idx.sum())
+        edge_indices = [k for k in product(range(n), range(n)) if k[0] != k[1]]
+        L = len(edge_indices)
+        rel_feature_temp = relation_fea[edge_init_idx:edge_init_idx + L] if relation_fea is not None else None
+        temp_rel_label = torch.zeros(L, NUM_REL)
+        counts = dict()
+        for tri in map(tuple, tris.tolist()):
+            counts[tri] = counts.get(tri, 0) + 1
+        for tri, num in counts.items():
+            if obj_label is not None:
+                obj_label_i = obj_label[idx]
+                sub_fea_idx = torch.where(obj_label_i == tri[0])[0]
+                obj_fea_idx = torch.where(obj_label_i == tri[2])[0]
+                if len(sub_fea_idx) == 0 or len(obj_fea_idx) == 0:
+                    continue
+                if len(sub_fea_idx) == len(obj_fea_idx) == 1:
+                    if tri[0] != tri[2]:
+                        temp_rel_label[edge_indices.index((int(sub_fea_idx[0]), int(obj_fea_idx[0]))), tri[1]] = 1.0
+                    continue
+                edge_idx = [edge_indices.index((int(s), int(o))) for s, o in product(sub_fea_idx, obj_fea_idx) if s != o]
+                edge_temp = list(product(range(len(sub_fea_idx)), range(len(obj_fea_idx))))
+                if tri[0] == tri[2]:
+                    edge_temp = [k for k in edge_temp if k[0] != k[1]]
+                sub_fea, obj_fea = obj_feature_temp[sub_fea_idx], obj_feature_temp[obj_fea_idx]
+            else:
+                edge_idx, edge_temp = list(range(L)), edge_indices
+                sub_fea, obj_fea = obj_feature_temp, obj_feature_temp
+            if not edge_idx:
+                continue
+
+            tri_fea = tri_table[tri].unsqueeze(0)
+            if relation_fea is None:
+                # the mean of the subject and object similarities
+                sub_logits, obj_logits = get_match(tri_fea, sub_fea.half(), logit_scale), get_match(tri_fea, obj_fea.half(), logit_scale)
+                triplet_logits = torch.stack([(sub_logits[a] + obj_logits[b]) / 2 for a, b in edge_temp])
+            else:
+                triplet_fea = []
+                for k, e in enumerate(edge_idx):
+                    a, b = edge_temp[k]
+                    if way == 'mean':
+                        t = (sub_fea[a] + rel_feature_temp[e] + obj_fea[b]) / 3
+                    elif way == 'max':
+                        t = torch.max(torch.vstack([sub_fea[a], rel_feature_temp[e], obj_fea[b]]), dim=0)[0]
+                    else:
+                        t = rel_feature_temp[e]
+                    triplet_fea.append(t)
+                triplet_logits = get_match(tri_fea, torch.vstack(triplet_fea).half(), logit_scale)
+            scores, tri_index = torch.sort(triplet_logits.float(), stable=stable)
+            tied |= num < len(scores) and bool(scores[num - 1] == scores[num])
+            for k in tri_index[:num].tolist():
+                temp_rel_label[edge_idx[k], tri[1]] = 1.0
+        rel_label.append(temp_rel_label)
+        edge_init_idx += L
+    return torch.cat(rel_label), tied
+
+
+def make_model(tri_table, logit_scale, way):
+    model = Mmgnet.__new__(Mmgnet)
+    torch.nn.Module.__init__(model)
+    model.mconfig = Config({'use_shape_trick': False, 'triplet_fea_get_way': way, 'use_pair_match': False})
+    model.num_rel = NUM_REL
+    model.text_embeddings = SimpleNamespace(logit_scale=logit_scale.log())
+    # the text embeddings of the triplets, in place of CLIP
+    model.encode_triplets = lambda tris: torch.stack([tri_table[tuple(t)] for t in tris])
+    return model
+
+
+def make_batch(seed):
+    g = torch.Generator().manual_seed(seed)
+    ns = torch.randint(1, 7, (int(torch.randint(1, 4, (1,), generator=g)),), generator=g).tolist()
+    batch_ids = torch.cat([torch.full((n, 1), b) for b, n in enumerate(ns)])
+    obj_features = torch.randn(len(batch_ids), DIM, generator=g)
+    relation_fea = torch.randn(sum(n * (n - 1) for n in ns), DIM, generator=g)
+    obj_label = torch.randint(0, NUM_CLASSES, (len(batch_ids),), generator=g)
+    tri_texts = [torch.stack([torch.randint(0, NUM_CLASSES, (t,), generator=g), torch.randint(0, NUM_REL, (t,), generator=g),
+                              torch.randint(0, NUM_CLASSES, (t,), generator=g)], dim=1)
+                 for t in torch.randint(0, 8, (len(ns),), generator=g).tolist()]
+    return tri_texts, batch_ids, obj_features, relation_fea, obj_label
+
+
+@pytest.mark.parametrize('use_relation_fea, way', [(False, 'only_rel'), (True, 'only_rel'), (True, 'mean'), (True, 'max')])
+@pytest.mark.parametrize('use_obj_label', [True, False])
+def test_matches_per_scene_selection(use_relation_fea, way, use_obj_label):
+    g = torch.Generator().manual_seed(0)
+    tri_table = {tri: torch.randn(DIM, generator=g).half() for tri in product(range(NUM_CLASSES), range(NUM_REL), range(NUM_CLASSES))}
+    logit_scale = torch.tensor(2.0)
+    model = make_model(tri_table, logit_scale, way)
+    for seed in range(150):
+        tri_texts, batch_ids, obj_features, relation_fea, obj_label = make_batch(seed)
+        relation_fea = relation_fea if use_relation_fea else None
+        obj_label = obj_label if use_obj_label else None
+        args = tri_texts, batch_ids, obj_features, relation_fea, obj_label, tri_table, logit_scale, way
+        out = model.match_relation_labels(tri_texts, batch_ids, obj_features, relation_fea, obj_label=obj_label)
+        expected, tied = reference(*args)
+        if not tied:  # the former sort leaves the order of ties unspecified
+            assert torch.equal(out, expected), seed
+        # ties are taken in edge order
+        assert torch.equal(out, reference(*args, stable=True)[0]), seed
+
+
+def test_ties_in_edge_order():
+    tri_table = {(0, 1, 0): torch.ones(DIM).half()}
+    model = make_model(tri_table, torch.tensor(2.0), 'only_rel')
+    batch_ids = torch.zeros(4, 1, dtype=torch.long)
+    relation_fea = torch.ones(12, DIM)  # every edge scores the same
+    out = model.match_relation_labels([torch.tensor([[0, 1, 0]] * 5)], batch_ids, torch.ones(4, DIM), relation_fea)
+    assert out[:, 1].nonzero().view(-1).tolist() == [0, 1, 2, 3, 4]
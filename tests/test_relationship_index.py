@@ -0,0 +1,85 @@
+import json
+
+import numpy as np
+import pytest
+
+from conftest import CLASSES, RELATIONS, make_relationships
+from process_data.compute_weight_occurrences import compute
+from src.dataset.relationship_index import RelationshipIndex, get_index_file, load_relationship_index
+
+
+def scan_entries(index, i):
+    objects, relationships = index.objects(i), index.relationships(i)
+    objects = {str(k): str(index.obj_names[c]) for k, c in zip(objects['id'].tolist(), objects['cls'].tolist())}
+    relationships = [(s, o, str(index.rel_names[r])) for s, o, r in
+                     zip(relationships['sub'].tolist(), relationships['obj'].tolist(), relationships['rel'].tolist())]
+    return objects, relationships
+
+
+def test_from_json():
+    data = make_relationships(0)
+    index = RelationshipIndex.from_json(data)
+    assert len(index) == len(data['scans'])
+    assert index.names().tolist() == ['{}_{}'.format(s['scan'], s['split']) for s in data['scans']]
+    assert index.num_objects().tolist() == [len(s['objects']) for s in data['scans']]
+    for i, scan in enumerate(data['scans']):
+        objects, relationships = scan_entries(index, i)
+        assert objects == scan['objects']
+        assert relationships == [(r[0], r[1], r[3]) for r in scan['relationships']]
+
+
+def test_save_load(tmp_path):
+    data = make_relationships(1)
+    pth_json = str(tmp_path / 'relationships_train.json')
+    with open(pth_json, 'w') as f:
+        json.dump(data, f)
+    index = load_relationship_index(pth_json)
+    index.save(str(tmp_path / get_index_file(pth_json)))
+    loaded = load_relationship_index(pth_json, str(tmp_path))
+    assert loaded.fingerprint() == index.fingerprint()
+    for i in range(len(index)):
+        assert scan_entries(loaded, i) == scan_entries(index, i)
+    with pytest.raises(RuntimeError):
+        load_relationship_index(pth_json, str(tmp_path / 'missing'))
+
+
+def test_select():
+    data = make_relationships(2)
+    index = RelationshipIndex.from_json(data)
+    mask = np.random.RandomState(0).rand(len(index)) < 0.5
+    selected = index.select(mask)
+    assert len(selected) == mask.sum()
+    assert selected.names().tolist() == index.names()[mask].tolist()
+    for j, i in enumerate(np.nonzero(mask)[0]):
+        assert scan_entries(selected, j) == scan_entries(index, i)
+    assert len(index.select(np.zeros(len(index), dtype=bool))) == 0
+
+
+def test_count_occurrences():
+    data = make_relationships(3, num_scans=8)
+    index = RelationshipIndex.from_json(data)
+    selections = {'scan01', 'scan04', 'scan05'}
+    for sel in (None, selections):
+        o_obj_cls, o_rel_cls = index.count_occurrences(CLASSES, RELATIONS, sel)
+        _, _, exp_obj_cls, exp_rel_cls = compute(CLASSES, RELATIONS, json.loads(json.dumps(data)), sel)
+        np.testing.assert_array_equal(o_obj_cls, exp_obj_cls)
+        np.testing.assert_array_equal(o_rel_cls, exp_rel_cls)
+    with pytest.raises(RuntimeError):
+        index.count_occurrences(CLASSES[:-1], RELATIONS)
+
+
+def test_name_lookup():
+    index = RelationshipIndex.from_json(make_relationships(4))
+    lookup = index.name_lookup(RELATIONS, index.rel_names)
+    for i, name in enumerate(index.rel_names.tolist()):
+        assert lookup[i] == (RELATIONS.index(name) if name in RELATIONS else -1)
+
+
+def test_fingerprint():
+    data = make_relationships(5)
+    index = RelationshipIndex.from_json(data)
+    assert index.fingerprint() == RelationshipIndex.from_json(make_relationships(5)).fingerprint()
+    assert index.select(np.ones(len(index), dtype=bool)).fingerprint() == index.fingerprint()
+    assert index.select(np.arange(len(index)) > 0).fingerprint() != index.fingerprint()
+    data['scans'][0]['relationships'].append([1, 2, 1, RELATIONS[1]])
+    assert RelationshipIndex.from_json(data).fingerprint() != index.fingerprint()
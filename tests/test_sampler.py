@@ -0,0 +1,128 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+import torch
+from torch.utils.data import DataLoader, Dataset, get_worker_info
+
+from src.dataset.sampler import EdgeBudgetBatchSampler, ScanAffinityBatchSampler, group_by_scan
+from src.dataset.scan_cache import ScanLRU
+
+
+def make_scans(seed, num_scans, max_splits=6):
+    rng = np.random.RandomState(seed)
+    return ['scan{}_{}'.format(i, j) for i in rng.permutation(num_scans) for j in range(rng.randint(1, max_splits + 1))]
+
+
+def misplaced(scans, batches, num_workers):
+    '''samples not read by the worker which reads most of their scan, batch k going to worker k % num_workers'''
+    workers = dict()
+    for k, batch in enumerate(batches):
+        for i in batch:
+            workers.setdefault(scans[i].rsplit('_', 1)[0], []).append(k % num_workers)
+    return sum(len(w) - Counter(w).most_common(1)[0][1] for w in workers.values())
+
+
+def test_group_by_scan():
+    scans = make_scans(0, 20)
+    groups = group_by_scan(scans)
+    assert sorted(np.concatenate(groups).tolist()) == list(range(len(scans)))
+    for g in groups:
+        assert len({scans[i].rsplit('_', 1)[0] for i in g}) == 1
+    assert len(groups) == 20
+
+
+@pytest.mark.parametrize('num_workers', [1, 3, 4])
+@pytest.mark.parametrize('batch_size', [1, 4, 8])
+@pytest.mark.parametrize('drop_last', [True, False])
+def test_affinity_covers_every_sample(num_workers, batch_size, drop_last):
+    scans = make_scans(num_workers * batch_size, 50)
+    sampler = ScanAffinityBatchSampler(scans, batch_size, num_workers, shuffle=True, drop_last=drop_last)
+    for _ in range(3):
+        batches = list(sampler)
+        assert len(batches) == len(sampler)
+        flat = [i for batch in batches for i in batch]
+        assert len(set(flat)) == len(flat)
+        if drop_last:
+            assert all(len(batch) == batch_size for batch in batches)
+        else:
+            assert sorted(flat) == list(range(len(scans)))
+
+
+def test_affinity_equal_streams():
+    # every scan fills one batch and every worker gets as many scans: no sample leaves its worker
+    num_workers, batch_size = 4, 3
+    scans = ['scan{}_{}'.format(i, j) for i in range(8 * num_workers) for j in range(batch_size)]
+    batches = list(ScanAffinityBatchSampler(scans, batch_size, num_workers, shuffle=True))
+    assert misplaced(scans, batches, num_workers) == 0
+
+
+@pytest.mark.parametrize('num_workers, batch_size', [(4, 1), (4, 8), (16, 8)])
+def test_affinity_is_mostly_kept(num_workers, batch_size):
+    scans = make_scans(0, 1000)
+    batches = list(ScanAffinityBatchSampler(scans, batch_size, num_workers, shuffle=True, drop_last=True))
+    assert misplaced(scans, batches, num_workers) < 0.02 * len(scans)
+
+
+class WorkerIds(Dataset):
+    def __init__(self, num_samples):
+        self.num_samples = num_samples
+
+    def __len__(self):
+        return self.num_samples
+
+    def __getitem__(self, index):
+        return torch.tensor([index, get_worker_info().id])
+
+
+@pytest.mark.filterwarnings('ignore:This DataLoader will create')
+def test_affinity_with_dataloader():
+    num_workers = 2
+    scans = make_scans(1, 60, max_splits=3)
+    sampler = ScanAffinityBatchSampler(scans, 4, num_workers, shuffle=True)
+    np.random.seed(0)
+    expected = list(sampler)
+    np.random.seed(0)
+    loader = DataLoader(WorkerIds(len(scans)), batch_sampler=sampler, num_workers=num_workers)
+    for k, (batch, expected_batch) in enumerate(zip(loader, expected)):
+        assert batch[:, 0].tolist() == expected_batch
+        assert (batch[:, 1] == k % num_workers).all()
+
+
+@pytest.mark.parametrize('max_edges, max_objects', [(60, 0), (0, 20), (60, 20)])
+def test_edge_budget(max_edges, max_objects):
+    num_objects = np.random.RandomState(0).randint(1, 12, 300)
+    sampler = EdgeBudgetBatchSampler(num_objects, max_edges=max_edges, max_objects=max_objects)
+    for _ in range(3):
+        n = len(sampler)
+        batches = list(sampler)
+        assert len(batches) == n
+        assert sorted(i for batch in batches for i in batch) == list(range(len(num_objects)))
+        for batch in batches:
+            objects = num_objects[batch]
+            if len(batch) > 1:
+                assert not max_edges or (objects * (objects - 1)).sum() <= max_edges
+                assert not max_objects or objects.sum() <= max_objects
+    with pytest.raises(RuntimeError):
+        EdgeBudgetBatchSampler(num_objects)
+
+
+def test_edge_budget_large_scene_alone():
+    batches = list(EdgeBudgetBatchSampler([2, 30, 2], max_edges=100, shuffle=False))
+    assert batches == [[0], [1], [2]]
+
+
+def test_scan_lru():
+    def scan(n):
+        return {'points': np.zeros((n, 2), dtype=np.float32), 'instances': np.zeros(n, dtype=np.int16)}
+    lru = ScanLRU(max_bytes=100)  # a scan of n points takes 10 n bytes
+    lru.put('a', scan(4))
+    lru.put('b', scan(4))
+    assert lru.get('a') is not None  # b is now the least recently used
+    lru.put('c', scan(4))
+    assert lru.get('b') is None and lru.get('c') is not None and lru.get('a') is not None
+    assert lru.nbytes == 80 and (lru.hits, lru.misses) == (3, 1)
+    lru.put('d', scan(20))  # larger than the cache, not kept
+    assert lru.get('d') is None and lru.nbytes == 80
+    lru.put('a', scan(6))
+    assert lru.nbytes == 100 and lru.get('c') is not None
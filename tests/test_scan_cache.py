@@ -0,0 +1,74 @@
+import json
+import os
+import pickle
+import warnings
+
+import numpy as np
+import pytest
+import torch
+
+from src.dataset.scan_cache import INDEX_FILE, INSTANCES_FILE, POINTS_FILE, ScanCache
+
+LABEL_FILE = 'labels.instances.align.annotated.v2.ply'
+
+
+def write_cache(path, scans, use_rgb=False, use_normal=True):
+    '''the layout written by process_data/build_scan_cache.py'''
+    index = {'label_file': LABEL_FILE, 'use_rgb': use_rgb, 'use_normal': use_normal,
+             'dim_pts': 3 + 3 * int(use_rgb) + 3 * int(use_normal), 'num_points': 0, 'scans': dict()}
+    with open(os.path.join(path, POINTS_FILE), 'wb') as f_points, open(os.path.join(path, INSTANCES_FILE), 'wb') as f_instances:
+        for scan_id, (points, instances) in scans.items():
+            f_points.write(points.astype(np.float32).tobytes())
+            f_instances.write(instances.astype(np.int16).tobytes())
+            index['scans'][scan_id] = [index['num_points'], len(instances)]
+            index['num_points'] += len(instances)
+    with open(os.path.join(path, INDEX_FILE), 'w') as f:
+        json.dump(index, f)
+
+
+@pytest.fixture
+def scans(tmp_path):
+    rng = np.random.RandomState(0)
+    scans = {'scan_{}'.format(i): (rng.rand(n, 6).astype(np.float32), rng.randint(0, 5, n).astype(np.int16))
+             for i, n in enumerate([7, 1, 20])}
+    write_cache(str(tmp_path), scans)
+    return scans
+
+
+def test_round_trip(tmp_path, scans):
+    cache = ScanCache(str(tmp_path), LABEL_FILE, False, True)
+    for scan_id, (points, instances) in scans.items():
+        assert scan_id in cache
+        data = cache.load(scan_id)
+        np.testing.assert_array_equal(data['points'], points)
+        np.testing.assert_array_equal(data['instances'], instances)
+    assert 'scan_x' not in cache
+    with pytest.raises(RuntimeError):
+        cache.load('scan_x')
+
+
+def test_load_is_writable(tmp_path, scans):
+    cache = ScanCache(str(tmp_path), LABEL_FILE, False, True)
+    data = cache.load('scan_0')
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        points = torch.from_numpy(data['points'])
+    points.zero_()
+    np.testing.assert_array_equal(cache.load('scan_0')['points'], scans['scan_0'][0])
+
+
+def test_pickle_drops_the_memory_map(tmp_path, scans):
+    cache = ScanCache(str(tmp_path), LABEL_FILE, False, True)
+    cache.load('scan_2')
+    copy = pickle.loads(pickle.dumps(cache))
+    assert copy._points is None
+    np.testing.assert_array_equal(copy.load('scan_2')['instances'], scans['scan_2'][1])
+
+
+def test_mismatched_cache(tmp_path, scans):
+    with pytest.raises(RuntimeError):
+        ScanCache(str(tmp_path), 'inseg.ply', False, True)
+    with pytest.raises(RuntimeError):
+        ScanCache(str(tmp_path), LABEL_FILE, True, True)
+    with pytest.raises(RuntimeError):
+        ScanCache(str(tmp_path / 'missing'), LABEL_FILE, False, True)
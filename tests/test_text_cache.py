@@ -0,0 +1,56 @@
+import pytest
+import torch
+
+clip = pytest.importorskip('clip')
+
+from src.model.model_utils.text_cache import TripletTextCache
+from src.utils import op_utils
+
+CLASSES = ['chair', 'table', 'floor']
+RELATIONS = ['none', 'standing on', 'close by']
+
+
+class TokenSum(object):
+    '''an encode_text which depends on every token, and counts the prompts it encodes'''
+    def __init__(self):
+        self.encoded = 0
+
+    def __call__(self, tokens):
+        self.encoded += len(tokens)
+        weights = torch.arange(1, tokens.shape[1] + 1, dtype=torch.float64)
+        return torch.stack([(tokens * weights).sum(1), tokens.sum(1)], dim=1).double()
+
+
+def expected(tris, classNames=CLASSES, relationNames=RELATIONS):
+    prompts = [op_utils.tri_prompt((classNames[s], relationNames[r], classNames[o])) for s, r, o in tris]
+    return TokenSum()(clip.tokenize(prompts))
+
+
+def test_get_and_reload(tmp_path):
+    path = str(tmp_path / 'cache' / 'triplet_text_embeddings.pt')
+    encode = TokenSum()
+    cache = TripletTextCache(path, CLASSES, RELATIONS, 'cpu')
+    tris = [(0, 1, 2), (1, 2, 0), (0, 1, 2)]
+    assert torch.equal(cache.get(tris, encode), expected(tris))
+    assert encode.encoded == 2 and (cache.hits, cache.misses) == (1, 2)
+    assert torch.equal(cache.get(tris[:1], encode), expected(tris[:1]))
+    assert encode.encoded == 2 and (cache.hits, cache.misses) == (2, 2)
+
+    # the file is keyed by prompt: it stays valid for another order of the class and relation lists
+    classNames, relationNames = CLASSES[::-1], RELATIONS[::-1]
+    reloaded = TripletTextCache(path, classNames, relationNames, 'cpu')
+    encode = TokenSum()
+    tris = [(2, 1, 0), (1, 0, 2)]
+    assert torch.equal(reloaded.get(tris, encode), expected(tris, classNames, relationNames))
+    assert encode.encoded == 0
+
+
+def test_add_prompts(tmp_path):
+    path = str(tmp_path / 'triplet_text_embeddings.pt')
+    cache = TripletTextCache(path, CLASSES, RELATIONS, 'cpu')
+    encode = TokenSum()
+    prompts = [op_utils.tri_prompt(('chair', 'close by', 'table')), op_utils.tri_prompt(('floor', 'none', 'chair'))]
+    cache.add_prompts(prompts + prompts[:1], encode, batch_size=1)
+    cache.add_prompts(prompts, encode)
+    assert encode.encoded == 2
+    assert sorted(TripletTextCache(path, CLASSES, RELATIONS, 'cpu').prompts) == sorted(prompts)